@@ -23,7 +23,7 @@ def get_orientation_tuning_protocol():
                                               radii=[400],
                                               drift_frequencies=[2.],
                                               reinforcement_manager=NoReinforcement(),
-                                              iti=1., itl=0.),
+                                              iti=1., itl=0., prefetch=True, bank_stimuli=True),
                         session_manager=NoTimeOff(),
                         criterion=NumTrialsDoneCriterion(num_trials=200,num_trials_mode='consecutive'))
     ts2 = TrainingStep(name='or_decoding_pm45deg_8phases_2Hz_2s_full_and_lo_C',
@@ -35,7 +35,7 @@ def get_orientation_tuning_protocol():
                                               radii=[400],
 											  drift_frequencies=[2.],
 											  reinforcement_manager=NoReinforcement(),
-                                              iti=1., itl=0.),
+                                              iti=1., itl=0., prefetch=True, bank_stimuli=True),
                         session_manager=NoTimeOff(),
                         criterion=NumTrialsDoneCriterion(num_trials=200,num_trials_mode='consecutive'))
     ts3 = TrainingStep(name='short_duration_pm45deg_8phases',
@@ -47,7 +47,7 @@ def get_orientation_tuning_protocol():
 											  phases=[0,0.125,0.25,0.375,0.5,0.625,0.75,0.875],
                                               radii=[400],
                                               reinforcement_manager=NoReinforcement(),
-                                              iti=1., itl=0.),
+                                              iti=1., itl=0., prefetch=True, bank_stimuli=True),
                         session_manager=NoTimeOff(),
                         criterion=RepeatIndefinitely())
     training_steps = [ts1,ts2,ts3]
@@ -112,16 +112,18 @@ def stand_alone_run(subject_id = 'demo1', bserver_path = None, protocol = None,
     # add subject to station
     stn.add_subject(sub)
     print("STANDALONERUN:STAND_ALONE_RUN:Running on Protocol "+stn.subject.protocol.name)
-    # run do_trials on station
-    stn.do_trials()
+    # if we saw any changes to the subject, then copy those changes to the b server and save.
+    # runs on the station's record writer after the compiled records are saved
+    def save_server():
+        if stn.subject._subject_changed:
+            b_server.subjects[sub_idx] = stn.subject
+            b_server.save()
 
-    # if we saw any changes to the subject, then copy those changes to the b server and save
-    sub = stn.subject
-    if sub._subject_changed:
-        b_server.subjects[sub_idx] = sub
-        b_server.save()
+    # run do_trials on station
+    stn.do_trials(on_session_end=save_server)
 
     # clean up at end of trials
+    sub = stn.subject
     stn.remove_subject(sub)
 
 
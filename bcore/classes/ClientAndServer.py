@@ -8,6 +8,7 @@ import zmq
 from verlib import NormalizedVersion as Ver
 from bcore import get_base_path, get_ip_addr, get_time_stamp, DATETIME_TO_STR
 from bcore.classes.Subject import Subject
+from bcore.classes.CompiledRecord import CompiledRecord
 
 __author__ = "Balaji Sriram"
 __version__ = "0.0.1"
@@ -408,9 +409,8 @@ class BServerLocal(object):
 
             cR['LUT'] = []
             cR['compiled_details'] = {}
-            cR_file_name = '{0}.1-0.compiled_records'.format(subject_id)
-            with open(os.path.join(compiled_folder_path, cR_file_name),'wb') as f:
-                pickle.dump(cR, f, pickle.HIGHEST_PROTOCOL)
+            cR_path = os.path.join(compiled_folder_path, '{0}.compiled'.format(subject_id))
+            CompiledRecord(data=cR).save_to_path(cR_path)
 
     def initialize_server(force_delete=False):
         # setup the paths
@@ -0,0 +1,757 @@
+from verlib import NormalizedVersion as Ver
+import numpy as np
+import os
+import io
+import json
+import pickle
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+# fields copied as is from the trial_record. Missing values are marked invalid
+REGULAR_FIELDS = (("session_number", 'int64'),
+                  ("trial_number", 'int64'),
+                  ("station_id", 'int64'),
+                  ("num_ports_in_station", 'int64'),
+                  ("trial_start_time", 'float64'),
+                  ("trial_stop_time", 'float64'),
+                  ("subject_id", 'U64'),
+                  ("current_step", 'int64'),
+                  ("num_steps", 'int64'),
+                  ("criterion_met", 'bool'),
+                  ("graduate", 'bool'),
+                  ("errored_out", 'bool'),
+                  ("manual_quit", 'bool'),
+                  ("correct", 'bool'),)
+
+# fields stored as int codes into the LUT
+LUT_FIELDS = ("station_name",
+              "station_version_number",
+              "subject_version_number",
+              "protocol_name",
+              "protocol_version_number",
+              "current_step_name",
+              "trial_manager_name",
+              "session_manager_name",
+              "criterion_name",
+              "reinforcement_manager_name",
+              "trial_manager_class",
+              "session_manager_class",
+              "criterion_class",
+              "reinforcement_manager_class",
+              "trial_manager_version_number",
+              "session_manager_version_number",
+              "criterion_version_number",
+              "reinforcement_manager_version_number",)
+
+LUT_CODE_DTYPE = 'int32'
+# the LUT is saved in the json header so only these can be interned
+LUT_VALUE_TYPES = (str, int, float, bool, type(None))
+LUT_VALUE_TYPE_NAMES = 'str, int, float, bool or None'
+COMPILED_DTYPES = dict(REGULAR_FIELDS)
+COMPILED_DTYPES.update({field: LUT_CODE_DTYPE for field in LUT_FIELDS})
+
+# on disk a compiled record is a directory with a header and one .npy file
+# per column (plus one for its validity mask). compiled_details for each
+# trial manager class are in the same layout under DETAILS_DIR
+HEADER_FILE = 'header.json'
+DETAILS_DIR = 'compiled_details'
+# compiled_details pickle written by 0.0.3
+DETAILS_FILE = 'compiled_details.pickle'
+# always loaded when loading a window of the history
+WINDOW_FIELDS = ("session_number", "trial_number")
+# a trial's training step. criteria count the trials that share these
+STEP_FIELDS = ("protocol_name", "protocol_version_number", "current_step")
+
+
+def fill_value_for(dtype):
+    """
+        value used in place of None padding for rows that are not valid
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.nan
+    elif dtype.kind in 'iu':
+        return -1
+    elif dtype.kind == 'b':
+        return False
+    elif dtype.kind == 'U':
+        return ''
+    else:
+        return None
+
+
+def infer_dtype(values):
+    """
+        dtype for a column created from a legacy list of values. None is
+        treated as missing
+    """
+    present = [v for v in values if v is not None]
+    if not present:
+        return np.dtype('float64')
+    try:
+        present = np.asarray(present)
+    except ValueError:
+        # ragged lists per trial
+        return np.dtype('O')
+    if present.ndim > 1 or present.dtype.kind == 'O':
+        return np.dtype('O')
+    elif present.dtype.kind in 'SU':
+        return np.dtype('U%d' % max(64, present.dtype.itemsize//4))
+    return present.dtype
+
+
+def fits(dtype, value):
+    """
+        False if value is a string longer than the string dtype can hold
+    """
+    return dtype.kind != 'U' or not isinstance(value, str) or len(value) <= dtype.itemsize//4
+
+
+class LookupTable(object):
+    """
+        LOOKUPTABLE interns values for LUT_FIELDS. Maintains a dict from
+        (type, value) to code and a reverse list from code to value. The
+        type is part of the key so that True, 1 and 1.0 get their own codes.
+            values              : list. values[code] is the value
+        Only values is saved. The dict (index) is rebuilt from it the first
+        time it is needed after a load
+    """
+
+    def __init__(self, values=None):
+        self.values = list(values) if values else []
+        self._index = None
+        self._reverse = None
+
+    def __repr__(self):
+        return "LookupTable object with %d values" % len(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __eq__(self, other):
+        if isinstance(other, LookupTable):
+            return self.values == other.values
+        return self.values == other
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = {}
+            for code, value in enumerate(self.values):
+                self._index.setdefault((type(value), value), code)
+        return self._index
+
+    def intern(self, value):
+        """
+            code for value. value is added to the table if new. The table is
+            saved as json so values must be str, int, float, bool or None
+        """
+        try:
+            return self.index[(type(value), value)]
+        except TypeError:
+            raise TypeError('LOOKUPTABLE:INTERN::%r is not hashable. LUT values must be one of %s' % (value, LUT_VALUE_TYPE_NAMES))
+        except KeyError:
+            if not isinstance(value, LUT_VALUE_TYPES):
+                raise TypeError('LOOKUPTABLE:INTERN::%r cannot be saved. LUT values must be one of %s' % (value, LUT_VALUE_TYPE_NAMES))
+            self.values.append(value)
+            self._index[(type(value), value)] = len(self.values)-1
+            self._reverse = None
+            return len(self.values)-1
+
+    def take(self, codes, invalid=None):
+        """
+            values for an array of codes. negative codes map to invalid
+        """
+        if self._reverse is None:
+            self._reverse = np.empty(len(self.values)+1, dtype=object)
+            self._reverse[:-1] = self.values
+        self._reverse[-1] = invalid
+        codes = np.asarray(codes)
+        return self._reverse.take(np.where(codes < 0, len(self.values), codes))
+
+
+def column_file(path, field):
+    return os.path.join(path, field+'.npy')
+
+
+def valid_file(path, field):
+    return os.path.join(path, field+'.valid.npy')
+
+
+def _replace_file(filename, write):
+    # write to a temporary file and move it into place so that a crash never
+    # leaves a half written file behind
+    with open(filename+'.tmp', 'wb') as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(filename+'.tmp', filename)
+
+
+def _append_to_npy(filename, values, start):
+    """
+        write values as rows start: of the 1d .npy file at filename. The
+        header is rewritten in place with the new shape. returns False if
+        that is not possible and the file needs to be rewritten
+    """
+    if values.dtype.hasobject:
+        return False
+    with open(filename, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        header_len = f.tell()
+        if len(shape) != 1 or dtype != values.dtype or shape[0] < start:
+            return False
+        header = io.BytesIO()
+        d = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (start+len(values),)}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, d)
+        else:
+            np.lib.format.write_array_header_2_0(header, d)
+        if len(header.getvalue()) != header_len:
+            return False
+        f.seek(header_len + start*dtype.itemsize)
+        f.write(np.ascontiguousarray(values).tobytes())
+        f.truncate()
+        f.seek(0)
+        f.write(header.getvalue())
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+
+def _save_npy(filename, values):
+    _replace_file(filename, lambda f: np.save(f, values, allow_pickle=values.dtype.hasobject))
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        return json.load(f)
+
+
+class ColumnStore(object):
+    """
+        COLUMNSTORE holds rows as preallocated numpy columns that grow by
+        doubling, with a validity mask per column in place of None padding.
+        Used for the compiled_record and for the compiled_details of each
+        trial manager class.
+
+        Indexing by field name returns a view of the filled rows.
+    """
+    initial_capacity = 1024
+
+    def __init__(self):
+        self._row_offset = 0
+        self._num_trials = 0
+        self._capacity = 0
+        self._columns = {}
+        self._valid = {}
+
+    def load_from_dict(self, data):
+        num_trials = data['num_trials']
+        self._grow(num_trials)
+        for field, values in data['columns'].items():
+            self.add_column(field, values.dtype)
+            self._columns[field][:num_trials] = values
+            self._valid[field][:num_trials] = data['valid'][field]
+        self._num_trials = num_trials
+        return self
+
+    def load_from_lists(self, data, dtypes=None):
+        """
+            dict of None padded lists as used by older records. dtypes are
+            inferred for fields not in dtypes
+        """
+        num_trials = len(data['trial_number'])
+        self._grow(num_trials)
+        for field, values in data.items():
+            if dtypes and field in dtypes:
+                dtype = dtypes[field]
+            else:
+                dtype = infer_dtype(values)
+            self.add_column(field, dtype)
+            for i, value in enumerate(values):
+                if value is not None:
+                    self._fit(field, value)
+                    self._columns[field][i] = value
+                    self._valid[field][i] = True
+        self._num_trials = num_trials
+        return self
+
+    def save_to_dict(self):
+        n = self._num_trials
+        data = dict()
+        data['num_trials'] = n
+        data['columns'] = {f: self._columns[f][:n].copy() for f in self._columns}
+        data['valid'] = {f: self._valid[f][:n].copy() for f in self._valid}
+        return data
+
+    def load_columns(self, path, header, start=0, columns=None, mmap_mode='r'):
+        """
+            maps rows start: of the columns in the directory at path. header
+            is the one returned by save_columns
+        """
+        num_trials = header['num_trials']
+        for field, dtype in header['columns'].items():
+            if columns is not None and field not in columns:
+                continue
+            if np.dtype(dtype).hasobject:
+                values = np.load(column_file(path, field), allow_pickle=True)
+            else:
+                values = np.load(column_file(path, field), mmap_mode=mmap_mode)
+            self._columns[field] = values[start:num_trials]
+            self._valid[field] = np.load(valid_file(path, field), mmap_mode=mmap_mode)[start:num_trials]
+        self._row_offset = start
+        self._num_trials = num_trials-start
+        self._capacity = num_trials-start
+        return self
+
+    def save_columns(self, path, header=None):
+        """
+            saves to the directory at path, whose current contents are
+            described by header. Only rows not already in path are written.
+            columns are appended to in place. returns the new header
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        if header is None:
+            header = {'num_trials': 0, 'columns': {}}
+        num_saved = header['num_trials']
+        n = self._num_trials
+        total = self._row_offset+n
+        if num_saved > total or num_saved < self._row_offset:
+            raise ValueError('COLUMNSTORE:SAVE_COLUMNS::%s has %d trials. cannot save trials %d-%d to it' % (path, num_saved, self._row_offset, total))
+        # first row in memory that is not on disk
+        first = num_saved-self._row_offset
+
+        columns = {}
+        for field in set(header['columns']) | set(self._columns):
+            on_disk = field in header['columns']
+            if field in self._columns:
+                values = self._columns[field][first:n]
+                valid = self._valid[field][first:n]
+            else:
+                # column saved earlier and not loaded or not available now
+                dtype = np.dtype(header['columns'][field])
+                values = np.full(n-first, fill_value_for(dtype), dtype=dtype)
+                valid = np.zeros(n-first, dtype=bool)
+            dtype = values.dtype
+            appended = False
+            if on_disk and np.dtype(header['columns'][field]) == dtype:
+                appended = _append_to_npy(column_file(path, field), values, num_saved) and \
+                           _append_to_npy(valid_file(path, field), valid, num_saved)
+            if not appended:
+                # rewrite the whole column. rows saved earlier come from disk
+                if on_disk:
+                    dtype = np.result_type(np.dtype(header['columns'][field]), dtype)
+                all_values = np.full(total, fill_value_for(dtype), dtype=dtype)
+                all_valid = np.zeros(total, dtype=bool)
+                if on_disk:
+                    all_values[:num_saved] = np.load(column_file(path, field), allow_pickle=True)[:num_saved]
+                    all_valid[:num_saved] = np.load(valid_file(path, field))[:num_saved]
+                all_values[num_saved:] = values
+                all_valid[num_saved:] = valid
+                _save_npy(column_file(path, field), all_values)
+                _save_npy(valid_file(path, field), all_valid)
+            columns[field] = np.lib.format.dtype_to_descr(dtype)
+        return {'num_trials': total, 'columns': columns}
+
+    @property
+    def row_offset(self):
+        """
+            number of rows before the first row held here
+        """
+        return self._row_offset
+
+    def __repr__(self):
+        return "ColumnStore object with %d rows and %d fields" % (self._num_trials, len(self._columns))
+
+    def __len__(self):
+        return self._num_trials
+
+    def __contains__(self, field):
+        return field in self._columns
+
+    def __getitem__(self, field):
+        return self._columns[field][:self._num_trials]
+
+    def keys(self):
+        return list(self._columns.keys())
+
+    def is_valid(self, field):
+        """
+            boolean mask of rows where field was available
+        """
+        return self._valid[field][:self._num_trials]
+
+    def add_column(self, field, dtype):
+        if field in self._columns:
+            return
+        dtype = np.dtype(dtype)
+        self._columns[field] = np.full(self._capacity, fill_value_for(dtype), dtype=dtype)
+        self._valid[field] = np.zeros(self._capacity, dtype=bool)
+
+    def _fit(self, field, value):
+        # string columns are widened for longer values instead of truncating
+        # them. numeric columns are promoted for values they cannot hold, so
+        # an int column becomes a float column for a float value
+        column = self._columns[field]
+        if not fits(column.dtype, value):
+            self._columns[field] = column.astype('U%d' % len(value))
+        elif column.dtype.kind in 'biuf':
+            value_dtype = np.min_scalar_type(value)
+            if np.can_cast(value_dtype, column.dtype, casting='safe'):
+                return
+            if column.dtype.kind in 'iu' and value_dtype.kind in 'iu' and np.iinfo(column.dtype).min <= value <= np.iinfo(column.dtype).max:
+                return
+            if value_dtype.kind not in 'biuf':
+                raise ValueError('COLUMNSTORE:_FIT::%r cannot be stored in %s column %s' % (value, column.dtype, field))
+            dtype = np.result_type(column.dtype, np.int64 if value_dtype.kind in 'biu' else np.float64)
+            column = column.astype(dtype)
+            column[~self._valid[field]] = fill_value_for(dtype)
+            self._columns[field] = column
+
+    def _grow(self, min_capacity):
+        if min_capacity <= self._capacity:
+            return
+        capacity = max(self._capacity, self.initial_capacity)
+        while capacity < min_capacity:
+            capacity *= 2
+        for field in self._columns:
+            column = self._columns[field]
+            new_column = np.full(capacity, fill_value_for(column.dtype), dtype=column.dtype)
+            new_column[:self._num_trials] = column[:self._num_trials]
+            self._columns[field] = new_column
+            new_valid = np.zeros(capacity, dtype=bool)
+            new_valid[:self._num_trials] = self._valid[field][:self._num_trials]
+            self._valid[field] = new_valid
+        self._capacity = capacity
+
+    def append(self, row, dtypes=None):
+        """
+            append a single trial. row is a dict of field -> value. Fields
+            missing from row (or set to None) are marked invalid. New fields
+            are added as columns with all earlier rows invalid. String
+            columns are widened to hold longer values and numeric columns
+            are promoted to hold values of a wider type
+        """
+        idx = self._num_trials
+        self._grow(idx+1)
+        for field, value in row.items():
+            if value is None:
+                continue
+            if field not in self._columns:
+                if dtypes and field in dtypes:
+                    self.add_column(field, dtypes[field])
+                else:
+                    self.add_column(field, infer_dtype([value]))
+            self._fit(field, value)
+        # written once every value fits so that a value that does not leaves no partial row
+        for field, value in row.items():
+            if value is None:
+                continue
+            self._columns[field][idx] = value
+            self._valid[field][idx] = True
+        self._num_trials = idx+1
+        return idx
+
+
+class CompiledRecord(ColumnStore):
+    """
+        COMPILEDRECORD is a columnar store for the history of trial_records
+        for a subject. Each field is a preallocated numpy column that grows
+        by doubling, with a validity mask replacing the old None padding.
+        LUT_FIELDS are stored as int codes into the LUT.
+
+        Indexing by field name returns a view of the filled rows, so
+        compiled_record['trial_number'][-1] and friends work as before.
+        Fields of the schema that no trial had yet index as invalid rows.
+            LUT                 : LookupTable of values referenced by LUT_FIELDS
+            compiled_details    : dict of trial manager class name ->
+                                  ColumnStore. see register_details_schema
+
+        VERSION HISTORY:
+        0.0.1: columnar store replacing dict of lists
+        0.0.2: LUT is an interning LookupTable. index saved with the record
+        0.0.3: saved as a directory of .npy columns. see save_to_path
+        0.0.4: compiled_details are ColumnStores saved as .npy columns
+        0.0.5: the LUT index is not saved. it is rebuilt from the LUT on load
+        0.0.6: LUT values are keyed by type. numeric columns are promoted
+               for wider values
+    """
+    compiledrecord_version = Ver('0.0.6')
+
+    def __init__(self, **kwargs):
+        super(CompiledRecord, self).__init__()
+        self.LUT = LookupTable()
+        self.compiled_details = {}
+        if not kwargs:
+            pass
+        elif 'data' in kwargs:
+            self = self.load_from_dict(kwargs['data'])
+        else:
+            pass
+
+    def load_from_dict(self, data):
+        if 'compiledrecord_version' not in data:
+            return self._load_from_legacy_dict(data)
+        super(CompiledRecord, self).load_from_dict(data)
+        # LUT_index saved by 0.0.2-0.0.4 is ignored. it is rebuilt from the LUT
+        self.LUT = LookupTable(values=data['LUT'])
+        self.compiled_details = details_from_legacy(data['compiled_details'])
+        return self
+
+    def _load_from_legacy_dict(self, data):
+        # dict of None padded lists as created by BServerLocal and older stations
+        dtypes = dict(REGULAR_FIELDS)
+        dtypes.update({field: LUT_CODE_DTYPE for field in LUT_FIELDS})
+        self.load_from_lists({f: v for f, v in data.items() if f not in ['LUT', 'compiled_details']}, dtypes=dtypes)
+        self.LUT = LookupTable(values=data.get('LUT', []))
+        self.compiled_details = details_from_legacy(data.get('compiled_details', {}))
+        return self
+
+    def save_to_dict(self):
+        data = super(CompiledRecord, self).save_to_dict()
+        data['compiledrecord_version'] = self.compiledrecord_version.__str__()
+        data['LUT'] = list(self.LUT.values)
+        data['compiled_details'] = {name: details.save_to_dict() for name, details in self.compiled_details.items()}
+        return data
+
+    def load_from_path(self, path, mmap_mode='r', last_n=None, since_session=None, columns=None):
+        """
+            maps the columns saved by save_to_path. Nothing is read until it
+            is accessed and columns are copied to memory on the first append.
+            A window of the history can be requested with
+                last_n          : only the last last_n trials
+                since_session   : only trials from session since_session on
+                columns         : only these columns. session_number and
+                                  trial_number are always loaded
+            rows and columns outside the window are left untouched on save.
+            compiled_details are windowed to the same trials
+        """
+        header = read_header(path)
+        num_trials = header['num_trials']
+        start = 0
+        if since_session is not None:
+            session_number = np.load(column_file(path, 'session_number'), mmap_mode=mmap_mode)[:num_trials]
+            start = int(np.searchsorted(session_number, since_session, side='left'))
+        if last_n is not None:
+            start = max(start, num_trials-last_n)
+        if columns is not None:
+            columns = set(columns) | set(WINDOW_FIELDS)
+        self.load_columns(path, header, start=start, columns=columns, mmap_mode=mmap_mode)
+        self.LUT = LookupTable(values=header['LUT'])
+
+        if 'compiled_details' not in header:
+            # records saved before compiled_details were columnar
+            with open(os.path.join(path, DETAILS_FILE), 'rb') as f:
+                self.compiled_details = details_from_legacy(pickle.load(f))
+            return self
+        first_trial = self['trial_number'][0] if len(self) else None
+        self.compiled_details = {}
+        for name, details_header in header['compiled_details'].items():
+            details_path = os.path.join(path, DETAILS_DIR, name)
+            details_start = 0
+            if start and first_trial is not None:
+                trial_number = np.load(column_file(details_path, 'trial_number'), mmap_mode=mmap_mode)[:details_header['num_trials']]
+                details_start = int(np.searchsorted(trial_number, first_trial, side='left'))
+            self.compiled_details[name] = ColumnStore().load_columns(details_path, details_header, start=details_start, mmap_mode=mmap_mode)
+        return self
+
+    def save_to_path(self, path):
+        """
+            saves to the directory at path. Only rows not already in path are
+            written. columns are appended to in place
+        """
+        if os.path.exists(os.path.join(path, HEADER_FILE)):
+            header = read_header(path)
+        else:
+            header = {'num_trials': 0, 'columns': {}}
+        saved_details = header.get('compiled_details', {})
+
+        new_header = self.save_columns(path, header)
+        new_header['compiledrecord_version'] = self.compiledrecord_version.__str__()
+        new_header['LUT'] = list(self.LUT.values)
+        new_header['compiled_details'] = {}
+        for name, details in self.compiled_details.items():
+            new_header['compiled_details'][name] = details.save_columns(os.path.join(path, DETAILS_DIR, name), saved_details.get(name, None))
+        for name in saved_details:
+            if name not in new_header['compiled_details']:
+                new_header['compiled_details'][name] = saved_details[name]
+        # the header is written last. Rows past num_trials are ignored on load
+        _replace_file(os.path.join(path, HEADER_FILE), lambda f: f.write(json.dumps(new_header).encode()))
+        if os.path.exists(os.path.join(path, DETAILS_FILE)):
+            os.remove(os.path.join(path, DETAILS_FILE))
+
+    def __repr__(self):
+        return "CompiledRecord object with %d trials and %d fields" % (self._num_trials, len(self._columns))
+
+    def __contains__(self, field):
+        return field in self._columns or field in ['LUT', 'compiled_details']
+
+    def __getitem__(self, field):
+        if field == 'LUT':
+            return self.LUT
+        elif field == 'compiled_details':
+            return self.compiled_details
+        elif field not in self._columns and field in COMPILED_DTYPES:
+            # no trial had a value for field yet. all rows are invalid
+            dtype = np.dtype(COMPILED_DTYPES[field])
+            return np.full(self._num_trials, fill_value_for(dtype), dtype=dtype)
+        return self._columns[field][:self._num_trials]
+
+    def __setitem__(self, field, value):
+        if field == 'LUT':
+            self.LUT = value if isinstance(value, LookupTable) else LookupTable(values=value)
+        elif field == 'compiled_details':
+            self.compiled_details = value
+        else:
+            raise KeyError('COMPILEDRECORD:__SETITEM__::columns are only set through append(). Cannot set %s' % field)
+
+    def is_valid(self, field):
+        if field not in self._columns and field in COMPILED_DTYPES:
+            return np.zeros(self._num_trials, dtype=bool)
+        return super(CompiledRecord, self).is_valid(field)
+
+    def decode(self, field):
+        """
+            values of a LUT_FIELD decoded through the LUT. invalid rows are None
+        """
+        codes = np.where(self.is_valid(field), self[field], -1)
+        return self.LUT.take(codes)
+
+
+def details_from_legacy(compiled_details):
+    """
+        dict of trial manager class name -> ColumnStore from compiled_details
+        saved by older versions as dicts of lists
+    """
+    if 'trial_number' in compiled_details and isinstance(compiled_details['trial_number'], list):
+        # older trial_compilers replaced compiled_details with their own dict
+        compiled_details = {'Unknown': compiled_details}
+    details = {}
+    for name, value in compiled_details.items():
+        if isinstance(value, ColumnStore):
+            details[name] = value
+        elif isinstance(value, dict) and 'num_trials' in value:
+            details[name] = ColumnStore().load_from_dict(value)
+        elif isinstance(value, dict) and 'trial_number' in value:
+            num_trials = len(value['trial_number'])
+            value = {f: v for f, v in value.items() if isinstance(v, list) and len(v) == num_trials}
+            details[name] = ColumnStore().load_from_lists(value, dtypes={'trial_number': 'int64'})
+        else:
+            print('COMPILEDRECORD:DETAILS_FROM_LEGACY::Ignoring compiled_details for %s' % name)
+    return details
+
+
+class DetailsSchema(object):
+    """
+        DETAILSSCHEMA describes the compiled_details columns of a trial
+        manager class. columns is a tuple of (name, dtype, source). source is
+        a dotted path into the trial_record ('chosen_stim.location.0') or a
+        function(trial_record) -> value. Values that are not available are
+        marked invalid. trial_number is always compiled
+    """
+
+    def __init__(self, columns):
+        self.columns = tuple(columns)
+        self.dtypes = {'trial_number': np.dtype('int64')}
+        self._getters = []
+        for name, dtype, source in self.columns:
+            self.dtypes[name] = np.dtype(dtype)
+            self._getters.append((name, source if callable(source) else _path_getter(source)))
+
+    def __repr__(self):
+        return "DetailsSchema object with %d columns" % len(self.columns)
+
+    def row(self, trial_record):
+        row = {'trial_number': trial_record.get('trial_number', None)}
+        for name, getter in self._getters:
+            row[name] = getter(trial_record)
+        return row
+
+
+def _path_getter(source):
+    path = tuple(int(p) if p.isdigit() else p for p in source.split('.'))
+
+    def getter(trial_record):
+        value = trial_record
+        try:
+            for p in path:
+                value = value[p]
+        except (KeyError, IndexError, TypeError):
+            return None
+        return value
+    return getter
+
+
+# trial manager class name -> DetailsSchema
+DETAILS_SCHEMAS = {}
+
+
+def register_details_schema(name, columns):
+    """
+        declare the compiled_details columns for trial manager class name.
+        see DetailsSchema
+    """
+    DETAILS_SCHEMAS[name] = DetailsSchema(columns)
+    return DETAILS_SCHEMAS[name]
+
+
+def compile_details(compiled_record, trial_record):
+    """
+        append the compiled_details for the trial manager that ran the trial
+    """
+    name = trial_record.get('trial_manager_class', None)
+    schema = DETAILS_SCHEMAS.get(name, None)
+    if schema is None:
+        return compiled_record
+    if name not in compiled_record.compiled_details:
+        compiled_record.compiled_details[name] = ColumnStore()
+    details = compiled_record.compiled_details[name]
+    # every column in the schema exists even if it was never available
+    for field, dtype in schema.dtypes.items():
+        details.add_column(field, dtype)
+    details.append(schema.row(trial_record), dtypes=schema.dtypes)
+    return compiled_record
+
+
+def window_starts_in_step(compiled_record):
+    """
+        True if compiled_record is a window of the history (loaded with
+        last_n or since_session) whose first trial is in the training step
+        of its last trial. Trials of that step before the window are missing
+    """
+    if compiled_record is None or compiled_record.row_offset == 0 or not len(compiled_record):
+        return False
+    return all(compiled_record[field][0] == compiled_record[field][-1] for field in STEP_FIELDS)
+
+
+def compile_records(compiled_record, trial_record):
+    row = {}
+    for field, dtype in REGULAR_FIELDS:
+        row[field] = trial_record.get(field, None)
+
+    for field in LUT_FIELDS:
+        value = trial_record.get(field, 'NotAvailable')
+        row[field] = compiled_record.LUT.intern(value)
+
+    compiled_record.append(row, dtypes=COMPILED_DTYPES)
+    compiled_record = compile_details(compiled_record, trial_record)
+
+    return compiled_record
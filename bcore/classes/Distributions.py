@@ -0,0 +1,212 @@
+"""
+    Distributions of delays and latencies. Each draws n values at a time from
+    a numpy Generator so that trial managers can draw a session's worth up
+    front (see Presampler) instead of one value per trial. from_spec makes
+    them from the ('Name', params) tuples used by trial manager params.
+"""
+import numpy as np
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+class Distribution(object):
+    """
+        DISTRIBUTION is the base of the distributions. Subclasses implement
+        _sample(n, rng). Values below low or above high are redrawn.
+            low                 : smallest value kept. None for no bound
+            high                : largest value kept. None for no bound
+            reflect             : return absolute values (before truncation)
+    """
+    MAX_REDRAWS = 100
+
+    def __init__(self, low=None, high=None, reflect=False):
+        self.low = low
+        self.high = high
+        self.reflect = reflect
+
+    def _sample(self, n, rng):
+        raise NotImplementedError()
+
+    def _outside(self, values):
+        outside = np.zeros(values.shape, dtype=bool)
+        if self.low is not None: outside |= values<self.low
+        if self.high is not None: outside |= values>self.high
+        return outside
+
+    def _draw(self, n, rng):
+        values = np.asarray(self._sample(n, rng), dtype='float64')
+        return np.abs(values) if self.reflect else values
+
+    def sample(self, n, rng=None):
+        """
+            n values as a float64 array. rng is a numpy Generator
+        """
+        rng = rng if rng is not None else np.random.default_rng()
+        values = self._draw(n, rng)
+        if self.low is None and self.high is None:
+            return values
+        for i in range(self.MAX_REDRAWS):
+            outside = self._outside(values)
+            num_outside = np.count_nonzero(outside)
+            if not num_outside:
+                return values
+            values[outside] = self._draw(num_outside, rng)
+        raise ValueError('DISTRIBUTION:SAMPLE::too little of %r is between %s and %s' % (self, self.low, self.high))
+
+
+class Constant(Distribution):
+    """
+        CONSTANT is always val
+    """
+
+    def __init__(self, val, **kwargs):
+        super(Constant, self).__init__(**kwargs)
+        self.val = val
+
+    def __repr__(self):
+        return "Constant distribution at %s" % (self.val,)
+
+    def _sample(self, n, rng):
+        return np.full(n, self.val, dtype='float64')
+
+
+class Uniform(Distribution):
+    """
+        UNIFORM between lo and hi
+    """
+
+    def __init__(self, lo, hi, **kwargs):
+        super(Uniform, self).__init__(**kwargs)
+        self.lo = lo
+        self.hi = hi
+
+    def __repr__(self):
+        return "Uniform distribution between %s and %s" % (self.lo, self.hi)
+
+    def _sample(self, n, rng):
+        return rng.uniform(low=self.lo, high=self.hi, size=n)
+
+
+class Gaussian(Distribution):
+    """
+        GAUSSIAN with mean mu and standard deviation sd
+    """
+
+    def __init__(self, mu, sd, **kwargs):
+        super(Gaussian, self).__init__(**kwargs)
+        self.mu = mu
+        self.sd = sd
+
+    def __repr__(self):
+        return "Gaussian distribution with mean %s and sd %s" % (self.mu, self.sd)
+
+    def _sample(self, n, rng):
+        return rng.normal(loc=self.mu, scale=self.sd, size=n)
+
+
+class Exponential(Distribution):
+    """
+        EXPONENTIAL with mean scale shifted by fixed
+    """
+
+    def __init__(self, scale, fixed=0., **kwargs):
+        super(Exponential, self).__init__(**kwargs)
+        self.scale = scale
+        self.fixed = fixed
+
+    def __repr__(self):
+        return "Exponential distribution with mean %s after %s" % (self.scale, self.fixed)
+
+    def _sample(self, n, rng):
+        return self.fixed+rng.exponential(self.scale, size=n)
+
+
+class FlatHazard(Exponential):
+    """
+        FLATHAZARD is a fixed delay followed by an exponential delay whose
+        pctile percentile is val, so that the event is as likely at any time
+        after fixed. Values above max are set to max
+    """
+
+    def __init__(self, pctile, val, fixed, max, **kwargs):
+        super(FlatHazard, self).__init__(scale=-val/np.log(1-pctile), fixed=fixed, **kwargs)
+        self.pctile = pctile
+        self.val = val
+        self.max = max
+
+    def __repr__(self):
+        return "FlatHazard distribution with %s percentile at %s after %s" % (self.pctile, self.val, self.fixed)
+
+    def _sample(self, n, rng):
+        return np.minimum(super(FlatHazard, self)._sample(n, rng), self.max)
+
+
+DISTRIBUTIONS = {'Constant': Constant, 'Uniform': Uniform, 'Gaussian': Gaussian, 'Exponential': Exponential, 'FlatHazard': FlatHazard}
+
+
+def from_spec(spec, **kwargs):
+    """
+        Distribution for a ('Constant',val), ('Uniform',[lo,hi]),
+        ('Gaussian',[mu,sd]), ('Exponential',[scale,fixed]) or
+        ('FlatHazard',[pctile,val,fixed,max]) spec. Uniform and Gaussian
+        reflect negative values unless reflect is given. Distributions
+        are returned as they are
+    """
+    if isinstance(spec, Distribution):
+        return spec
+    name, params = spec
+    if name not in DISTRIBUTIONS:
+        raise ValueError('DISTRIBUTIONS:FROM_SPEC::unknown distribution %s' % (name,))
+    if name in ('Uniform', 'Gaussian'):
+        kwargs.setdefault('reflect', True)
+    if name=='Constant':
+        return Constant(params, **kwargs)
+    return DISTRIBUTIONS[name](*params, **kwargs)
+
+
+class Presampler(object):
+    """
+        PRESAMPLER hands out values of a distribution one at a time from
+        batches of batch_size drawn with a seeded Generator. Another batch
+        is drawn when one runs out, so the values only depend on the seed.
+            distribution        : Distribution or spec (see from_spec)
+            seed                : seed of the Generator. a new one is drawn
+                                  if None
+            batch_size          : values drawn at a time
+    """
+
+    def __init__(self, distribution, seed=None, batch_size=1000):
+        self.distribution = from_spec(distribution)
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.batch_size = batch_size
+        self._rng = np.random.default_rng(self.seed)
+        self._values = []
+
+    def __repr__(self):
+        return "Presampler object with %d values of %r left" % (len(self._values), self.distribution)
+
+    def pop(self):
+        """
+            next value (float)
+        """
+        if not self._values:
+            # reversed so that list.pop() hands them out in the order they were drawn
+            self._values = self.distribution.sample(self.batch_size, self._rng)[::-1].tolist()
+        return self._values.pop()
+
+    def get_state(self):
+        """
+            position in the values. set_state goes back to it
+        """
+        return (self._rng.bit_generator.state, list(self._values))
+
+    def set_state(self, state):
+        rng_state, values = state
+        self._rng.bit_generator.state = rng_state
+        self._values = list(values)
@@ -0,0 +1,131 @@
+import threading
+import time
+import collections
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+class PortSampler(object):
+    """
+        PORTSAMPLER reads the response ports on a background thread at a fixed
+        rate and queues timestamped edges so that response times do not
+        depend on the frame rate and licks shorter than a frame are not lost.
+        The queue is a deque (appends and pops are atomic) and the current
+        state is replaced, never mutated, so the drawing thread takes no locks.
+            read_ports          : function() -> list of active ports. called
+                                  only on the sampler thread
+            clock               : function() -> time stamped on every edge
+            rate                : samples per second
+        Events are (time, port, is_rising). Errors on the sampler thread are
+        raised on the next drain or stop. The drawing thread sees the ports
+        as of the events it drained (drained_active), never a later sample.
+    """
+
+    def __init__(self, read_ports, clock, rate=1000.):
+        self.read_ports = read_ports
+        self.clock = clock
+        self.rate = rate
+        self._events = collections.deque()
+        self._active = frozenset()
+        self._drained_active = frozenset()
+        self._error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __repr__(self):
+        return "PortSampler object at %s Hz with %d events waiting" % (self.rate, len(self._events))
+
+    @property
+    def active(self):
+        """
+            ports active at the last sample
+        """
+        return self._active
+
+    @property
+    def drained_active(self):
+        """
+            ports active after the last drained event
+        """
+        return self._drained_active
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='PortSampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('PORTSAMPLER:_RAISE_ERROR::Sampling ports failed') from error
+
+    def drain(self):
+        """
+            list of events since the last drain, oldest first
+        """
+        self._raise_error()
+        events = []
+        while True:
+            try:
+                events.append(self._events.popleft())
+            except IndexError:
+                break
+        if events:
+            active = set(self._drained_active)
+            for t, port, is_rising in events:
+                if is_rising:
+                    active.add(port)
+                else:
+                    active.discard(port)
+            self._drained_active = frozenset(active)
+        return events
+
+    def responses(self, events):
+        """
+            ports with a rising edge in events (drained last). If there are
+            none, the ports held as of the drain. A lick on one port while
+            another is held is one response
+        """
+        responses = []
+        for t, port, is_rising in events:
+            if is_rising and port not in responses:
+                responses.append(port)
+        return responses if responses else list(self._drained_active)
+
+    def _run(self):
+        period = 1./self.rate
+        next_sample = time.perf_counter()
+        previous = frozenset()
+        try:
+            while not self._stop.is_set():
+                current = frozenset(self.read_ports())
+                if current != previous:
+                    t = self.clock()
+                    for port in current-previous:
+                        self._events.append((t, port, True))
+                    for port in previous-current:
+                        self._events.append((t, port, False))
+                    self._active = current
+                    previous = current
+                next_sample += period
+                delay = next_sample-time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # fell behind. do not try to catch up with a burst of samples
+                    next_sample = time.perf_counter()
+        except Exception as e:
+            self._error = e
@@ -125,6 +125,10 @@ class SimpleProtocol(Protocol):
         return "SimpleProtocol object, currently at %s of %s steps" % (self.current_step+1,self.num_steps)
 
     def change_to_step(self, step_num):
+        # anything prefetched by the current step is for a trial it will not run
+        trial_manager = self.training_steps[self.current_step].trial_manager
+        if hasattr(trial_manager, 'cancel_prefetch'):
+            trial_manager.cancel_prefetch()
         self.current_step = step_num
 
     def step(self, **kwargs):
@@ -0,0 +1,108 @@
+import threading
+import queue
+import time
+from bcore.classes.SessionLog import trial_key
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+_STOP = object()
+
+
+class RecordWriter(object):
+    """
+        RECORDWRITER moves record I/O off the thread that draws frames. A
+        background thread takes finished trial records and checkpoints from a
+        bounded queue, writes them in order and fsyncs the session log in
+        batches.
+            session_log         : SessionLogWriter that trial records go to
+            max_queue           : put_* blocks when this many items are waiting
+            batch_size          : fsync after this many trial records
+            batch_interval      : or when this many seconds have passed since
+                                  the last fsync
+        Errors on the writer thread are raised on the next put_* or close.
+    """
+
+    def __init__(self, session_log, max_queue=64, batch_size=10, batch_interval=5.):
+        self.session_log = session_log
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='RecordWriter', daemon=True)
+        self._thread.start()
+
+    def __repr__(self):
+        return "RecordWriter object for %s with %d items waiting" % (self.session_log.path, self._queue.qsize())
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError('RECORDWRITER:_RAISE_ERROR::Writing records failed') from error
+
+    def put_trial(self, trial_record):
+        """
+            queue a finished trial_record for the session log. The record is
+            serialized here so that later changes to it are not written
+        """
+        self._raise_error()
+        self._queue.put(('trial', (self.session_log.dump(trial_record), trial_key(trial_record))))
+
+    def put_checkpoint(self, func, *args, **kwargs):
+        """
+            run func(*args, **kwargs) on the writer thread after the records
+            queued so far are written
+        """
+        self._raise_error()
+        self._queue.put(('checkpoint', (func, args, kwargs)))
+
+    def flush(self):
+        """
+            block until everything queued has been written and synced
+        """
+        self._queue.put(('sync', None))
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.session_log.close()
+        self._raise_error()
+
+    def _run(self):
+        pending = 0
+        last_sync = time.time()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.batch_interval)
+            except queue.Empty:
+                item = None
+            try:
+                if item is _STOP:
+                    return
+                elif item is not None:
+                    kind, value = item
+                    if kind == 'trial':
+                        payload, key = value
+                        self.session_log.append_payload(payload, key=key)
+                        pending += 1
+                    elif kind == 'checkpoint':
+                        func, args, kwargs = value
+                        func(*args, **kwargs)
+                if pending and (pending >= self.batch_size or item is None or item[0] == 'sync' or
+                                time.time()-last_sync >= self.batch_interval):
+                    self.session_log.sync()
+                    pending = 0
+                    last_sync = time.time()
+            except Exception as e:
+                self._error = e
+            finally:
+                if item is not None:
+                    self._queue.task_done()
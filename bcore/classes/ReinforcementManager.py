@@ -33,6 +33,11 @@ class ReinforcementManager(object):
         data['name'] = self.name
         return data
 
+    @property
+    def ver(self):
+        # logged with every trial as reinforcement_manager_version_number
+        return self.reinfmgr_version
+
     def __repr__(self):
         return "ReinforcementManager object with name:%s" % self.name
 
@@ -58,6 +63,10 @@ class NoReinforcement(ReinforcementManager):
         data['noreinforcement_version'] = self.noreinforcement_version.__str__()
         return data
 
+    @property
+    def ver(self):
+        return self.noreinforcement_version
+
     def __repr__(self):
         return "NoReinforcement object"
 
@@ -85,7 +94,7 @@ class ConstantReinforcement(ReinforcementManager):
     fraction_penalty_sound_is_on = None
     request_mode = ''
 
-    def __init__(self, , **kwargs):
+    def __init__(self, **kwargs):
         super(ConstantReinforcement,self).__init__(**kwargs)
         if not kwargs:
             pass
@@ -115,6 +124,10 @@ class ConstantReinforcement(ReinforcementManager):
         data['request_mode'] = self.request_mode
         return data
 
+    @property
+    def ver(self):
+        return self.constantreinf_version
+
     def __repr__(self):
         return "ConstantReinforcement object"
 
@@ -154,6 +167,10 @@ class RandomReinforcement(ConstantReinforcement):
         data['probability'] = self.probability
         return data
 
+    @property
+    def ver(self):
+        return self.randomreinf_version
+
     def __repr__(self):
         return "RandomReinforcement object"
 
@@ -190,6 +207,10 @@ class RewardNCorrectInARow(ReinforcementManager):
         data['n_correct'] = self.n_correct
         return data
 
+    @property
+    def ver(self):
+        return self.rewardncorrect_version
+
     def __repr__(self):
         return "RewardNCorrectInARow object"
 
@@ -0,0 +1,194 @@
+"""
+    Response policies script the behavior of a VirtualSubject on a
+    SimulatedStation. The station tells the policy when a phase starts and
+    asks it which ports are active every time read_ports is called. Times are
+    on the trial clock.
+"""
+import numpy as np
+from bcore.classes.TrialManagers.PhaseSpec import do_nothing
+from bcore.classes.Distributions import from_spec
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+def response_ports(phase, phases):
+    """
+        (correct ports, incorrect ports) for phase. ports leading to a
+        PunishmentPhaseSpec are incorrect. all other ports with a transition
+        are correct
+    """
+    correct = []
+    incorrect = []
+    for port, target in (phase.transitions or {}).items():
+        if port == do_nothing or target is None:
+            continue
+        if phases[target].__class__.__name__ == 'PunishmentPhaseSpec':
+            incorrect.append(port)
+        else:
+            correct.append(port)
+    return correct, incorrect
+
+
+def contrast_psychometric(c50=0.1, n=2., guess=0.5, lapse=0.05):
+    """
+        p_correct function of trial_record['chosen_stim']['contrast'] (Naka-Rushton)
+    """
+    def p_correct(trial_record):
+        c = trial_record['chosen_stim']['contrast']
+        return guess+(1.-guess-lapse)*c**n/(c**n+c50**n)
+    return p_correct
+
+
+class ResponsePolicy(object):
+    """
+        RESPONSEPOLICY is the base for scripted responses. Subclasses schedule
+        licks with lick() from start_phase() and/or read_ports(). A lick keeps
+        its port active for lick_duration seconds.
+            lick_duration       : seconds a port stays active per lick
+            seed                : seed for the random number generator
+    """
+
+    def __init__(self, lick_duration=0.05, seed=None):
+        self.lick_duration = lick_duration
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._licks = [] # (port, start, stop)
+        self._last_t = 0.
+
+    def __repr__(self):
+        return "%s object" % self.__class__.__name__
+
+    def _check_clock(self, t):
+        # the trial clock is reset every trial. forget licks from the previous trial
+        if t < self._last_t:
+            self._licks = []
+        self._last_t = t
+
+    def lick(self, port, t, duration=None):
+        """
+            make port active from t for duration (lick_duration by default)
+        """
+        if duration is None:
+            duration = self.lick_duration
+        self._licks.append((port, t, t+duration))
+
+    def start_phase(self, phase, phases, ports, trial_record, t):
+        """
+            called by the station when phase starts at t. licks that have
+            not started yet are dropped
+        """
+        self._check_clock(t)
+        self._licks = [l for l in self._licks if l[1] <= t]
+
+    def read_ports(self, t):
+        """
+            ports active at t
+        """
+        self._check_clock(t)
+        self._licks = [l for l in self._licks if l[2] > t]
+        return [port for port, start, stop in self._licks if start <= t]
+
+
+class NoResponse(ResponsePolicy):
+    """
+        NORESPONSE never responds
+    """
+
+    def read_ports(self, t):
+        return []
+
+
+class RandomLicking(ResponsePolicy):
+    """
+        RANDOMLICKING licks a random port at random times (Poisson process)
+        independent of the task.
+            rate                : licks per second
+            ports               : ports licked. all station ports if None
+    """
+
+    def __init__(self, rate=1., ports=None, **kwargs):
+        super(RandomLicking, self).__init__(**kwargs)
+        self.rate = rate
+        self.ports = ports
+        self._next_lick = None
+        self._ports = ports
+
+    def start_phase(self, phase, phases, ports, trial_record, t):
+        self._check_clock(t)
+        if self.ports is None:
+            self._ports = list(ports)
+        if self._next_lick is None or self._next_lick < t:
+            self._next_lick = t+self._rng.exponential(1./self.rate)
+
+    def read_ports(self, t):
+        if t < self._last_t:
+            self._next_lick = t+self._rng.exponential(1./self.rate)
+        while self._next_lick is not None and self._next_lick <= t and self._ports:
+            self.lick(self._ports[self._rng.integers(len(self._ports))], self._next_lick)
+            self._next_lick += self._rng.exponential(1./self.rate)
+        return super(RandomLicking, self).read_ports(t)
+
+
+class LatencyResponder(ResponsePolicy):
+    """
+        LATENCYRESPONDER licks once in every phase that has port transitions.
+        The lick comes latency seconds into the phase. It goes to a correct
+        port with probability p_correct and to an incorrect port otherwise.
+        If there is no port of the chosen kind it does not lick. Phases
+        whose ports all lead to a punishment are only licked on errors, so
+        p_correct also sets how often a subject is impulsive
+            latency             : ('Constant',val), ('Uniform',[lo,hi]),
+                                  ('Gaussian',[mu,sd]) or any spec or
+                                  Distribution of Distributions.from_spec
+                                  in seconds
+            p_correct           : probability or function(trial_record) ->
+                                  probability. see contrast_psychometric
+            p_miss              : probability of not licking at all
+    """
+
+    def __init__(self, latency=('Gaussian',[0.3,0.1]), p_correct=1., p_miss=0., **kwargs):
+        super(LatencyResponder, self).__init__(**kwargs)
+        self.latency = latency
+        self._latency = from_spec(latency)
+        self.p_correct = p_correct
+        self.p_miss = p_miss
+
+    def start_phase(self, phase, phases, ports, trial_record, t):
+        super(LatencyResponder, self).start_phase(phase, phases, ports, trial_record, t)
+        correct, incorrect = response_ports(phase, phases)
+        if not correct and not incorrect:
+            return
+        if self._rng.random() < self.p_miss:
+            return
+        p_correct = self.p_correct(trial_record) if callable(self.p_correct) else self.p_correct
+        choices = correct if self._rng.random() < p_correct else incorrect
+        if choices:
+            self.lick(choices[self._rng.integers(len(choices))], t+self._latency.sample(1, self._rng)[0])
+
+
+class CombinedPolicy(ResponsePolicy):
+    """
+        COMBINEDPOLICY responds on any port that one of its policies responds on
+    """
+
+    def __init__(self, policies, **kwargs):
+        super(CombinedPolicy, self).__init__(**kwargs)
+        self.policies = policies
+
+    def start_phase(self, phase, phases, ports, trial_record, t):
+        for policy in self.policies:
+            policy.start_phase(phase, phases, ports, trial_record, t)
+
+    def read_ports(self, t):
+        active = []
+        for policy in self.policies:
+            for port in policy.read_ports(t):
+                if port not in active:
+                    active.append(port)
+        return active
@@ -0,0 +1,108 @@
+"""
+    Schedules fix the order of the conditions of a session up front so that
+    conditions are counterbalanced and a session can be replayed from its seed.
+    Conditions are rows of level indices. The trial manager maps them to its
+    parameter values.
+"""
+import zlib
+import numpy as np
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+def full_factorial(levels):
+    """
+        record array with a row of level indices for every combination of
+        levels, a list of (name, number of levels). The last name varies fastest
+    """
+    names = [name for name, n in levels]
+    sizes = [n for name, n in levels]
+    indices = np.indices(sizes).reshape(len(sizes), -1)
+    combos = np.empty(indices.shape[1], dtype=[(name, 'int32') for name in names])
+    for name, index in zip(names, indices):
+        combos[name] = index
+    return combos
+
+
+def subject_seed(seed, subject_id, session_number):
+    """
+        seed for a session of a subject derived from seed. the same three
+        always give the same schedule and different subjects get different ones
+    """
+    sequence = np.random.SeedSequence([seed, zlib.crc32(subject_id.encode()), session_number])
+    return int(sequence.generate_state(1, dtype=np.uint64)[0])
+
+
+class BlockSchedule(object):
+    """
+        BLOCKSCHEDULE is the order of conditions in a session. Every block
+        holds each combination of the levels repeats times in a random order.
+        Blocks are shuffled num_blocks at a time with one vectorized argsort
+        and more are added when the schedule runs out.
+            levels              : list of (name, number of levels)
+            repeats             : times each combination is in a block
+            seed                : seed of the random generator. a new one is
+                                  drawn if None. the same seed and levels
+                                  always give the same schedule
+            num_blocks          : blocks generated at a time
+    """
+
+    def __init__(self, levels, repeats=1, seed=None, num_blocks=10):
+        self.levels = list(levels)
+        self.repeats = repeats
+        self.seed = seed if seed is not None else np.random.SeedSequence().entropy
+        self.num_blocks = num_blocks
+        self._rng = np.random.default_rng(self.seed)
+        self._block = np.tile(full_factorial(self.levels), repeats)
+        self.schedule = self._shuffled_blocks(num_blocks)
+
+    def __repr__(self):
+        return "BlockSchedule object with %d trials in blocks of %d" % (len(self.schedule), self.block_size)
+
+    def __len__(self):
+        return len(self.schedule)
+
+    @property
+    def block_size(self):
+        return len(self._block)
+
+    def _shuffled_blocks(self, num_blocks):
+        order = np.argsort(self._rng.random((num_blocks, self.block_size)), axis=1)
+        return self._block[order].reshape(-1)
+
+    def __getitem__(self, index):
+        """
+            row of level indices of condition index
+        """
+        while index >= len(self.schedule):
+            self.schedule = np.concatenate((self.schedule, self._shuffled_blocks(self.num_blocks)))
+        return self.schedule[index]
+
+    def save(self, path):
+        """
+            write the seed, the levels and the schedule so far (.npz)
+        """
+        with open(path, 'wb') as f:
+            np.savez(f, seed=str(self.seed), repeats=self.repeats, num_blocks=self.num_blocks,
+                     level_names=np.asarray([name for name, n in self.levels]),
+                     level_sizes=np.asarray([n for name, n in self.levels]),
+                     schedule=self.schedule)
+
+    @classmethod
+    def load(cls, path):
+        """
+            BlockSchedule saved at path. continues exactly as the saved one would
+        """
+        with np.load(path) as data:
+            levels = list(zip(data['level_names'].tolist(), data['level_sizes'].tolist()))
+            schedule = cls(levels, repeats=int(data['repeats']), seed=int(str(data['seed'])), num_blocks=int(data['num_blocks']))
+            saved = data['schedule']
+        # regenerate as far as the saved schedule went so the generator state matches
+        schedule[len(saved)-1]
+        return schedule
@@ -0,0 +1,353 @@
+import os
+import pickle
+import struct
+import zlib
+import numpy as np
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+MAGIC = b'BCSLOG01'
+# each frame is <length><crc32 of payload><payload>
+FRAME_HEADER = struct.Struct('<II')
+# one entry per trial in the trial index
+INDEX_DTYPE = np.dtype([('session_number', '<i8'), ('trial_number', '<i8'), ('offset', '<i8')])
+
+
+class SessionLogWriter(object):
+    """
+        SESSIONLOGWRITER appends trial_records to an append-only session log.
+        Each trial_record is pickled into a length-prefixed frame and flushed
+        as soon as it is written so that a crash loses at most the trial in
+        progress.
+            path                : location of the log
+            fsync               : force the OS to write every frame to disk
+            trial_index         : TrialIndex updated with the offset of
+                                  every frame appended
+            session_number      : session of the log. its entries in
+                                  trial_index are checked against the log
+                                  when it is opened
+    """
+
+    def __init__(self, path, fsync=False, trial_index=None, session_number=None):
+        self.path = path
+        self.fsync = fsync
+        self.trial_index = trial_index
+        self.num_records = 0
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            # drop any partial frame left behind by a crash before appending
+            self.num_records, end = recover_session_log(path)
+            self._f = open(path, 'r+b')
+            self._f.seek(end)
+        else:
+            self._f = open(path, 'wb')
+            self._f.write(MAGIC)
+            self._f.flush()
+            end = len(MAGIC)
+        if self.trial_index is not None and session_number is not None:
+            self.trial_index.check_session(session_number, self.num_records, end)
+
+    def __repr__(self):
+        return "SessionLogWriter object at %s with %d records" % (self.path, self.num_records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def dump(self, trial_record):
+        """
+            serialized frame payload for trial_record
+        """
+        return pickle.dumps(trial_record, pickle.HIGHEST_PROTOCOL)
+
+    def append(self, trial_record):
+        """
+            write trial_record. returns the byte offset of its frame
+        """
+        return self.append_payload(self.dump(trial_record), key=trial_key(trial_record))
+
+    def append_payload(self, payload, key=None):
+        """
+            write a payload from dump(). key is (session_number, trial_number)
+            for the trial index. returns the byte offset of its frame
+        """
+        offset = self._f.tell()
+        self._f.write(FRAME_HEADER.pack(len(payload), zlib.crc32(payload)))
+        self._f.write(payload)
+        self._f.flush()
+        if self.fsync:
+            os.fsync(self._f.fileno())
+        self.num_records += 1
+        # the frame is written before it is indexed
+        if self.trial_index is not None and key is not None:
+            self.trial_index.append(key[0], key[1], offset)
+        return offset
+
+    def sync(self):
+        """
+            force the frames written so far to disk
+        """
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        if self.trial_index is not None:
+            self.trial_index.sync()
+
+    def close(self):
+        if self._f is not None and not self._f.closed:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+        if self.trial_index is not None:
+            self.trial_index.close()
+
+
+class TrialIndex(object):
+    """
+        TRIALINDEX is a per subject index of the trials in its session logs.
+        It is a flat binary file with one (session_number, trial_number,
+        offset) entry per trial. The session log for an entry follows from
+        its session_number so a single trial can be read with one seek.
+            path                : location of the index
+            session_log_path    : function(session_number) -> path to the
+                                  session log
+        The file is read once, the first time the index is used. Entries
+        appended after that are added to the copy in memory, along with
+        maps from session_number and trial_number to entries for locate
+    """
+    initial_capacity = 1024
+
+    def __init__(self, path, session_log_path):
+        self.path = path
+        self.session_log_path = session_log_path
+        self._f = None
+        self._entries = None
+        self._num_entries = 0
+        self._by_session = {}
+        self._by_trial_number = {}
+
+    def __repr__(self):
+        return "TrialIndex object at %s" % self.path
+
+    def __getstate__(self):
+        # the open file and the copy in memory are not pickled. the copy is
+        # read again on first use
+        state = self.__dict__.copy()
+        state.update(_f=None, _entries=None, _num_entries=0, _by_session={}, _by_trial_number={})
+        return state
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        if os.path.exists(self.path):
+            count = os.path.getsize(self.path)//INDEX_DTYPE.itemsize
+            entries = np.fromfile(self.path, dtype=INDEX_DTYPE, count=count)
+        else:
+            entries = np.zeros(0, dtype=INDEX_DTYPE)
+        self._set_entries(entries)
+
+    def _set_entries(self, entries):
+        # entries in memory and the maps to them
+        self._entries = np.zeros(max(self.initial_capacity, len(entries)), dtype=INDEX_DTYPE)
+        self._entries[:len(entries)] = entries
+        self._num_entries = 0
+        self._by_session = {}
+        self._by_trial_number = {}
+        for session_number, trial_number in zip(entries['session_number'].tolist(), entries['trial_number'].tolist()):
+            self._map(session_number, trial_number)
+
+    def _map(self, session_number, trial_number):
+        # entries of a session are listed in the order they were appended. the
+        # latest entry for a trial_number is the one located
+        self._by_session.setdefault(session_number, []).append(self._num_entries)
+        self._by_trial_number[trial_number] = self._num_entries
+        self._num_entries += 1
+
+    def append(self, session_number, trial_number, offset):
+        self._load()
+        if self._f is None:
+            self._f = open(self.path, 'ab')
+            # drop a partial entry left behind by a crash
+            excess = self._f.tell() % INDEX_DTYPE.itemsize
+            if excess:
+                self._f.truncate(self._f.tell()-excess)
+                self._f.seek(0, os.SEEK_END)
+        entry = np.array([(session_number, trial_number, offset)], dtype=INDEX_DTYPE)
+        self._f.write(entry.tobytes())
+        self._f.flush()
+        if self._num_entries == len(self._entries):
+            self._entries = np.concatenate([self._entries, np.zeros(len(self._entries), dtype=INDEX_DTYPE)])
+        self._entries[self._num_entries] = entry[0]
+        self._map(int(session_number), int(trial_number))
+
+    def sync(self):
+        if self._f is not None:
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        if self._f is not None:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+            self._f = None
+
+    def entries(self):
+        """
+            all entries as a structured array
+        """
+        self._load()
+        return self._entries[:self._num_entries]
+
+    def sessions(self):
+        """
+            dict of session_number -> (first trial_number, last trial_number, path to session log)
+        """
+        entries = self.entries()
+        # a session that was run again is indexed after the later sessions
+        return {s: (int(entries['trial_number'][which[0]]), int(entries['trial_number'][which[-1]]), self.session_log_path(s))
+                for s, which in sorted(self._by_session.items())}
+
+    def locate(self, session_number=None, trial=None, trial_number=None):
+        """
+            (path to session log, offset) for trial (1-based) of session
+            session_number or for trial_number
+        """
+        entries = self.entries()
+        if trial_number is not None:
+            which = self._by_trial_number.get(trial_number)
+        else:
+            session = self._by_session.get(session_number, [])
+            which = session[trial-1] if 1 <= trial <= len(session) else None
+        if which is None:
+            raise KeyError('TRIALINDEX:LOCATE::trial not in index')
+        entry = entries[which]
+        return self.session_log_path(int(entry['session_number'])), int(entry['offset'])
+
+    def read_trial(self, session_number=None, trial=None, trial_number=None):
+        """
+            a single trial_record. see locate
+        """
+        path, offset = self.locate(session_number=session_number, trial=trial, trial_number=trial_number)
+        return read_session_log_at(path, offset)
+
+    def _scan(self, session_number):
+        # entries for every complete frame of the session log
+        with _open_log(self.session_log_path(session_number)) as f:
+            return np.array([(session_number, trial_key(pickle.loads(payload))[1], offset) for offset, payload in _iter_frames(f)], dtype=INDEX_DTYPE)
+
+    def _write(self, entries):
+        # written to a temporary file first so that a crash leaves the old index
+        self.close()
+        temp_path = self.path+'.%d.tmp' % os.getpid()
+        with open(temp_path, 'wb') as index:
+            index.write(entries.tobytes())
+            index.flush()
+            os.fsync(index.fileno())
+        os.replace(temp_path, self.path)
+        self._set_entries(entries)
+
+    def rebuild(self, session_numbers):
+        """
+            recreate the index by scanning the session logs for session_numbers
+        """
+        self._write(np.concatenate([np.zeros(0, dtype=INDEX_DTYPE)]+[self._scan(s) for s in sorted(session_numbers)]))
+
+    def rebuild_session(self, session_number):
+        """
+            replace the entries of session_number by scanning its session log.
+            entries of other sessions are kept
+        """
+        entries = self.entries()
+        entries = entries[entries['session_number'] != session_number]
+        if os.path.exists(self.session_log_path(session_number)):
+            entries = np.concatenate([entries, self._scan(session_number)])
+        self._write(entries)
+
+    def check_session(self, session_number, num_records, end):
+        """
+            True if the entries of session_number match its log, which has
+            num_records complete frames ending at byte end. Otherwise the
+            entries are rebuilt from the log. They do not match when the
+            session was run before with a new log or when a crash left the
+            index and the log out of step
+        """
+        offsets = self.entries()['offset'][self._by_session.get(session_number, [])]
+        if len(offsets) == num_records and (not num_records or (offsets[0] >= len(MAGIC) and offsets[-1] < end and np.all(np.diff(offsets) > 0))):
+            return True
+        print('TRIALINDEX:CHECK_SESSION::Rebuilding the entries of session %d in %s' % (session_number, self.path))
+        self.rebuild_session(session_number)
+        return False
+
+
+def trial_key(trial_record):
+    """
+        (session_number, trial_number) for trial_record
+    """
+    return trial_record.get('session_number', -1), trial_record.get('trial_number', -1)
+
+
+def _iter_frames(f):
+    # yields (offset, payload) for every complete frame. stops at the first
+    # truncated or corrupt frame
+    while True:
+        offset = f.tell()
+        header = f.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        length, crc = FRAME_HEADER.unpack(header)
+        payload = f.read(length)
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            return
+        yield offset, payload
+
+
+def _open_log(path):
+    f = open(path, 'rb')
+    if f.read(len(MAGIC)) != MAGIC:
+        f.close()
+        raise ValueError('SESSIONLOG:_OPEN_LOG::%s is not a session log' % path)
+    return f
+
+
+def read_session_log(path):
+    """
+        lazily iterate over the trial_records in the session log at path
+    """
+    with _open_log(path) as f:
+        for offset, payload in _iter_frames(f):
+            yield pickle.loads(payload)
+
+
+def read_session_log_at(path, offset):
+    """
+        single trial_record from the frame at offset
+    """
+    with _open_log(path) as f:
+        f.seek(offset)
+        for offset, payload in _iter_frames(f):
+            return pickle.loads(payload)
+    raise ValueError('SESSIONLOG:READ_SESSION_LOG_AT::no complete record at offset %d in %s' % (offset, path))
+
+
+def recover_session_log(path):
+    """
+        truncate the session log at path after its last complete frame.
+        returns (number of records, end of last complete frame)
+    """
+    num_records = 0
+    with _open_log(path) as f:
+        end = f.tell()
+        for offset, payload in _iter_frames(f):
+            num_records += 1
+            end = f.tell()
+    if os.path.getsize(path) > end:
+        print('SESSIONLOG:RECOVER_SESSION_LOG::Dropping %d bytes of partial record from %s' % (os.path.getsize(path)-end, path))
+        with open(path, 'r+b') as f:
+            f.truncate(end)
+    return num_records, end
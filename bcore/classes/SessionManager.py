@@ -30,6 +30,11 @@ class SessionManager(object):
         data['name'] = self.name
         return data
 
+    @property
+    def ver(self):
+        # logged with every trial as session_manager_version_number
+        return self.sessionmgr_version
+
     def __repr__(self):
         return "SessionManager object with name:%s" %(self.name)
 
@@ -56,6 +61,10 @@ class NoTimeOff(SessionManager):
         data['notimeoff_version'] = self.notimeoff_version.__str__()
         return data
 
+    @property
+    def ver(self):
+        return self.notimeoff_version
+
     def __repr__(self):
         return "NoTimeOff object"
 
@@ -91,6 +100,10 @@ class MinutesPerSession(SessionManager):
         data['hours_between_sessions'] = self.hours_between_sessions
         return data
 
+    @property
+    def ver(self):
+        return self.minutespersession_version
+
     def __repr__(self):
         return "MinutesPerSession object, %s minutes with %s hrs between sessions" %(self.minutes, self.hours_between_sessions)
 
@@ -123,6 +136,10 @@ class TimeRange(SessionManager):
         data['time_stop'] = self.time_stop
         return data
 
+    @property
+    def ver(self):
+        return self.timerange_version
+
     def __repr__(self):
         return "TimeRange object"
 
@@ -0,0 +1,113 @@
+"""
+    Station sounds are synthesized once and kept as .npy files named by a
+    hash of how they were made. Later sessions (of any protocol) memory map
+    them instead of synthesizing them again. Changing a parameter changes
+    the hash, so a changed sound is synthesized again and the old file is
+    never used.
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+SAMPLE_RATE = 44100
+# part of every key. bump it when a synthesizer changes so that files made
+# by the old one are not used
+SYNTHESIS_VERSION = 1
+
+
+def apodize(val, sample_rate=SAMPLE_RATE):
+    """
+        hamming ramps (5 ms) on both ends of val, as psychopy does for hamming=True
+    """
+    hw_size = int(min(sample_rate//200, len(val)//15))
+    if hw_size < 1:
+        return val
+    window = np.hamming(2*hw_size+1)
+    if val.ndim > 1:
+        window = window[:, np.newaxis]
+    val[:hw_size] *= window[:hw_size]
+    val[-hw_size:] *= window[hw_size+1:]
+    return val
+
+
+def tone(freq, secs, sample_rate=SAMPLE_RATE, hamming=True):
+    """
+        mono sine of freq Hz
+    """
+    val = np.sin(2*np.pi*freq*np.arange(0., secs, 1./sample_rate))
+    return apodize(val, sample_rate) if hamming else val
+
+
+def sines(freqs, secs, sample_rate=SAMPLE_RATE, channels=2, hamming=True):
+    """
+        sum of sines with freqs cycles over the whole sound (not per second)
+        on every channel. this is how the punishment sound was always made
+    """
+    phase = 2*np.pi*np.linspace(0.0, 1.0, int(secs*sample_rate))
+    val = np.zeros_like(phase)
+    for f in freqs:
+        val += np.sin(f*phase)
+    val = np.tile(val[:, np.newaxis], (1, channels))
+    return apodize(val, sample_rate) if hamming else val
+
+
+def noise(sd, secs, sample_rate=SAMPLE_RATE, channels=2, seed=0, hamming=True):
+    """
+        gaussian white noise with standard deviation sd, the same on every
+        channel. seed fixes the noise so that it can be cached
+    """
+    val = sd*np.random.default_rng(seed).standard_normal(int(secs*sample_rate))
+    val = np.tile(val[:, np.newaxis], (1, channels))
+    return apodize(val, sample_rate) if hamming else val
+
+
+SYNTHESIZERS = {'tone': tone, 'sines': sines, 'noise': noise}
+
+
+class SoundCache(object):
+    """
+        SOUNDCACHE keeps synthesized sound buffers in path as <key>.npy where
+        key is a hash of the synthesizer, its parameters and
+        SYNTHESIS_VERSION. Buffers are memory mapped copy on write, so
+        changing one in memory does not change the file.
+            path                : directory of the cache. made if missing
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+    def __repr__(self):
+        return "SoundCache object at %s" % self.path
+
+    @staticmethod
+    def key(kind, **params):
+        description = json.dumps([SYNTHESIS_VERSION, kind, params], sort_keys=True)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def get(self, kind, **params):
+        """
+            float32 buffer made by SYNTHESIZERS[kind](**params). synthesized
+            and saved the first time only
+        """
+        if kind not in SYNTHESIZERS:
+            raise ValueError('SOUNDCACHE:GET::unknown synthesizer %s' % (kind,))
+        file_path = os.path.join(self.path, self.key(kind, **params)+'.npy')
+        if not os.path.isfile(file_path):
+            val = SYNTHESIZERS[kind](**params).astype('float32')
+            # written to a temporary file first so that a half written buffer is never loaded
+            temp_path = file_path+'.%d.tmp' % os.getpid()
+            with open(temp_path, 'wb') as f:
+                np.save(f, val)
+            os.replace(temp_path, file_path)
+        return np.load(file_path, mmap_mode='c')
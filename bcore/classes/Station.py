@@ -1,4 +1,5 @@
 import os
+import time
 import psychopy
 from psychopy import event
 import psychopy.logging
@@ -12,8 +13,15 @@ from psychopy import prefs
 prefs.general['audioLib'] = ['sounddevice']
 
 import psychopy.sound
+from psychopy.constants import (STARTED, STOPPED, NOT_STARTED)
 import bcore.classes.Hardware.Displays as displays
 from bcore import get_base_path, get_config_path, DATETIME_TO_STR
+from bcore.classes.CompiledRecord import compile_records, window_starts_in_step
+from bcore.classes.RecordWriter import RecordWriter
+from bcore.classes.StimulusPool import StimulusPool, StimulusBank
+from bcore.classes.PortSampler import PortSampler
+from bcore.classes.SoundCache import SoundCache, SAMPLE_RATE
+from bcore.classes.TrialManagers.Instrumentation import PhaseProfiler
 from verlib import NormalizedVersion as Ver
 
 __author__ = "Balaji Sriram"
@@ -27,68 +35,6 @@ __status__ = "Production"
 PPORT_LO = 0
 PPORT_HI = 1
 
-def compile_records(compiled_record, trial_record):
-    regular_fields = ["session_number",
-    "trial_number",
-    "station_id",
-    "num_ports_in_station",
-    "trial_start_time",
-    "trial_stop_time",
-    "subject_id",
-    "current_step",
-    "num_steps",
-    "criterion_met",
-    "graduate",
-    "errored_out",
-    "manual_quit",
-    "correct"]
-    lut_fields = ["station_name",
-    "station_version_number",
-    "subject_version_number",
-    "protocol_name",
-    "protocol_version_number",
-    "current_step_name",
-    "trial_manager_name",
-    "session_manager_name",
-    "criterion_name",
-    "reinforcement_manager_name",
-    "trial_manager_class",
-    "session_manager_class",
-    "criterion_class",
-    "reinforcement_manager_class",
-    "trial_manager_version_number",
-    "session_manager_version_number",
-    "criterion_version_number",
-    "reinforcement_manager_version_number",]
-    LUT = compiled_record['LUT']
-    num_trials = len(compiled_record['trial_number'])
-    for field in regular_fields:
-        try:
-            value = trial_record[field]
-        except KeyError:
-            value = None
-        if not field in compiled_record: compiled_record[field] = [None for i in range(0,num_trials)] # None padding
-        compiled_record[field].append(value)
-
-    for field in lut_fields:
-        try:
-            value = trial_record[field]
-        except KeyError:
-            value = 'NotAvailable'
-        idx,LUT = add_or_find_in_LUT(LUT,value)
-        if not field in compiled_record: compiled_record[field] = [None for i in range(0,num_trials)] # None padding
-        compiled_record[field].append(idx)
-    compiled_record['LUT'] = LUT
-
-    try:
-        trial_specific_compiler = trial_record['trial_compiler']
-        compiled_record = trial_specific_compiler(compiled_record,trial_record)
-    except KeyError as e:
-        print('No trial specific compiler. Ignoring trial')
-
-    return compiled_record
-
-
 def get_mac_address():
     configuration = json.config(os.path.join(get_config_path(),'bcore.config'))
     return configuration['mac_addr']
@@ -126,6 +72,22 @@ class Station(object):
     station_name = ''
     station_path = ''
     station_location = None
+    compiled_record_window = 10000 # trials of history loaded for a session. all of them if the current step started earlier
+    max_trials = None # end the session after this many trials
+    num_session_trials = 0 # trials done in the current session
+    # name -> (synthesizer, params) of the sounds. see SoundCache.SYNTHESIZERS
+    SOUNDS = {
+        'trial_start_sound': ('tone', dict(freq=440, secs=1., sample_rate=SAMPLE_RATE)),
+        'request_sound': ('tone', dict(freq=493.88, secs=1., sample_rate=SAMPLE_RATE)),
+        'stim_start_sound': ('tone', dict(freq=493.88, secs=1., sample_rate=SAMPLE_RATE)),
+        'go_sound': ('tone', dict(freq=493.88, secs=1., sample_rate=SAMPLE_RATE)),
+        'keep_going_sound': ('tone', dict(freq=493.88, secs=1., sample_rate=SAMPLE_RATE)),
+        'correct_sound': ('tone', dict(freq=523.25, secs=1., sample_rate=SAMPLE_RATE)),
+        'reward_sound': ('tone', dict(freq=523.25, secs=1., sample_rate=SAMPLE_RATE)),
+        'trial_end_sound': ('tone', dict(freq=587.33, secs=1., sample_rate=SAMPLE_RATE)),
+        'punishment_sound': ('sines', dict(freqs=[370, 440], secs=2., sample_rate=SAMPLE_RATE)),
+        'try_something_else': ('noise', dict(sd=0.5, secs=2., sample_rate=SAMPLE_RATE)),
+        }
 
 
     def __init__(self, **kwargs):
@@ -172,34 +134,22 @@ class Station(object):
     def do_trials(self, **kwargs):
         raise NotImplementedError('Run doTrials() on a subclass')
 
-    def initialize_sounds(self):
-        self._sounds['trial_start_sound'] = psychopy.sound.Sound(440,stereo=0,secs=1.,hamming=True)
-
-        self._sounds['request_sound'] = psychopy.sound.Sound(493.88,stereo=0,secs=1.,hamming=True)
-        self._sounds['stim_start_sound'] = psychopy.sound.Sound(493.88,stereo=0,secs=1.,hamming=True)
-        self._sounds['go_sound'] = psychopy.sound.Sound(493.88,stereo=0,secs=1.,hamming=True)
-        self._sounds['keep_going_sound'] = psychopy.sound.Sound(493.88,stereo=0,secs=1.,hamming=True)
-        self._sounds['request_sound'] = psychopy.sound.Sound(493.88,stereo=0,secs=1.,hamming=True)
+    def get_sound_cache_path(self):
+        return os.path.join(self.station_path, 'SoundCache')
 
-        self._sounds['correct_sound'] = psychopy.sound.Sound(523.25,stereo=0,secs=1.,hamming=True)
-        self._sounds['reward_sound'] = psychopy.sound.Sound(523.25,stereo=0,secs=1.,hamming=True)
-        self._sounds['trial_end_sound'] = psychopy.sound.Sound(523.25,stereo=0,secs=1.,hamming=True)
-
-        sampleRate,secs,f_punishment=(44100,2,[370,440])
-        nSamples = int(secs * sampleRate)
-        phase = 2*np.pi*np.linspace(0.0, 1.0, nSamples)
-        val = np.full_like(phase,0.)
-        for f in f_punishment:
-            val += np.sin(f*phase)
-        val = np.matlib.repmat(val,2,1)
-        self._sounds['punishment_sound'] = psychopy.sound.Sound(val.T,hamming=True)
-
-        val = 0.5*np.random.randn(1,nSamples)
-        val = np.matlib.repmat(val,2,1)
-        self._sounds['try_something_else'] = psychopy.sound.Sound(val.T,hamming=True)
-
-
-        self._sounds['trial_end_sound'] = psychopy.sound.Sound(587.33,stereo=0,secs=1.,hamming=True)
+    def initialize_sounds(self):
+        """
+            sounds of SOUNDS. buffers come from the SoundCache of the station
+            so they are only synthesized the first time
+        """
+        cache = SoundCache(self.get_sound_cache_path())
+        self._sounds = {}
+        for name, (kind, params) in self.SOUNDS.items():
+            val = cache.get(kind, **params)
+            if val.ndim==1:
+                self._sounds[name] = psychopy.sound.Sound(val, sampleRate=params.get('sample_rate', SAMPLE_RATE), stereo=0, hamming=False)
+            else:
+                self._sounds[name] = psychopy.sound.Sound(val, sampleRate=params.get('sample_rate', SAMPLE_RATE), hamming=False)
 
     def _rewind_sounds(self,time=0.):
         for sound in self._sounds:
@@ -265,6 +215,17 @@ class StandardVisionBehaviorStation(Station):
     _window = None
     _session = None
     _server_conn = None
+    _record_writer = None
+    _stimulus_pool = None
+    _stimulus_bank = None
+    stimulus_bank_capacity = 64 # stimuli kept by the StimulusBank of the window
+    _port_sampler = None
+    port_sample_rate = None # Hz. sample the ports on a PortSampler thread. None polls once per frame
+    _phase_profiler = None
+    profile_phases = False # time the phase loop and save histograms with the session
+    render_static_phases_once = False # do not redraw static phases. needs a display that keeps its back buffer
+    _session_attributes = ('_window', '_session', '_server_conn', '_parallel_port_conn', '_record_writer', '_stimulus_pool',
+                           '_stimulus_bank', '_port_sampler', '_phase_profiler', '_clocks', '_key_pressed', '_sounds', '_stims')
 
     svbstation_version = Ver('0.0.1')
     sound_on = False
@@ -375,6 +336,29 @@ class StandardVisionBehaviorStation(Station):
     def initialize_display(self, display = displays.StandardDisplay()):
         self._window = psychopy.visual.Window(color=(0.,0.,0.), fullscr=True, winType='pyglet', allowGUI=False, units='deg', screen=0, viewScale=None, waitBlanking=True, allowStencil=True,monitor = display)
         self._window.flip()
+        # background and photodiode stimuli reused across trials on this window
+        self._stimulus_pool = StimulusPool()
+        self._stimulus_bank = StimulusBank(capacity=self.stimulus_bank_capacity)
+
+    def initialize_clocks(self):
+        """
+            set up the session and trial clocks. returns the session start time
+        """
+        self._clocks['session_clock'] = psychopy.core.MonotonicClock()
+        self._clocks['trial_clock'] = psychopy.core.Clock()
+        return psychopy.core.getAbsTime()
+
+    def make_stimulus(self, stim_class, **kwargs):
+        """
+            stim_class (a psychopy.visual stimulus) drawn on this station's window
+        """
+        return stim_class(win=self._window, **kwargs)
+
+    def on_phase_enter(self, phase, phases, trial_record):
+        """
+            called by the trial manager when phase (one of phases) starts
+        """
+        pass
 
     def initialize_parallel_port(self):
         self._parallel_port_conn = psychopy.parallel.ParallelPort(address=self.parallel_port_address)
@@ -536,64 +520,113 @@ class StandardVisionBehaviorStation(Station):
             Remove session specific details. ideal for pickling
         """
         self._window = None
+        self._stimulus_pool = None
+        self._stimulus_bank = None
         self._session = None
         self._server_conn = None
         self._parallel_port_conn = None
         self._clocks = None
 
+    def __getstate__(self):
+        # stations are pickled by BServerLocal.save. it may run on the record
+        # writer thread while a session is open, so leave out the session
+        # objects decache would remove
+        state = self.__dict__.copy()
+        for key in self._session_attributes:
+            if key in state:
+                state[key] = None
+        return state
+
     def do_trials(self, **kwargs):
         # first step in the running of trials. called directly by station
-        # or through the BServer
+        # or through the BServer. on_session_end is called by the record
+        # writer after the compiled records are saved
         if __debug__:
             pass
         self.initialize()
         # get the compiled_records for the animal. Compiled records will contain all the information that will be used in
         # the course of running the experiment. If some stimulus parameter for a given trial is dependent on something in
         # the previous trial, please add it to compiled records
-        compiled_record = self.subject.load_compiled_records()
+        # the previous compiled_record_window trials are loaded. criteria and
+        # protocols count the trials of the current step, so the whole
+        # history is loaded when the window starts inside that step
+        compiled_record = self.subject.load_compiled_records(last_n=self.compiled_record_window)
+        if window_starts_in_step(compiled_record):
+            compiled_record = self.subject.load_compiled_records()
         quit = False
 
-        # session starts here
-        session_record = []  # just a list of tRs
+        # session starts here. trial_records are logged as they end by the
+        # record writer thread
         session_number = compiled_record["session_number"][-1] + 1
+        self._record_writer = RecordWriter(self.subject.open_session_log(session_number))
 
         # setup the clocks
-        self._clocks['session_clock'] = psychopy.core.MonotonicClock()
-        self._clocks['trial_clock'] = psychopy.core.Clock()
-        session_start_time = psychopy.core.getAbsTime()
-
-        while not quit:
-            # it loops in here every trial
-            trial_record = {}
-            # just assign relevant details here
-            trial_record["session_start_time"] = session_start_time
-            trial_record["trial_number"] = compiled_record["trial_number"][-1] + 1
-            trial_record["session_number"] = session_number
-            trial_record["station_id"] = self.station_id
-            trial_record["station_version_number"] = self.ver.__str__()
-            trial_record["station_name"]= self.station_name
-            trial_record["num_ports_in_station"] = self.num_ports
-            trial_record["trial_start_time"] = self._clocks['session_clock'].getTime()
-            # doTrial - only trial_record will be returned as its type will be changed
-            trial_record, quit = self.subject.do_trial(station=self, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
-
-            trial_record["trial_stop_time"] = self._clocks['session_clock'].getTime()
-            # update sessionRecord and compiledRecord
-            compiled_record = compile_records(compiled_record,trial_record)
-            session_record.append(trial_record)
-
-        # save session records
-        self.subject.save_session_records(session_record)
-        # save compiled records
-        self.subject.save_compiled_records(compiled_record)
+        session_start_time = self.initialize_clocks()
+        self.num_session_trials = 0
+        if self.port_sample_rate:
+            self._port_sampler = PortSampler(self.read_ports, self._clocks['trial_clock'].getTime, rate=self.port_sample_rate)
+            self._port_sampler.start()
+        if self.profile_phases:
+            self._phase_profiler = PhaseProfiler(path=self.subject.get_session_profile_path(session_number))
+
+        try:
+            while not quit:
+                # it loops in here every trial
+                trial_record = {}
+                # just assign relevant details here
+                trial_record["session_start_time"] = session_start_time
+                trial_record["trial_number"] = compiled_record["trial_number"][-1] + 1
+                trial_record["session_number"] = session_number
+                trial_record["station_id"] = self.station_id
+                trial_record["station_version_number"] = self.station_version.__str__()
+                trial_record["station_name"]= self.station_name
+                trial_record["num_ports_in_station"] = self.num_ports
+                trial_record["trial_start_time"] = self._clocks['session_clock'].getTime()
+                # doTrial - only trial_record will be returned as its type will be changed
+                trial_record, quit = self.subject.do_trial(station=self, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
+
+                trial_record["trial_stop_time"] = self._clocks['session_clock'].getTime()
+                # update compiledRecord and log the trial
+                compiled_record = compile_records(compiled_record,trial_record)
+                self._record_writer.put_trial(trial_record)
+                self.num_session_trials += 1
+                if self.max_trials is not None and self.num_session_trials >= self.max_trials:
+                    quit = True
+
+            # save compiled records
+            self._record_writer.put_checkpoint(self.subject.save_compiled_records, compiled_record)
+            if kwargs.get('on_session_end') is not None:
+                self._record_writer.put_checkpoint(kwargs['on_session_end'])
+        except BaseException:
+            # a failed write should not hide why the session stopped
+            try:
+                self.close_session()
+            except Exception as error:
+                print('STANDARDVISIONBEHAVIORSTATION:DO_TRIALS::Closing session failed: %r' % (error.__cause__ or error,))
+            raise
+        self.close_session()
 
         self.decache()
 
     def close_session(self, **kwargs):
         print("STANDARDVISIONBEHAVIORSTATION:CLOSE_SESSION::Closing Session")
+        if self._port_sampler is not None:
+            self._port_sampler.stop()
+            self._port_sampler = None
+        if self._phase_profiler is not None:
+            self._phase_profiler.save()
+            self._phase_profiler = None
+        if self._record_writer is not None:
+            # wait for queued records and checkpoints to be written
+            record_writer, self._record_writer = self._record_writer, None
+            record_writer.close()
 
     def close_window(self):
         self._window.close()
+        if self._stimulus_pool is not None:
+            self._stimulus_pool.clear()
+        if self._stimulus_bank is not None:
+            self._stimulus_bank.clear()
 
     def check_manual_quit(self):
         key = psychopy.event.getKeys(keyList=['k','q'])
@@ -806,6 +839,244 @@ class StandardKeyboardStation(StandardVisionBehaviorStation):
         self.close_all_valves()
 
 
+####################################################################
+########################### SIMULATION #############################
+####################################################################
+class NullWindow(object):
+    """
+        NULLWINDOW stands in for a psychopy window when there is no display.
+        flip() draws nothing and advances a synthetic clock by one frame.
+        With paced=True flip() also waits for the frame to pass in real time
+            size                : (W, H) in pixels
+            frame_rate          : Hz of the simulated display
+            paced               : wait for every frame like a vsynced display
+    """
+
+    def __init__(self, size=(1920, 1080), frame_rate=60., paced=False):
+        self.size = np.asarray(size)
+        self.monitorFramePeriod = 1./frame_rate
+        self.paced = paced
+        self.t = 0.
+        self._next_flip = None
+
+    def __repr__(self):
+        return "NullWindow object at t=%f" % self.t
+
+    def flip(self, clearBuffer=True):
+        self.t += self.monitorFramePeriod
+        if self.paced:
+            now = time.perf_counter()
+            if self._next_flip is None or self._next_flip < now:
+                self._next_flip = now
+            else:
+                time.sleep(self._next_flip-now)
+            self._next_flip += self.monitorFramePeriod
+        return self.t
+
+    def clearBuffer(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SyntheticClock(object):
+    """
+        SYNTHETICCLOCK reads time off the synthetic clock of a NullWindow.
+        Has the getTime()/reset() interface of psychopy.core.Clock
+    """
+
+    def __init__(self, window):
+        self._window = window
+        self._offset = window.t
+
+    def getTime(self):
+        return self._window.t-self._offset
+
+    def reset(self, newT=0.):
+        self._offset = self._window.t-newT
+
+
+class NullStimulus(object):
+    """
+        NULLSTIMULUS takes the place of a psychopy.visual stimulus on a
+        NullWindow. Keeps the keyword arguments as attributes so that
+        stimulus update functions work and draws nothing
+    """
+
+    def __init__(self, **kwargs):
+        self.pos = (0., 0.)
+        self.opacity = 1.
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        return "NullStimulus object"
+
+    def draw(self, win=None):
+        pass
+
+
+class SilentSound(object):
+    """
+        SILENTSOUND has the play/stop/seek/status interface of psychopy.sound.Sound
+        and makes no sound
+    """
+
+    def __init__(self, secs=1.):
+        self.secs = secs
+        self.status = NOT_STARTED
+
+    def __repr__(self):
+        return "SilentSound object"
+
+    def play(self, **kwargs):
+        self.status = STARTED
+
+    def stop(self, **kwargs):
+        self.status = STOPPED
+
+    def seek(self, t):
+        pass
+
+
+def _null_stimulus(stim_class, win=None, **kwargs):
+    return NullStimulus(**kwargs)
+
+
+class SimulatedStation(StandardVisionBehaviorStation):
+    """
+        SIMULATEDSTATION runs trials without a display, a parallel port or a
+        sound card. The window is a NullWindow whose flips advance a synthetic
+        clock, stimuli are NullStimulus objects, sounds are silent and ports
+        are virtual. With paced=False frames are not waited for so a protocol
+        runs as fast as its trial logic allows. Use it to benchmark and
+        profile trial managers. Ports are driven by the response_policy of
+        the subject (see ResponsePolicies) if it has one.
+            ports               : names of the virtual ports
+            frame_rate          : Hz of the simulated display
+            paced               : wait for every frame in real time
+            max_trials          : end the session after this many trials
+
+        Press and release virtual ports with press_port/release_port.
+    """
+
+    simstation_version = Ver('0.0.1')
+    # the sounds of a real station, all silent
+    SOUND_NAMES = tuple(Station.SOUNDS)
+
+    def __init__(self, ports=('left_port','center_port','right_port'), frame_rate=60., paced=False, max_trials=None, **kwargs):
+        super(SimulatedStation, self).__init__(**kwargs)
+        self.ports = list(ports)
+        self.frame_rate = frame_rate
+        self.paced = paced
+        self.max_trials = max_trials
+        self._active_ports = []
+        self._valves_open = set()
+
+    def __repr__(self):
+        return "SimulatedStation object with id:%s and ports:%s" % (self.station_id, self.ports)
+
+    def get_display(self):
+        return None
+
+    def initialize(self):
+        self.initialize_display()
+        self.initialize_sounds()
+        self.close_all_valves()
+
+    def initialize_display(self, display=None):
+        self._window = NullWindow(frame_rate=self.frame_rate, paced=self.paced)
+        self._stimulus_pool = StimulusPool(stimulus_factory=_null_stimulus)
+        self._stimulus_bank = StimulusBank(capacity=self.stimulus_bank_capacity)
+
+    def initialize_sounds(self):
+        self._sounds = {}
+        for name in self.SOUND_NAMES:
+            self._sounds[name] = SilentSound()
+
+    def initialize_clocks(self):
+        self._clocks = {}
+        self._clocks['session_clock'] = SyntheticClock(self._window)
+        self._clocks['trial_clock'] = SyntheticClock(self._window)
+        return time.time()
+
+    def make_stimulus(self, stim_class, **kwargs):
+        return _null_stimulus(stim_class, **kwargs)
+
+    def get_ports(self):
+        return np.asarray(self.ports)
+
+    @property
+    def num_ports(self):
+        return len(self.ports)
+
+    def press_port(self, port):
+        if port not in self._active_ports:
+            self._active_ports.append(port)
+
+    def release_port(self, port):
+        if port in self._active_ports:
+            self._active_ports.remove(port)
+
+    @property
+    def response_policy(self):
+        return getattr(self.subject, 'response_policy', None)
+
+    def on_phase_enter(self, phase, phases, trial_record):
+        if self.response_policy is not None:
+            self.response_policy.start_phase(phase, phases, self.get_ports(), trial_record, self._clocks['trial_clock'].getTime())
+
+    def read_ports(self):
+        active = list(self._active_ports)
+        if self.response_policy is not None:
+            for port in self.response_policy.read_ports(self._clocks['trial_clock'].getTime()):
+                if port not in active:
+                    active.append(port)
+        return active
+
+    def open_valve(self, valve):
+        self._valves_open.add(valve)
+
+    def close_valve(self, valve):
+        self._valves_open.discard(valve)
+
+    def close_all_valves(self):
+        self._valves_open = set()
+
+    def flush_valves(self, dur=1):
+        pass
+
+    def set_pin_on(self, pin):
+        pass
+
+    def set_pin_off(self, pin):
+        pass
+
+    def set_index_pin_on(self):
+        pass
+
+    def set_index_pin_off(self):
+        pass
+
+    def set_frame_pin_on(self):
+        pass
+
+    def set_frame_pin_off(self):
+        pass
+
+    def set_trial_pin_on(self):
+        pass
+
+    def set_trial_pin_off(self):
+        pass
+
+    def check_manual_quit(self):
+        return False
+
+    def close_window(self):
+        self._window = None
+
+
 if __name__ == '__main__':
     from psychopy.constants import (STARTED, PLAYING, PAUSED, FINISHED, STOPPED, NOT_STARTED, FOREVER)
     import psychopy.core
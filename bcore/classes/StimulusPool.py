@@ -0,0 +1,139 @@
+import collections
+import numpy as np
+import psychopy.visual
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+def _color_key(color):
+    # colors come in as scalars, tuples and arrays. make them hashable
+    if color is None:
+        return None
+    return tuple(float(c) for c in np.atleast_1d(color))
+
+
+def _make_stimulus(stim_class, **kwargs):
+    return stim_class(**kwargs)
+
+
+class StimulusPool(object):
+    """
+        STIMULUSPOOL keeps the plain visual stimuli that trial managers ask for
+        on every trial (full screen backgrounds, photodiode patches) so that
+        their GL objects are made once per station instead of once per phase
+        or frame. Stimuli are keyed by window, geometry and color. A borrowed
+        stimulus is reset to its key so changes made by a previous borrower
+        do not leak. Stimuli with the same key are shared, so borrowers
+        should only change a stimulus while it is being drawn.
+            stimulus_factory    : function(stim_class, **kwargs) making the
+                                  stimuli. defaults to stim_class(**kwargs)
+    """
+
+    def __init__(self, stimulus_factory=None):
+        self._stimuli = {}
+        self._make = stimulus_factory or _make_stimulus
+
+    def __repr__(self):
+        return "StimulusPool object with %d stimuli" % len(self._stimuli)
+
+    def __len__(self):
+        return len(self._stimuli)
+
+    def rect(self, win, width, height, fill_color, pos=(0., 0.), units=''):
+        """
+            psychopy.visual.Rect on win of size (width, height) at pos
+        """
+        key = ('rect', id(win), float(width), float(height), tuple(float(p) for p in pos), units, _color_key(fill_color))
+        stim = self._stimuli.get(key)
+        if stim is None:
+            stim = self._make(psychopy.visual.Rect, win=win, width=width, height=height, pos=pos, units=units, fillColor=fill_color, autoLog=False)
+            self._stimuli[key] = stim
+        else:
+            stim.pos = pos
+            stim.fillColor = fill_color
+            stim.opacity = 1.
+        return stim
+
+    def text(self, win, pos=(0., 0.), height=None, units='', align_horiz='center', align_vert='center', color=(1., 1., 1.)):
+        """
+            psychopy.visual.TextStim on win at pos. borrowers set its text
+        """
+        key = ('text', id(win), tuple(float(p) for p in pos), height, units, align_horiz, align_vert, _color_key(color))
+        stim = self._stimuli.get(key)
+        if stim is None:
+            stim = self._make(psychopy.visual.TextStim, win=win, text='', pos=pos, height=height, units=units,
+                              alignHoriz=align_horiz, alignVert=align_vert, color=color, autoLog=False)
+            self._stimuli[key] = stim
+        return stim
+
+    def clear(self):
+        """
+            forget all stimuli. needed when the window they were drawn on closes
+        """
+        self._stimuli = {}
+
+
+class StimulusBank(object):
+    """
+        STIMULUSBANK keeps stimuli that are expensive to make (textures, masks)
+        keyed by the parameters they were made with, so that a trial manager
+        drawing from a finite grid of parameters makes every combination once
+        per window and then only looks it up. At most capacity stimuli are
+        kept. Beyond that the least recently used one is dropped. Borrowers
+        reset whatever they change during a trial (e.g. phase).
+            capacity            : number of stimuli kept
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._stimuli = collections.OrderedDict()
+        self._precompiled = set()
+
+    def __repr__(self):
+        return "StimulusBank object with %d of %d stimuli" % (len(self._stimuli), self.capacity)
+
+    def __len__(self):
+        return len(self._stimuli)
+
+    def __contains__(self, key):
+        return key in self._stimuli
+
+    def get(self, key, make):
+        """
+            stimulus for key. make(key) is called if it is not in the bank
+        """
+        stim = self._stimuli.get(key)
+        if stim is None:
+            stim = self._stimuli[key] = make(key)
+            if len(self._stimuli) > self.capacity:
+                self._stimuli.popitem(last=False)
+        else:
+            self._stimuli.move_to_end(key)
+        return stim
+
+    def precompile(self, owner, keys, make):
+        """
+            make the stimuli for keys, once per owner, until the bank is full.
+            keys can be a generator. it is not used after the first call
+        """
+        if owner in self._precompiled:
+            return
+        self._precompiled.add(owner)
+        for key in keys:
+            if len(self._stimuli) >= self.capacity:
+                break
+            if key not in self._stimuli:
+                self._stimuli[key] = make(key)
+
+    def clear(self):
+        """
+            forget all stimuli. needed when the window they were drawn on closes
+        """
+        self._stimuli = collections.OrderedDict()
+        self._precompiled = set()
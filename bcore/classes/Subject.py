@@ -3,6 +3,8 @@ from verlib import NormalizedVersion as Ver
 import os
 import pickle
 from bcore import get_base_path, DATETIME_TO_STR
+from bcore.classes.CompiledRecord import CompiledRecord
+from bcore.classes.SessionLog import SessionLogWriter, TrialIndex, read_session_log
 import importlib
 
 __author__ = "Balaji Sriram"
@@ -34,6 +36,7 @@ class Subject(object):
     iacuc_protocol_id = ''
     reward = None
     timeout = None
+    _trial_index = None
 
 
     _subject_changed = False
@@ -49,12 +52,12 @@ class Subject(object):
         elif 'data' in kwargs:
             self = self.load_from_dict(kwargs['data'])
         elif 'subject_id' in kwargs:
-            self.subject_id = subject_id
+            self.subject_id = kwargs['subject_id']
             self.creation_time = datetime.datetime.now()
         else:
             pass
 
-    def load_from_dict(self,data)
+    def load_from_dict(self,data):
         self.subject_version = Ver(data['subject_version'])
         self.subject_id = data['subject_id']
         self.creation_time = datetime.datetime.strptime(data['creation_time'],DATETIME_TO_STR)
@@ -90,6 +93,11 @@ class Subject(object):
         return data
 
 
+    @property
+    def ver(self):
+        # logged with every trial as subject_version_number
+        return self.subject_version
+
     def __repr__(self):
         return "Subject with id:%s, rewarded at %s ms and punishment at %s ms" % (self.subject_id, self.reward, self.timeout)
 
@@ -191,65 +199,97 @@ class Subject(object):
         trial_record,quit = current_step.do_trial(subject=self, station=station, trial_record=trial_record, compiled_record=compiled_record,quit = quit)
         if trial_record['graduate']:
             trial_record['criterion_met'] = True
+            # the next trial belongs to another step. drop anything prefetched for it
+            if hasattr(current_step.trial_manager, 'cancel_prefetch'):
+                current_step.trial_manager.cancel_prefetch()
             self.protocol.graduate()
         else:
             trial_record['criterion_met'] = False
 
         return trial_record, quit
 
-    def load_compiled_records(self):
-        # location is get_base_path->BCoreData->CompiledTrialRecords->subject_id.compiled_record
-        compiled_file_loc = os.path.join(get_base_path(),"BCoreData","SubjectData","CompiledTrialRecords")
-        files = [i for i in os.listdir(compiled_file_loc) if \
-                 os.path.isfile(os.path.join(compiled_file_loc,i)) and self.subject_id in i]
-        print(self.subject_id)
-        print(files)
+    def get_compiled_records_path(self):
+        # location is get_base_path->BCoreData->SubjectData->CompiledTrialRecords->subject_id.compiled
+        compiled_file_loc = os.path.join(get_base_path(), "BCoreData", "SubjectData", "CompiledTrialRecords")
+        return os.path.join(compiled_file_loc, '{0}.compiled'.format(self.subject_id))
+
+    def get_legacy_compiled_records_files(self):
+        # subject_id.1-N.compiled_record(s) pickles written by older versions
+        compiled_file_loc = os.path.join(get_base_path(), "BCoreData", "SubjectData", "CompiledTrialRecords")
+        return [os.path.join(compiled_file_loc, i) for i in os.listdir(compiled_file_loc) if
+                os.path.isfile(os.path.join(compiled_file_loc, i)) and i.startswith(self.subject_id+'.1-') and
+                (i.endswith('.compiled_record') or i.endswith('.compiled_records'))]
+
+    def load_compiled_records(self, last_n=None, since_session=None, columns=None):
+        """
+            history of trials for the subject. last_n, since_session and
+            columns limit the rows and columns that are loaded. Legacy
+            pickles are always loaded whole
+        """
+        compiled_path = self.get_compiled_records_path()
+        if os.path.exists(compiled_path):
+            return CompiledRecord().load_from_path(compiled_path, last_n=last_n, since_session=since_session, columns=columns)
+
+        files = self.get_legacy_compiled_records_files()
         if len(files)>1:
-            RuntimeError("SUBJECT:SUBJECT:LOAD_COMPILED_RECORDS:Too many records")
+            raise RuntimeError("SUBJECT:SUBJECT:LOAD_COMPILED_RECORDS:Too many records")
         elif len(files)==1:
-            with open(os.path.join(compiled_file_loc,files[0]),"rb") as f:
-                cR = pickle.load(f)
+            with open(files[0],"rb") as f:
+                cR = CompiledRecord(data=pickle.load(f))
         else:
             cR = None
 
         return cR
 
     def save_compiled_records(self, cR):
-        # location is get_base_path->BCoreData->SubjectData->CompiledTrialRecords->subject_id.compiled_record
-        from BCore import get_base_path
-        import os
-        import pickle
-        compiled_file_loc = os.path.join(get_base_path(), "BCoreData", "SubjectData", "CompiledTrialRecords")
-        files = [i for i in os.listdir(compiled_file_loc) if \
-                 os.path.isfile(os.path.join(compiled_file_loc, i)) and self.subject_id in i]
-
-        if len(files)>1:
-            pass
-        elif len(files)==1:
-            os.remove(os.path.join(compiled_file_loc,files[0]))
-        else:
-            pass
-
-        tNum = cR["trial_number"][-1]
-        sid = self.subject_id
-        cR_name = '{0}.1-{1}.compiled_record'.format(sid,tNum)
-        with open(os.path.join(compiled_file_loc,cR_name), "wb") as f:
-            pickle.dump(cR,f)
-
-    def save_session_records(self,sR):
-        # location is get_base_path->BCoreData->PermanentTrialRecords->subject_id->trialRecord.1-N.session_record
-        from BCore import get_base_path
-        import os
-        import pickle
+        # only the trials added since the last save are written
+        cR.save_to_path(self.get_compiled_records_path())
+        # legacy pickles are superseded once the record is saved
+        for f in self.get_legacy_compiled_records_files():
+            os.remove(f)
+
+    def get_session_log_path(self, session_number):
+        # location is get_base_path->BCoreData->SubjectData->SessionRecords->subject_id->session_N.session_log
         session_file_loc = os.path.join(get_base_path(), "BCoreData", "SubjectData", "SessionRecords",self.subject_id)
         if not os.path.exists(session_file_loc):
             os.makedirs(session_file_loc)
-        tnum_lo = sR[0]["trial_number"]
-        tnum_hi = sR[-1]["trial_number"]
+        return os.path.join(session_file_loc, "session_{0}.session_log".format(session_number))
+
+    def get_session_profile_path(self, session_number):
+        # phase loop histograms saved by PhaseProfiler. next to the session log
+        return os.path.join(os.path.dirname(self.get_session_log_path(session_number)), "session_{0}.profile.npz".format(session_number))
 
-        sR_name = "trialRecords.{0}-{1}.session_record".format(tnum_lo,tnum_hi)
-        with open(os.path.join(session_file_loc, sR_name), "wb") as f:
-            pickle.dump(sR, f)
+    def get_session_schedule_path(self, session_number, name):
+        # BlockSchedule of trial manager name in the session. next to the session log
+        return os.path.join(os.path.dirname(self.get_session_log_path(session_number)), "session_{0}.{1}.schedule.npz".format(session_number, name))
+
+    def open_session_log(self, session_number):
+        """
+            append-only log for the session. trial_records are written to it
+            as each trial ends
+        """
+        return SessionLogWriter(self.get_session_log_path(session_number), trial_index=self.get_trial_index(), session_number=session_number)
+
+    def load_session_records(self, session_number):
+        """
+            lazily iterate over the trial_records of a session
+        """
+        return read_session_log(self.get_session_log_path(session_number))
+
+    def get_trial_index(self):
+        # location is get_base_path->BCoreData->SubjectData->SessionRecords->subject_id->trials.index
+        index_path = os.path.join(os.path.dirname(self.get_session_log_path(0)), "trials.index")
+        # kept so that the index is only read from disk once
+        if self._trial_index is None or self._trial_index.path != index_path:
+            self._trial_index = TrialIndex(index_path, self.get_session_log_path)
+        return self._trial_index
+
+    def load_trial_record(self, session_number, trial):
+        """
+            trial_record for trial (1-based) of session_number. Only that
+            record is read
+        """
+        return self.get_trial_index().read_trial(session_number=session_number, trial=trial)
 
 class Mouse(Subject):
     """
@@ -268,7 +308,7 @@ class Mouse(Subject):
     gene_bkgd = ''
     manipulation = []
 
-    def __init__(self, , **kwargs):
+    def __init__(self, **kwargs):
         super(Mouse,self).__init__(**kwargs)
         if not kwargs:
             pass
@@ -296,6 +336,10 @@ class Mouse(Subject):
         data['manipulation'] = self.manipulation
         return data
 
+    @property
+    def ver(self):
+        return self.mouse_version
+
     def __repr__(self):
         return "Mouse with id:%s, rewarded at %s ms and punishment at %s ms" % (self.subject_id, self.reward, self.timeout)
 
@@ -360,6 +404,10 @@ class Rat(Subject):
         data['manipulation'] = self.manipulation
         return data
 
+    @property
+    def ver(self):
+        return self.rat_version
+
     def __repr__(self):
         return "Rat with id:%s, rewarded at %s ms and punishment at %s ms" % (self.subject_id, self.reward, self.timeout)
 
@@ -382,8 +430,11 @@ class VirtualSubject(Subject):
     """
         VIRTUALSUBJECT has the following attributes
         subjectID                 : string ID sent to SUBJECT
+        response_policy           : ResponsePolicy that responds for the
+                                    subject on a SimulatedStation
     """
     virtual_version = Ver('0.0.1')
+    response_policy = None
     def __init__(self, **kwargs):
         super(VirtualSubject,self).__init__(**kwargs)
         if not kwargs:
@@ -392,6 +443,8 @@ class VirtualSubject(Subject):
             self = self.load_from_dict(kwargs['data'])
         else:
             pass
+        if 'response_policy' in kwargs:
+            self.response_policy = kwargs['response_policy']
 
     def load_from_dict(self, data):
         self.virtual_version = Ver(data['virtual_version'])
@@ -401,6 +454,10 @@ class VirtualSubject(Subject):
         data = super(VirtualSubject,self).save_to_dict()
         return data
 
+    @property
+    def ver(self):
+        return self.virtual_version
+
     def __repr__(self):
         return "VirtualSubject with id:%s, rewarded at %s ms and punishment at %s ms" % (self.subject_id, self.reward, self.timeout)
 
@@ -466,6 +523,10 @@ class Human(Subject):
         data['anonymize'] = self.anonymize
         return data
 
+    @property
+    def ver(self):
+        return self.human_version
+
     def __repr__(self):
         return "Human (%s), rewarded at %s ms and punishment at %s ms" % (self.initials, self.reward, self.timeout)
 
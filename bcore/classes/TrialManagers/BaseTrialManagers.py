@@ -1,8 +1,20 @@
 from verlib import NormalizedVersion as Ver
 import numpy as np
 import psychopy.visual
+from bcore.classes.StimulusPool import StimulusPool, StimulusBank
 from psychopy.constants import (STARTED, PLAYING, PAUSED, FINISHED, STOPPED,
                                 NOT_STARTED, FOREVER)
+from bcore.classes.CompiledRecord import register_details_schema
+from bcore.classes.SessionLog import trial_key
+from bcore.classes.Schedule import BlockSchedule, subject_seed
+from bcore.classes.Distributions import Presampler
+from bcore.classes.TrialManagers.Instrumentation import FrameTimer, null_clock
+from bcore.classes.TrialManagers.PhaseSpec import compile_transitions, NO_TRANSITION, END_OF_TRIAL
+from bcore.classes.TrialManagers.SoundScheduler import SoundScheduler
+
+# frames a static phase is drawn on. two so that both buffers of a double
+# buffered window hold the phase before flips stop clearing them
+STATIC_DRAW_FRAMES = 2
 
 ################################# BASETRIALMANAGER ##################################
 class BaseTrialManager(object):
@@ -16,12 +28,44 @@ class BaseTrialManager(object):
                (4) try_something_else sound turns on when triggering port without a
                trasition target
                (5)
+        0.0.3: FrameTimer times the flips of every phase into phase_data
+        0.0.4: transitions are compiled into a TransitionTable once per trial
+        0.0.5: full screen and stim onset rects come from the station's
+               StimulusPool. the onset rect is drawn in marks_stim_onset phases
+        0.0.6: the next trial's phases are prefetched in the inter-trial phase.
+               cancel_prefetch rolls back its seeded draws
+        0.0.7: responses and rising edge times come from the station's PortSampler
+        0.0.8: pooled trial overlay. session trials from station.num_session_trials
+        0.0.9: phase loop sections are timed by the station's PhaseProfiler
+        0.0.10: sounds_played are played by a SoundScheduler
+        0.0.11: static phases are drawn once with render_static_phases_once
+        0.0.12: scheduled_condition draws conditions from a seeded BlockSchedule
+        0.0.13: sample_delay draws delays from a seeded Presampler
 
+        compiled_details_schema is a tuple of (name, dtype, source) declaring
+        the compiled_details columns for the trial manager. Subclasses that
+        set it are registered with the compiled record. See
+        CompiledRecord.DetailsSchema
     """
     _Phases = []
-    def __init__(self,draw_stim_onset_rect = False, iti=1.0, itl=(0., 0., 0.)):
-        self.ver = Ver('0.0.2')
+    _Prefetched = None
+    _Schedule = None
+    _Delays = None
+    delay_seed = None
+    compiled_details_schema = None
+    sound_scheduler = None
+
+    def __init_subclass__(cls, **kwargs):
+        super(BaseTrialManager, cls).__init_subclass__(**kwargs)
+        if cls.compiled_details_schema:
+            register_details_schema(cls.__name__, cls.compiled_details_schema)
+
+    def __init__(self,draw_stim_onset_rect = False, iti=1.0, itl=(0., 0., 0.), keep_frame_times=False, prefetch=False, sound_scheduler=None):
+        self.ver = Ver('0.0.13')
         self.draw_stim_onset_rect = draw_stim_onset_rect
+        self.sound_scheduler = sound_scheduler
+        self.keep_frame_times = keep_frame_times
+        self.prefetch = prefetch
         self.iti = iti
         if np.isscalar(itl):
             self.itl = itl*np.asarray([1,1,1]) # inter trial luminance as gray scale
@@ -35,14 +79,148 @@ class BaseTrialManager(object):
     def do_nothing_to_stim(stimulus,details):
         pass
 
+    @staticmethod
+    def _get_stimulus_pool(station):
+        if getattr(station, '_stimulus_pool', None) is None:
+            station._stimulus_pool = StimulusPool()
+        return station._stimulus_pool
+
+    @staticmethod
+    def _get_stimulus_bank(station):
+        if getattr(station, '_stimulus_bank', None) is None:
+            station._stimulus_bank = StimulusBank(capacity=getattr(station, 'stimulus_bank_capacity', 64))
+        return station._stimulus_bank
+
+    def full_screen_rect(self, station, fill_color=None):
+        """
+            full screen Rect from the station's StimulusPool. fill_color
+            defaults to the inter trial luminance
+        """
+        if fill_color is None:
+            fill_color = self.itl
+        return self._get_stimulus_pool(station).rect(station._window, width=station._window.size[0], height=station._window.size[1], fill_color=fill_color)
+
+    def setup_trial(self, trial_record, station, subject, **kwargs):
+        """
+            set up _Phases for trial_record. Phases prefetched during the
+            previous trial are used if they were made for this trial.
+            Otherwise _setup_phases is called
+        """
+        prefetched = self._Prefetched
+        if prefetched is not None and prefetched['key'] == trial_key(trial_record):
+            self._Prefetched = None
+            self._Phases = prefetched['phases']
+            trial_record.update(prefetched['trial_record'])
+            trial_record['prefetched'] = True
+        else:
+            self.cancel_prefetch()
+            self._setup_phases(trial_record=trial_record, station=station, subject=subject, **kwargs)
+            trial_record['prefetched'] = False
+
+    def prefetch_next_trial(self, station, subject, trial_record, compiled_record):
+        """
+            set up the phases of the trial after trial_record and keep them for
+            setup_trial. compiled_record does not include trial_record yet so
+            only use prefetch if the stimulus choice does not depend on the
+            outcome of the previous trial. _setup_phases runs while the
+            current trial is still in its iti so it should only make stimuli
+            and not change station state (e.g. rewind sounds)
+        """
+        next_record = {'session_number': trial_record['session_number'], 'trial_number': trial_record['trial_number']+1}
+        phases = self._Phases
+        random_state = self._get_random_state()
+        try:
+            self._setup_phases(trial_record=next_record, station=station, subject=subject, compiled_record=compiled_record)
+            self._Prefetched = {'key': trial_key(next_record),
+                                'phases': self._Phases,
+                                'trial_record': {k: v for k, v in next_record.items() if k not in ('session_number', 'trial_number')},
+                                'random_state': random_state}
+        except Exception:
+            self._set_random_state(random_state)
+            raise
+        finally:
+            self._Phases = phases
+
+    def cancel_prefetch(self):
+        """
+            drop prefetched phases. called when graduation or a step change
+            means the next trial will not be run by this trial manager.
+            Values drawn by the prefetch from the seeded schedule and delays
+            are put back so that the session stays reproducible
+        """
+        prefetched, self._Prefetched = self._Prefetched, None
+        if prefetched is not None:
+            self._set_random_state(prefetched['random_state'])
+
+    def _get_random_state(self):
+        # the BlockSchedule is indexed by trial_number so keeping the object is
+        # enough. the Presampler hands out values in order and is saved
+        delays = self._Delays
+        return (self._Schedule, delays, delays[1].get_state() if delays is not None else None)
+
+    def _set_random_state(self, random_state):
+        self._Schedule, self._Delays, presampler_state = random_state
+        if self._Delays is not None:
+            self._Delays[1].set_state(presampler_state)
+
+    def scheduled_condition(self, trial_record, subject, levels, repeats=1, seed=None):
+        """
+            row of level indices for trial_record from the BlockSchedule of the
+            session. levels is a list of (name, number of levels). The schedule
+            is made on the first trial of the trial manager in the session,
+            with a seed derived from seed, the subject and the session when
+            seed is given, and saved next to the session log. Conditions are
+            indexed by trial_number so set up of the same trial twice (e.g.
+            prefetch) gives the same condition
+        """
+        session_number = trial_record['session_number']
+        if self._Schedule is None or self._Schedule[0] != session_number:
+            if seed is not None and subject is not None:
+                seed = subject_seed(seed, subject.subject_id, session_number)
+            schedule = BlockSchedule(levels, repeats=repeats, seed=seed)
+            if subject is not None:
+                schedule.save(subject.get_session_schedule_path(session_number, self.name))
+            self._Schedule = (session_number, trial_record['trial_number'], schedule)
+        session_number, first_trial_number, schedule = self._Schedule
+        trial_record['schedule_index'] = trial_record['trial_number']-first_trial_number
+        return schedule[trial_record['schedule_index']]
+
+    def sample_delay(self, trial_record=None, subject=None):
+        """
+            next delay (seconds) from delay_distribution (see
+            Distributions.from_spec). Delays are drawn a batch at a time by a
+            Presampler that is made again when the session or delay_distribution
+            changes. Its seed is derived from delay_seed, the subject and the
+            session when all are given
+        """
+        session_number = trial_record['session_number'] if trial_record is not None else None
+        key = (session_number, self.delay_distribution)
+        if self._Delays is None or self._Delays[0] != key:
+            seed = self.delay_seed
+            if seed is not None and subject is not None and session_number is not None:
+                seed = subject_seed(seed, subject.subject_id, session_number)
+            self._Delays = (key, Presampler(self.delay_distribution, seed=seed))
+        return self._Delays[1].pop()
+
+    def trial_overlay(self, station):
+        """
+            TextStim in the top left corner for trial details. the same object
+            is reused every trial. set its text
+        """
+        return self._get_stimulus_pool(station).text(station._window, pos=(-0.99,0.99), units='norm', height=0.03, align_horiz='left', align_vert='top')
+
+    def stim_onset_rect(self, station):
+        """
+            photodiode patch drawn during stim phases when draw_stim_onset_rect
+        """
+        return self._get_stimulus_pool(station).rect(station._window, width=100, height=100, fill_color=(1,1,1), pos=(-300,-300), units='pix')
+
     def do_trial(self, station, subject, trial_record, compiled_record,quit):
         # returns quit and trial_record. Called by other trial managers
 
         from psychopy import logging
         logging.console.setLevel(logging.ERROR)
 
-        do_nothing = ()
-
         current_phase_num = 0
 
         # was on will be used to check for new responses
@@ -51,10 +229,21 @@ class BaseTrialManager(object):
         for port in all_ports:
             was_on[port] = False
 
+        # phase x event -> next phase. event 0 is running out of frames
+        transition_table = compile_transitions(self._Phases, all_ports)
+        port_codes = transition_table.port_codes
+        phase_frames = transition_table.frames.tolist()
+        phase_is_last = transition_table.is_last.tolist()
+
         # Zero out the trial clock
         trial_clock = station._clocks['trial_clock']
         trial_clock.reset()
 
+        # edges sampled off the render thread. drop those from before the trial
+        port_sampler = getattr(station, '_port_sampler', None)
+        if port_sampler is not None:
+            port_sampler.drain()
+
         trial_done = False
         error_out = False
 
@@ -77,15 +266,33 @@ class BaseTrialManager(object):
         transitioned_response_ended = True # did that previous transition end?
 
 
+        # flip times for every phase. frame_period from the window if psychopy measured it
+        frame_timer = FrameTimer(frame_period=getattr(station._window, 'monitorFramePeriod', 1./60.),
+                                 keep_frame_times=getattr(self, 'keep_frame_times', False))
+
+        if self.draw_stim_onset_rect:
+            stim_onset_rect = self.stim_onset_rect(station)
+
+        # plays the sounds_played of every phase
+        sound_scheduler = self.sound_scheduler if self.sound_scheduler is not None else SoundScheduler()
+
+        # per section timing of the phase loop. clock() is free when not profiling
+        profiler = getattr(station, '_phase_profiler', None)
+        clock = profiler.clock if profiler is not None else null_clock
+
+        # static phases stop drawing after STATIC_DRAW_FRAMES and flip without clearing
+        render_static_once = getattr(station, 'render_static_phases_once', False)
+
+        # the next trial is prefetched once, on the first frame of the inter-trial phase
+        prefetch_pending = getattr(self, 'prefetch', False)
+
         station.set_trial_pin_on()
         
         # text stim to denote trial
-        trial_number_text = psychopy.visual.TextStim(station._window,
-            text='trial_number::{0}, this_session::{1}, tm_name::{2}'.format(trial_record['trial_number'], 
-                                                                             np.sum(np.asarray(compiled_record['session_number'])==trial_record['session_number'])+1,
-                                                                             trial_record['trial_manager_name']), 
-            pos=(-0.99,0.99), units='norm', height=0.03,
-            alignHoriz='left',alignVert='top')
+        trial_number_text = self.trial_overlay(station)
+        trial_number_text.text = 'trial_number::{0}, this_session::{1}, tm_name::{2}'.format(trial_record['trial_number'],
+                                                                                           station.num_session_trials+1,
+                                                                                           trial_record['trial_manager_name'])
         
         ### loop into trial phases
         while not trial_done and not error_out and not quit:
@@ -93,41 +300,70 @@ class BaseTrialManager(object):
             phase = self._Phases[current_phase_num]
 
             # collect details about the phase
-            frames_until_transition = phase.frames_until_transition
+            frames_until_transition = phase_frames[current_phase_num]
             stim = phase.stimulus
             stim_details = phase.stimulus_details
-            transition = phase.transitions
-            if not transition:
-                is_last_phase = True
-            else:
-                is_last_phase = False
+            next_phase = transition_table.row(current_phase_num)
+            is_last_phase = phase_is_last[current_phase_num]
             auto_trigger = phase.auto_trigger
+            is_static = render_static_once and getattr(phase, 'is_static', False)
+            frames_to_draw = STATIC_DRAW_FRAMES if is_static else float('inf')
 
             # save relevant data into phase_data
             phase_data = {}
             phase_data['phase_name'] = phase.phase_name
             phase_data['phase_number'] = phase.phase_number
+            phase_data['phase_type'] = phase.phase_type
             phase_data['enter_time'] = trial_clock.getTime()
             phase_data['response'] = []
             phase_data['response_time'] = []
+            if port_sampler is not None:
+                phase_data['port_events'] = []
 
             # loop into phase
             phase_done = False
+            frame_timer.reset()
+            sound_scheduler.start_phase(phase.sounds_played, trial_clock)
+            t_enter = clock()
             trial_record = phase.on_enter(trial_record=trial_record, station=station)
+            station.on_phase_enter(phase=phase, phases=self._Phases, trial_record=trial_record)
+            if profiler is not None:
+                profiler.record(phase.phase_type, 'on_enter', clock()-t_enter)
             while not phase_done and not error_out and not quit:
                 # deal with sounds
-                if phase.sounds_played:
-                    for snd in phase.sounds_played:
-                        if snd.status==NOT_STARTED: snd.play()
+                t_sounds = clock()
+                sound_scheduler.update()
+                t_sounds_done = clock()
                 # deal with stim
-                if stim:
-                    stim.draw()
-                    if self.draw_stim_onset_rect and phase.phase_type=='stim':
-                        psychopy.visual.Rect(station._window,pos=(-300,-300),width=100,height=100,units='pix',fillColor=(1,1,1)).draw()
+                t_draw = clock()
+                redraw = frames_to_draw > 0
+                if redraw:
+                    if stim:
+                        stim.draw()
+                        if self.draw_stim_onset_rect and phase.marks_stim_onset:
+                            stim_onset_rect.draw()
+                    trial_number_text.draw()
+                t_draw_done = clock()
+                t_update = clock()
+                if stim and redraw:
                     phase.stimulus_update_fn(stim,stim_details)
-                trial_number_text.draw()
-                
-                phase.on_frame(station=station,trial_record=trial_record)
+                t_update_done = clock()
+                if redraw:
+                    frames_to_draw -= 1
+
+                t_flip = clock()
+                if is_static:
+                    phase.on_frame(station=station,trial_record=trial_record,clear_buffer=False)
+                else:
+                    phase.on_frame(station=station,trial_record=trial_record)
+                t_flip_done = clock()
+                frame_timer.record(trial_clock.getTime())
+                if prefetch_pending and phase.phase_type=='inter-trial':
+                    t_prefetch = clock()
+                    self.prefetch_next_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record)
+                    prefetch_pending = False
+                    if profiler is not None:
+                        profiler.record(phase.phase_type, 'prefetch', clock()-t_prefetch)
 
                 # look for responses
                 # (1) if no responses, only thing to do is stop the try_something_else_sound if its playing. then, switch off
@@ -139,15 +375,27 @@ class BaseTrialManager(object):
                 #        (except if the response is the ending of previous trigger)
                 #
                 response_led_to_transition = False
-                response = station.read_ports()
+                onset_times = {}
+                t_ports = clock()
+                if port_sampler is not None:
+                    port_events = port_sampler.drain()
+                    response = port_sampler.responses(port_events)
+                    for t, port, is_rising in port_events:
+                        if is_rising and port not in onset_times:
+                            onset_times[port] = t
+                    phase_data['port_events'].extend(port_events)
+                else:
+                    response = station.read_ports()
+                t_ports_done = clock()
                 if len(response)>1:
                     error_out = True
                     trial_record['errored_out'] = True
                     print('BASETRIALMANAGER:DO_TRIAL:errored out due to multiple responses')
                 elif len(response)==1:
                     response = response[0]
-                    if transition and response in transition:
-                        current_phase_num = transition[response]
+                    target = next_phase[port_codes[response]] if response in port_codes else NO_TRANSITION
+                    if target >= 0:
+                        current_phase_num = target
                         response_led_to_transition = True
                         response_that_led_to_transition = response
                         transitioned_response_ended = False # will flip to True the first time response_that_led_to_transition is no longer available
@@ -159,9 +407,10 @@ class BaseTrialManager(object):
                             try_something_else_sound_played_for = response
 
                     # logit but only if was_on wasnt already on. thus only response onsets are measured.
-                    if not was_on[response]:
+                    # a rising edge since the last frame is an onset even if the port looked on throughout
+                    if not was_on[response] or response in onset_times:
                         phase_data['response'].append(response)
-                        phase_data['response_time'].append(trial_clock.getTime())
+                        phase_data['response_time'].append(onset_times.get(response, trial_clock.getTime()))
                     was_on[response] = True # flip was on to true after we used it to check for new events
                 else:
                     # try somethign else has to go through a no_response phase otherwise, it will error out!!
@@ -178,33 +427,43 @@ class BaseTrialManager(object):
                 frames_until_transition = frames_until_transition-1
                 frames_led_to_transition = False
                 autotrigger_led_to_transition = False
-                if frames_until_transition==0 and transition and do_nothing in transition:
+                if frames_until_transition==0 and next_phase[0] >= 0:
                     frames_led_to_transition = True
-                    current_phase_num = transition[do_nothing]
-                elif frames_until_transition==0 and transition is None:
+                    current_phase_num = next_phase[0]
+                elif frames_until_transition==0 and next_phase[0] == END_OF_TRIAL:
                     current_phase_num = None
                     phase_done = True
                     trial_done = True
                     print('BASETRIALMANAGER:DO_TRIAL:end of trial')
-                else:
-                    RuntimeError("transition cannot have frames go to zero without a do_nothing possibility")
                 if frames_led_to_transition or response_led_to_transition:
                     phase_done = True
+                t_quit = clock()
                 manual_quit = station.check_manual_quit()
+                t_quit_done = clock()
+                if profiler is not None:
+                    profiler.record_frame(phase.phase_type, (t_sounds, t_sounds_done, t_draw, t_draw_done, t_update, t_update_done,
+                                                             t_flip, t_flip_done, t_ports, t_ports_done))
+                    profiler.record(phase.phase_type, 'check_manual_quit', t_quit_done-t_quit)
                 if manual_quit:
                     print('BASETRIALMANAGER:DO_TRIAL:manual quit')
                     trial_record['manual_quit'] = True
                     trial_record['correct'] = None
                 quit = quit or manual_quit
 
-                if (phase_done or quit) and phase.sounds_played:
-                    for snd in phase.sounds_played: snd.stop()
+                if phase_done or quit:
+                    sound_scheduler.stop()
 
+            if is_static:
+                # the next phase should not draw over the kept frame
+                station._window.clearBuffer()
             trial_record = phase.on_exit(trial_record=trial_record, station=station)
+            phase_data.update(frame_timer.summary())
             trial_record['phase_data'].append(phase_data)
 
             # when do we quit the trial? trial_done only when last phase
             # but we can exit if manual_quit or errored out
             if is_last_phase: trial_done = True
+        if quit or error_out:
+            self.cancel_prefetch()
         station.set_trial_pin_off()
         return trial_record,quit
@@ -1,19 +1,64 @@
-class ExampleTrialManager(object):
+from verlib import NormalizedVersion as Ver
+import bcore.classes.TrialManagers.PhaseSpec as ps
+import bcore.classes.TrialManagers.BaseTrialManagers as btm
+import bcore.classes.ReinforcementManager as reinfmgr
+import random
+import numpy as np
+import psychopy.visual
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+class ExampleTrialManager(btm.BaseTrialManager):
     """
         EXAMPLETRIALMANAGER defines a standard trial manager
             input_feature_1
             input_feature_2
+        Trial managers only set up _Phases. The phase loop is
+        BaseTrialManager.do_trial
+
+        VERSION HISTORY:
+        0.0.1 : Initial design
+        0.0.2 : subclass of BaseTrialManager. phases are zero-indexed
     """
     _Phases = []
     _trial_specific_details_1 = []
     _trial_specific_details_1 = []
+    # (name, dtype, source in trial_record) for each compiled_details column
+    compiled_details_schema = (('deg_per_cyc', 'float64', 'chosen_stim.deg_per_cyc'),
+                               ('orientation', 'float64', 'chosen_stim.orientation'),
+                               ('contrast', 'float64', 'chosen_stim.contrast'),
+                               ('duration', 'float64', 'chosen_stim.duration'),
+                               ('Hz', 'int64', 'chosen_stim.Hz'),)
+    # the grating shown for each target port. a real trial manager would
+    # take these as parameters (see GratingsTrialManagers.Gratings2AFC)
+    deg_per_cycs = {'left_port':[10],'right_port':[10]}
+    orientations = {'left_port':[-np.pi / 4], 'right_port':[np.pi / 4]}
+    drift_frequencies = {'left_port':[0],'right_port':[0]}
+    phases = {'left_port':[0.],'right_port':[0.]}
+    contrasts = {'left_port':[1],'right_port':[1]}
+    durations = {'left_port':[float('Inf')],'right_port':[float('Inf')]}
+    locations = {'left_port':[(0.5,0.5)],'right_port':[(0.5,0.5)]}
+    radii = {'left_port':[40],'right_port':[40]}
+    radius_type = 'Circular'
 
     def __init__(self,
                  name = 'DemoExampleTrialManager',
                  input_feature_1 = 'default1',
                  input_feature_2 = 'default2',
+                 iti = 1.,
+                 itl = 0.,
+                 draw_stim_onset_rect = True,
+                 reinforcement_manager = reinfmgr.NoReinforcement(),
                  **kwargs):
-        self.ver = Ver('0.0.1')
+        super(ExampleTrialManager,self).__init__(iti=iti,itl=itl,draw_stim_onset_rect=draw_stim_onset_rect)
+        self.ver = Ver('0.0.2')
         self.name = name
         self.reinforcement_manager = reinforcement_manager
 
@@ -28,7 +73,7 @@ class ExampleTrialManager(object):
         assert self.input_feature_2=='default2','EXAMPLETRIALMANAGER::INIT::input_feature_2 is incorrect'
         
     @property
-    def n_afc():
+    def n_afc(self):
         return len(self.deg_per_cycs)
 
     @staticmethod
@@ -57,145 +102,19 @@ class ExampleTrialManager(object):
             trial_record['errored_out'] = True
             return trial_record,quit
 
-
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
         station._key_pressed = []
 
-        current_phase_num = 0
-
-        # was on will be used to check for new responses
-        was_on = {'L':False, 'C': False, 'R':False}
-
-        # Zero out the trial clock
-        trial_clock = station._clocks['trial_clock']
-        trial_clock.reset()
-
-        trial_done = False
-        error_out = False
-
-        trial_record['errored_out'] = False
-        trial_record['manual_quit'] = False
-
-
-        trial_record['reinforcement_manager_name'] = self.reinforcement_manager.name
-        trial_record['reinforcement_manager_class'] = self.reinforcement_manager.__class__.__name__
-        trial_record['reinforcement_manager_version_number'] = self.reinforcement_manager.ver.__str__()
-
-        trial_record['phase_data'] = []
-
-        station.set_trial_pin_on()
-        ### loop into trial phases
-        while not trial_done and not error_out and not quit:
-            # current_phase_num determines the phase
-            phase = self._Phases[current_phase_num]
-
-            # collect details about the phase
-            frames_until_transition = phase.frames_until_transition
-            stim = phase.stimulus
-            stim_details = phase.stimulus_details
-            transition = phase.transitions
-            if not transition:
-                is_last_phase = True
-            else:
-                is_last_phase = False
-            auto_trigger = phase.auto_trigger
-            if phase.sounds_played:
-                sound = phase.sounds_played[0]
-                sound_duration = phase.sounds_played[1]
-                sound.seek(0.)
-                sound_started = False
-                sound_done = False
-                sound_timer = psychopy.core.CountdownTimer(sound_duration)
-            else:
-                sound = None
-
-            # save relevant data into phase_data
-            phase_data = {}
-            phase_data['phase_name'] = phase.phase_name
-            phase_data['phase_number'] = phase.phase_number
-            phase_data['enter_time'] = trial_clock.getTime()
-            phase_data['response'] = []
-            phase_data['response_time'] = []
-
-            # loop into phase
-            phase_done = False
-            trial_record = phase.on_enter(trial_record=trial_record, station=station)
-            while not phase_done and not error_out and not quit:
-                # deal with sounds
-                if sound:
-                    if not sound_started:
-                        sound.play()
-                        sound_timer.reset()
-                        sound_started = True
-
-                    if sound_timer.getTime() <0 and not sound_done:
-                        sound.stop()
-                        sound_done = True
-
-                # deal with stim
-                if stim:
-                    stim.draw()
-                    if phase.phase_name=='stim':
-                        psychopy.visual.Rect(station._window,pos=(-300,-300),width=100,height=100,units='pix',fillColor=(1,1,1)).draw()
-                    phase.stimulus_update_fn(stim,stim_details)
-                phase.on_frame(station=station,trial_record=trial_record)
-
-                # look for responses
-                response_led_to_transition = False
-                response = station.read_ports()
-                if len(response)>1:
-                    error_out = True
-                    trial_record['errored_out'] = True
-                elif len(response)==1:
-                    response = response[0]
-                    try:
-                        current_phase_num = transition[response] - 1
-                        response_led_to_transition = True
-                    except KeyError:
-                        response_led_to_transition = False # that phase did not have a transition for that response
-                    except TypeError:
-                        assert is_last_phase, 'No reason why it should come here otherwise'
-                    finally:
-                        # logit but only if was_on wasnt already on
-                        if not was_on[response]:
-                            phase_data['response'].append(response)
-                            phase_data['response_time'].append(trial_clock.getTime())
-                    was_on[response] = True # flip was on to true after we used it to check for new events
-                else:
-                    pass
-
-                # update the frames_until_transition and check if the phase is done
-                # phase is done when there are no more frames in the phase or is we flipped due to transition
-                # however we can stop playing the phase because we manual_quit or because we errored out
-                frames_until_transition = frames_until_transition-1
-                frames_led_to_transition = False
-                if frames_until_transition==0:
-                    frames_led_to_transition = True
-                    if transition: current_phase_num = transition[None] - 1
-                    else: current_phase_num = None # the last phase has no
-
-                if frames_led_to_transition or response_led_to_transition:
-                    phase_done = True
-                manual_quit = station.check_manual_quit()
-                if manual_quit:
-                    trial_record['manual_quit'] = True
-                    trial_record['correct'] = None
-                quit = quit or manual_quit
-            trial_record = phase.on_exit(trial_record=trial_record, station=station)
-            trial_record['phase_data'].append(phase_data)
-
-            # when do we quit the trial? trial_done only when last phjase
-            # but we can exit if manual_quit or errored out
-            if is_last_phase: trial_done = True
-        station.set_trial_pin_off()
+        # the phase loop is BaseTrialManager.do_trial
+        trial_record,quit = super(ExampleTrialManager,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
         return trial_record,quit
 
     def calc_stim(self, trial_record, station, **kwargs):
         (H, W, Hz) = self.choose_resolution(station=station, **kwargs)
         resolution = (H,W,Hz)
-        all_ports = ('L','C','R')
-        request_port = 'C'
+        all_ports = ('left_port','center_port','right_port')
+        request_port = 'center_port'
         response_ports = tuple(np.setdiff1d(all_ports,request_port))
         target_port = np.random.choice(response_ports)
         distractor_port = tuple(np.setdiff1d(response_ports,target_port))
@@ -218,7 +137,8 @@ class ExampleTrialManager(object):
 
         trial_record['chosen_stim'] = stimulus
 
-        frames_total = round(Hz*stimulus['duration'])
+        # an infinite duration shows the stimulus until there is a response
+        frames_total = round(Hz*stimulus['duration']) if np.isfinite(stimulus['duration']) else float('inf')
 
         port_details = {}
         port_details['request_port'] = request_port
@@ -235,7 +155,7 @@ class ExampleTrialManager(object):
 
     def _setup_phases(self, trial_record, station, subject, **kwargs):
         """
-        AFCGratings:_setup_phases
+        ExampleTrialManager:_setup_phases
         1. Pre-trial: gray screen. REQUEST_PORT -> 2
         2. Stimulus: Grating stimulus. RESPONSE_PORT==TARGET_PORT -> CORRECT, else PUNISH
         3. Correct: Give reward
@@ -244,11 +164,12 @@ class ExampleTrialManager(object):
         """
         (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station)
         hz = resolution[2]
-        if port_details['target_port'] == 'L':
+        do_nothing = ()
+        if port_details['target_port'] == 'left_port':
             reward_valve = 'left_valve'
-        elif port_details['target_port'] == 'R':
+        elif port_details['target_port'] == 'right_port':
             reward_valve = 'right_valve'
-        elif port_details['target_port'] == 'C':
+        elif port_details['target_port'] == 'center_port':
             reward_valve = 'center_valve'
 
         if stimulus_details['duration']==float('inf'):
@@ -263,12 +184,13 @@ class ExampleTrialManager(object):
         request_reward_size = np.round(request_reward_size/1000*60)
         penalty_size = np.round(ms_penalty/1000*60)
         if do_post_discrim_stim:
-            self._Phases.append(PhaseSpec(
-                phase_number=1,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.PhaseSpec(
+                phase_number=0,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['request_port']: 2},
+                transitions={port_details['request_port']: 1},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='pre-request',
@@ -276,49 +198,53 @@ class ExampleTrialManager(object):
                 hz=hz,
                 sounds_played=(station._sounds['trial_start_sound'], 0.050)))
             if self.radius_type=='Gaussian':
-                self._Phases.append(PhaseSpec(
-                    phase_number=2,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=AFCGratings.update_stimulus,
+                self._Phases.append(ps.PhaseSpec(
+                    phase_number=1,
+                    stimulus=station.make_stimulus(psychopy.visual.GratingStim,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
+                    stimulus_update_fn=ExampleTrialManager.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={None: 3, port_details['target_port']: 4, port_details['distractor_port']: 5},
+                    transitions={do_nothing: 2, port_details['target_port']: 3, port_details['distractor_port']: 4},
                     frames_until_transition=frames_total,
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             else:
-                self._Phases.append(PhaseSpec(
-                    phase_number=2,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='circle',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=AFCGratings.update_stimulus,
+                self._Phases.append(ps.PhaseSpec(
+                    phase_number=1,
+                    stimulus=station.make_stimulus(psychopy.visual.GratingStim,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='circle',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
+                    stimulus_update_fn=ExampleTrialManager.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={None: 3, port_details['target_port']: 4, port_details['distractor_port']: 5},
+                    transitions={do_nothing: 2, port_details['target_port']: 3, port_details['distractor_port']: 4},
                     frames_until_transition=frames_total,
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
-            self._Phases.append(PhaseSpec(
-                phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.PhaseSpec(
+                phase_number=2,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['target_port']: 4, port_details['distractor_port']: 5},
+                transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='post-stimulus',
                 phase_name='post-stim',
                 hz=hz,
                 sounds_played=None))
-            self._Phases.append(RewardPhaseSpec(
-                phase_number=4,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.RewardPhaseSpec(
+                phase_number=3,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 6},
+                transitions={do_nothing: 5},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -326,23 +252,25 @@ class ExampleTrialManager(object):
                 hz=hz,
                 sounds_played=(station._sounds['correct_sound'], ms_reward_sound/1000),
                 reward_valve=reward_valve))
-            self._Phases.append(PunishmentPhaseSpec(
-                phase_number=5,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(0.,0.,0.,),autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.PunishmentPhaseSpec(
+                phase_number=4,
+                stimulus=self.full_screen_rect(station, fill_color=(0.,0.,0.)),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 6},
+                transitions={do_nothing: 5},
                 frames_until_transition=penalty_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
                 phase_name='punishment',
                 hz=hz,
                 sounds_played=(station._sounds['punishment_sound'],ms_penalty_sound/1000)))
-            self._Phases.append(PhaseSpec(
-                phase_number=6,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            self._Phases.append(ps.PhaseSpec(
+                phase_number=5,
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -351,12 +279,13 @@ class ExampleTrialManager(object):
                 hz=hz,
                 sounds_played=(station._sounds['trial_end_sound'], 0.050)))
         else:
-            self._Phases.append(PhaseSpec(
-                phase_number=1,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.PhaseSpec(
+                phase_number=0,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['request_port']: 2},
+                transitions={port_details['request_port']: 1},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='pre-request',
@@ -364,37 +293,40 @@ class ExampleTrialManager(object):
                 hz=hz,
                 sounds_played=(station._sounds['trial_start_sound'], 0.050)))
             if self.radius_type=='Gaussian':
-                self._Phases.append(PhaseSpec(
-                    phase_number=2,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=AFCGratings.update_stimulus,
+                self._Phases.append(ps.PhaseSpec(
+                    phase_number=1,
+                    stimulus=station.make_stimulus(psychopy.visual.GratingStim,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
+                    stimulus_update_fn=ExampleTrialManager.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
+                    transitions={port_details['target_port']: 2, port_details['distractor_port']: 3},
                     frames_until_transition=float('inf'),
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             else:
-                self._Phases.append(PhaseSpec(
-                    phase_number=2,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='circle',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=AFCGratings.update_stimulus,
+                self._Phases.append(ps.PhaseSpec(
+                    phase_number=1,
+                    stimulus=station.make_stimulus(psychopy.visual.GratingStim,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='circle',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
+                    stimulus_update_fn=ExampleTrialManager.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
+                    transitions={port_details['target_port']: 2, port_details['distractor_port']: 3},
                     frames_until_transition=float('inf'),
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
-            self._Phases.append(RewardPhaseSpec(
-                phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.RewardPhaseSpec(
+                phase_number=2,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 5},
+                transitions={do_nothing: 4},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -402,23 +334,25 @@ class ExampleTrialManager(object):
                 hz=hz,
                 sounds_played=(station._sounds['correct_sound'], ms_reward_sound/1000),
                 reward_valve=reward_valve))
-            self._Phases.append(PunishmentPhaseSpec(
-                phase_number=4,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(0,0,0,),autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+            self._Phases.append(ps.PunishmentPhaseSpec(
+                phase_number=3,
+                stimulus=self.full_screen_rect(station, fill_color=(0.,0.,0.)),
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 5},
+                transitions={do_nothing: 4},
                 frames_until_transition=penalty_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
                 phase_name='punishment',
                 hz=hz,
                 sounds_played=(station._sounds['punishment_sound'],ms_penalty_sound/1000)))
-            self._Phases.append(PhaseSpec(
-                phase_number=5,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            self._Phases.append(ps.PhaseSpec(
+                phase_number=4,
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus_update_fn=ExampleTrialManager.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -429,76 +363,8 @@ class ExampleTrialManager(object):
 
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardKeyboardStation']:
+        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardKeyboardStation','SimulatedStation']:
             return True
         else:
             return False
 
-    def trial_compiler(self, compiled_record, trial_record):
-        try:
-            compiled_details = compiled_record['compiled_details']['AFCGratings']
-        except KeyError:
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['location'] = []
-            compiled_details['radius'] = []
-            compiled_details['radius_type'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # specific to animal responses
-            compiled_details['request_time'] = [] # time from trial start to center request
-            compiled_details['response_time'] = [] # time from request to response
-            compiled_details['request_lick_timings'] = []
-            compiled_details['response_lick_timings_prev_trial'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['Gratings'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append(self.radius_type)
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        # animal response data compilation
-        phase_data = trial_record['phase_data']
-        phase_types = np.asarray([p['phase_type'] for p in phase_data])
-        pre_req_phase_num = np.argwhere(phase_types=='pre-request')
-        stim_phase_num = np.argwhere(phase_types=='stimulus')
-        reinf_phase_num = np.argwhere(phase_types=='reinforcement')
-        # request_time is time from TRIAL_START to 'stim' phase enter_time
-        compiled_details['request_time'].append(phase_data[stim_phase_num]['enter_time'])
-        # resonse_time is time from 'stim' phase enter_time to 'reinforcement' phase enter time
-        compiled_details['response_time'].append(phase_data[reinf_phase_num]['enter_time']-phase_data[stim_phase_num]['enter_time'])
-        # request_lick_timings are 'C' licks in the stim_phase
-        lick_loc = np.asarray(phase_data[stim_phase_num]['response'])
-        lick_times = np.asarray(phase_data[stim_phase_num]['response_time'])
-        which_licks = np.argwhere(lick_loc=='C')
-        compiled_details['request_lick_timings'].append(lick_times[which_licks])
-        # response_lick_timings_prev_trial are non 'C' licks in the pre_req_phase_num
-        lick_loc = np.asarray(phase_data[pre_req_phase_num]['response'])
-        lick_times = np.asarray(phase_data[pre_req_phase_num]['response_time'])
-        which_licks = np.argwhere(lick_loc!='C')
-        compiled_details['response_lick_timings_prev_trial'].append(lick_times[which_licks])
-
-
-
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
-
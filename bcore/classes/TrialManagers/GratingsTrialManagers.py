@@ -2,9 +2,11 @@ from verlib import NormalizedVersion as Ver
 import bcore.classes.TrialManagers.PhaseSpec as ps
 import bcore.classes.TrialManagers.BaseTrialManagers as btm
 import bcore.classes.ReinforcementManager as reinfmgr
+import bcore.classes.Distributions as dist
 import bcore.classes.Station as st
 import psychopy
 import random
+import itertools
 import numpy as np
 import psychopy.visual,psychopy.core
 from psychopy.constants import (STARTED, PLAYING, PAUSED, FINISHED, STOPPED, NOT_STARTED, FOREVER)
@@ -22,6 +24,151 @@ __status__ = "Production"
     1. All Ver should be inside the init - Keeping it outside make them irrelevant
     2. Figure out a way to send subject into _setup_phases. Need it for reward and timeout values
 """
+# compiled_details columns shared by the gratings trial managers. see
+# BaseTrialManager.compiled_details_schema
+GRATINGS_DETAILS_SCHEMA = (('deg_per_cyc', 'float64', 'chosen_stim.deg_per_cyc'),
+                           ('orientation', 'float64', 'chosen_stim.orientation'),
+                           ('drift_frequency', 'float64', 'chosen_stim.drift_frequency'),
+                           ('phase', 'float64', 'chosen_stim.phase'),
+                           ('contrast', 'float64', 'chosen_stim.contrast'),
+                           ('duration', 'float64', 'chosen_stim.duration'),
+                           ('radius', 'float64', 'chosen_stim.radius'),
+                           ('radius_type', 'U16', 'chosen_stim.radius_type'),
+                           ('location_x', 'float64', 'chosen_stim.location.0'),
+                           ('location_y', 'float64', 'chosen_stim.location.1'),
+                           ('H', 'int64', 'chosen_stim.H'),
+                           ('W', 'int64', 'chosen_stim.W'),
+                           ('Hz', 'int64', 'chosen_stim.Hz'),)
+
+
+# (stimulus field, trial manager parameter) drawn for every trial. see calc_stim
+GRATINGS_LEVELS = (('deg_per_cyc', 'deg_per_cycs'),
+                   ('orientation', 'orientations'),
+                   ('drift_frequency', 'drift_frequencies'),
+                   ('phase', 'phases'),
+                   ('contrast', 'contrasts'),
+                   ('duration', 'durations'),
+                   ('radius', 'radii'),)
+AFC_GRATINGS_LEVELS = GRATINGS_LEVELS + (('location', 'locations'),)
+
+
+def afc_schedule_levels(trial_manager, response_ports):
+    # BlockSchedule levels for trial managers with a parameter list per port
+    levels = [('target_port', len(response_ports))]
+    for field, param in AFC_GRATINGS_LEVELS:
+        sizes = set(len(getattr(trial_manager, param)[port]) for port in response_ports)
+        assert len(sizes)==1, 'GRATINGSTRIALMANAGERS:AFC_SCHEDULE_LEVELS::%s need as many values for every port to be block randomized' % param
+        levels.append((field, sizes.pop()))
+    return levels
+
+
+def grating_grid(trial_manager):
+    # (deg_per_cyc, orientation, contrast, radius) combinations of the
+    # parameter lists. for parameters keyed by port (or 'G'/'N') the
+    # combinations for every key
+    params = (trial_manager.deg_per_cycs, trial_manager.orientations, trial_manager.contrasts, trial_manager.radii)
+    if isinstance(trial_manager.deg_per_cycs, dict):
+        return itertools.chain.from_iterable(itertools.product(*[param[key] for param in params]) for key in trial_manager.deg_per_cycs)
+    return itertools.product(*params)
+
+
+def make_grating(trial_manager, station, stimulus_details, mask=None):
+    """
+        GratingStim for stimulus_details. With trial_manager.bank_stimuli the
+        gratings for every combination in grating_grid are made on the first
+        trial of the session and later trials look them up in the station's
+        StimulusBank
+    """
+    def make(key):
+        win_id, mask, deg_per_cyc, orientation, contrast, radius = key
+        return station.make_stimulus(psychopy.visual.GratingStim,tex='sin',sf=deg_per_cyc,size=radius,ori=orientation,phase=0.,contrast=contrast,units='deg',mask=mask,autoLog=False)
+
+    key = (id(station._window), mask, stimulus_details['deg_per_cyc'], stimulus_details['orientation'], stimulus_details['contrast'], stimulus_details['radius'])
+    if not getattr(trial_manager, 'bank_stimuli', False):
+        stim = make(key)
+    else:
+        bank = trial_manager._get_stimulus_bank(station)
+        bank.precompile(id(trial_manager), (key[:2]+params for params in grating_grid(trial_manager)), make)
+        stim = bank.get(key, make)
+    # banked gratings keep the phase they drifted to
+    stim.phase = stimulus_details['phase']
+    return stim
+
+
+def phase_enter_time(trial_record, phase_type):
+    # enter_time of the first phase of phase_type in the trial
+    for phase_data in trial_record.get('phase_data', []):
+        if phase_data.get('phase_type', None) == phase_type:
+            return phase_data['enter_time']
+    return None
+
+
+def request_time(trial_record):
+    # time from trial start to the 'stimulus' phase
+    return phase_enter_time(trial_record, 'stimulus')
+
+
+def response_time(trial_record):
+    # time from the 'stimulus' phase to the 'reinforcement' phase
+    stim_time = phase_enter_time(trial_record, 'stimulus')
+    reinf_time = phase_enter_time(trial_record, 'reinforcement')
+    if stim_time is None or reinf_time is None:
+        return None
+    return reinf_time-stim_time
+
+# drift trajectories are precomputed for at most this many frames (5 min at 60 Hz).
+# later frames are computed when they are needed
+MAX_DRIFT_TRAJECTORY_FRAMES = 18000
+
+
+class DriftTrajectory(object):
+    """
+        DRIFTTRAJECTORY holds the phase of a drifting grating on every frame,
+        computed once when the stimulus is chosen. next_phase() is called by
+        update_stimulus after the stimulus is drawn and returns the phase for
+        the next flip. The frame is found from the time since the first call
+        when there is a clock so that dropped frames do not slow the drift.
+            phase               : phase on the first frame (cycles)
+            drift_frequency     : cycles per second
+            hz                  : frames per second
+            num_frames          : frames precomputed
+            clock               : psychopy clock. frames are counted if None
+    """
+
+    def __init__(self, phase, drift_frequency, hz, num_frames, clock=None):
+        self.phase = float(phase)
+        self.drift_frequency = float(drift_frequency)
+        self.hz = float(hz)
+        self.clock = clock
+        self.phases = (self.phase+self.drift_frequency*np.arange(num_frames)/self.hz) % 1.
+        self._frame = 0
+        self._t0 = None
+
+    def __repr__(self):
+        return "DriftTrajectory object with %d frames at %s Hz" % (len(self.phases), self.hz)
+
+    def next_phase(self):
+        if self.clock is None:
+            self._frame += 1
+        else:
+            t = self.clock.getTime()
+            if self._t0 is None:
+                self._t0 = t
+            self._frame = int(round((t-self._t0)*self.hz))+1
+        if self._frame < len(self.phases):
+            return self.phases[self._frame]
+        return (self.phase+self.drift_frequency*self._frame/self.hz) % 1.
+
+
+def drift_trajectory(stimulus, station):
+    # DriftTrajectory for the stimulus chosen by calc_stim. None if it does not drift
+    if stimulus['drift_frequency'] == 0:
+        return None
+    num_frames = min(stimulus['Hz']*stimulus['duration'], MAX_DRIFT_TRAJECTORY_FRAMES)
+    clocks = getattr(station, '_clocks', None)
+    return DriftTrajectory(stimulus['phase'], stimulus['drift_frequency'], stimulus['Hz'], int(np.ceil(num_frames)),
+                           clock=clocks['trial_clock'] if clocks else None)
+
 ##########################################################################################
 ##########################################################################################
 ######################### GRATINGS TRIAL MANAGERS - SHOWS ################################
@@ -39,10 +186,21 @@ class Gratings(btm.BaseTrialManager):
             contrasts
             durations
             radii
+            bank_stimuli    : reuse one GratingStim per combination of
+                              deg_per_cycs, orientations, contrasts and radii
+                              from the station's StimulusBank
+            block_randomize : draw the parameters from a BlockSchedule with
+                              every combination block_repeats times per block
+                              instead of independently on every trial
+            schedule_seed   : schedules are seeded from schedule_seed, the
+                              subject and the session. new seeds if None
 
     """
     _Cached_Stimuli = None
-    _compiler = None
+    radius_type = 'None'
+    # mask of the GratingStim. subclasses set it for their edge
+    grating_mask = None
+    compiled_details_schema = GRATINGS_DETAILS_SCHEMA
 
     def __init__(self,
                  name,
@@ -56,11 +214,20 @@ class Gratings(btm.BaseTrialManager):
                  iti=1., #seconds
                  itl=0., #inter trial luminance
                  reinforcement_manager=reinfmgr.NoReinforcement(),
+                 prefetch=False, #set up the next trial during the iti
+                 bank_stimuli=False, #make each grating once per session
+                 block_randomize=False, #counterbalance parameters in blocks
+                 block_repeats=1,
+                 schedule_seed=None,
                  **kwargs):
-        super(Gratings,self).__init__(iti=iti, itl=itl)
+        super(Gratings,self).__init__(iti=iti, itl=itl, prefetch=prefetch)
         self.ver = Ver('0.0.1')
         self.reinforcement_manager = reinforcement_manager
         self.name = name
+        self.bank_stimuli = bank_stimuli
+        self.block_randomize = block_randomize
+        self.block_repeats = block_repeats
+        self.schedule_seed = schedule_seed
         self.deg_per_cycs = deg_per_cycs
         self.orientations = orientations
         self.drift_frequencies = drift_frequencies
@@ -81,13 +248,20 @@ class Gratings(btm.BaseTrialManager):
 
         # select from values
         stimulus = dict()
-        stimulus['deg_per_cyc'] = random.choice(self.deg_per_cycs)
-        stimulus['orientation'] = random.choice(self.orientations)
-        stimulus['drift_frequency'] = random.choice(self.drift_frequencies)
-        stimulus['phase'] = random.choice(self.phases)
-        stimulus['contrast'] = random.choice(self.contrasts)
-        stimulus['duration'] = random.choice(self.durations)
-        stimulus['radius'] = random.choice(self.radii)
+        if getattr(self, 'block_randomize', False):
+            levels = [(field, len(getattr(self, param))) for field, param in GRATINGS_LEVELS]
+            condition = self.scheduled_condition(trial_record, kwargs.get('subject', None), levels, repeats=self.block_repeats, seed=self.schedule_seed)
+            for field, param in GRATINGS_LEVELS:
+                stimulus[field] = getattr(self, param)[condition[field]]
+        else:
+            stimulus['deg_per_cyc'] = random.choice(self.deg_per_cycs)
+            stimulus['orientation'] = random.choice(self.orientations)
+            stimulus['drift_frequency'] = random.choice(self.drift_frequencies)
+            stimulus['phase'] = random.choice(self.phases)
+            stimulus['contrast'] = random.choice(self.contrasts)
+            stimulus['duration'] = random.choice(self.durations)
+            stimulus['radius'] = random.choice(self.radii)
+        stimulus['radius_type'] = self.radius_type
         stimulus['H'] = H
         stimulus['W'] = W
         stimulus['Hz'] = Hz
@@ -96,6 +270,9 @@ class Gratings(btm.BaseTrialManager):
 
         frames_total = round(Hz*stimulus['duration'])
 
+        # the drift trajectory is for the phase loop. it is not logged
+        stimulus = dict(stimulus, drift_phases=drift_trajectory(stimulus, station))
+
         port_details = {}
         port_details['target_ports'] = None
         port_details['distractor_ports'] = station.get_ports()
@@ -116,20 +293,15 @@ class Gratings(btm.BaseTrialManager):
         phase. Rewards may be provided and licks are recorded. There is no
         concept of punishment
         """
-        (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station)
+        (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station, subject=subject)
         hz = resolution[2]
         reward_size, request_reward_size, ms_penalty, ms_reward_sound, ms_penalty_sound = self.reinforcement_manager.calculate_reinforcement(subject=subject)
         reward_size = np.round(reward_size/1000*hz)
 
-        # sounds
-        trial_start_sound = station._sounds['trial_start_sound']
-        trial_start_sound.secs = 0.1
-        trial_start_sound.seek(0.)
-        trial_start_sound.status= NOT_STARTED
-        reward_sound = station._sounds['reward_sound']
-        reward_sound.secs = 0.1
-        reward_sound.seek(0.)
-        reward_sound.status = NOT_STARTED
+        # sounds are rewound by the SoundScheduler when their phase starts. setting
+        # them up here would change them while a prefetch runs in the iti
+        trial_start_sound = (station._sounds['trial_start_sound'], 0.1)
+        reward_sound = (station._sounds['reward_sound'], 0.1)
 
         self._Phases = []
         # Just display stim
@@ -138,7 +310,7 @@ class Gratings(btm.BaseTrialManager):
         # the stimulus
         self._Phases.append(ps.StimPhaseSpec(
             phase_number=0,
-            stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',mask=None,autoLog=False),
+            stimulus=make_grating(self, station, stimulus_details, mask=self.grating_mask),
             stimulus_update_fn=Gratings.update_stimulus,
             stimulus_details=stimulus_details,
             transitions={do_nothing: 1},
@@ -147,7 +319,7 @@ class Gratings(btm.BaseTrialManager):
             phase_type='stimulus',
             phase_name='stim',
             hz=hz,
-            sounds_played=[trial_start_sound],
+            sounds_played=trial_start_sound,
             is_last_phase=False))
 
         # reward if its provided
@@ -155,9 +327,10 @@ class Gratings(btm.BaseTrialManager):
             # pre-reward
             self._Phases.append(ps.PhaseSpec(
                 phase_number=1,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
                 stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+                is_static=True,
                 transitions={do_nothing: 2},
                 frames_until_transition=6, # 6 frames to make the sound finish before reward
                 auto_trigger=False,
@@ -169,23 +342,25 @@ class Gratings(btm.BaseTrialManager):
             # reward
             self._Phases.append(ps.RewardPhaseSpec(
                 phase_number=2,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
                 stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+                is_static=True,
                 transitions={do_nothing: 3},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reward',
                 phase_name='reward_phase',
                 hz=hz,
-                sounds_played=[reward_sound],
+                sounds_played=reward_sound,
                 reward_valve='reward_valve'))
             # itl
             self._Phases.append(ps.PhaseSpec(
                 phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(self.itl),autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
                 stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -198,9 +373,10 @@ class Gratings(btm.BaseTrialManager):
             # itl
             self._Phases.append(ps.PhaseSpec(
                 phase_number=1,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(self.itl),autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
                 stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -210,10 +386,11 @@ class Gratings(btm.BaseTrialManager):
                 sounds_played=None,
                 is_last_phase=True))
 
-        self._compiler = Gratings.trial_compiler
 
-    def _simulate(self):
-        station = st.StandardKeyboardStation()
+    def _simulate(self, station=None):
+        # StandardKeyboardStation by default. pass a SimulatedStation to run without a display
+        if station is None:
+            station = st.StandardKeyboardStation()
         station.initialize()
 
         trial_record = {}
@@ -224,11 +401,12 @@ class Gratings(btm.BaseTrialManager):
 
     def decache(self):
         self._Phases = dict()
+        self._Schedule = None
 
     @staticmethod
     def update_stimulus(stimulus,details):
-        if details['drift_frequency'] !=0:
-            stimulus.phase += float(details['drift_frequency'])/float(details['Hz'])
+        if details['drift_phases'] is not None:
+            stimulus.phase = details['drift_phases'].next_phase()
 
     def do_trial(self, station, subject, trial_record, compiled_record,quit):
         # returns quit and trial_record
@@ -243,61 +421,15 @@ class Gratings(btm.BaseTrialManager):
             return trial_record,quit
 
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
         station._key_pressed = []
 
         trial_record,quit = super(Gratings,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
         return trial_record,quit
 
-    @staticmethod
-    def trial_compiler(compiled_record, trial_record):
-        print('GRATINGS:TRIAL_COMPILER::compiling trial')
-
-        try:
-            import pprint
-            ppr = pprint.PrettyPrinter(indent=4).pprint
-            ppr(compiled_record)
-            compiled_details = compiled_record['compiled_details']['Gratings']
-        except KeyError as e:
-            traceback.print_stack()
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['radius'] = []
-            # compiled_details['radius_type'] = []
-            compiled_details['location'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['Gratings'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append('None')
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
-
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardVisionHeadfixStation','StandardKeyboardStation']:
+        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardVisionHeadfixStation','StandardKeyboardStation','SimulatedStation']:
             return True
         else:
             return False
@@ -314,72 +446,18 @@ class Gratings_GaussianEdge(Gratings):
         VERSION HISTORY:
         0.0.1 : first commit
         0.0.2 : lean into Gratings subclass. Cleaned out method calls
+        0.0.3 : mask set by grating_mask. Gratings._setup_phases makes the stimulus
     """
-
+    radius_type = 'Gaussian'
+    grating_mask = 'gauss'
 
     def __init__(self, name, **kwargs):
-        self.ver = Ver('0.0.2')
+        self.ver = Ver('0.0.3')
         super(Gratings_GaussianEdge, self).__init__(name, **kwargs)
 
     def __repr__(self):
         return "Gratings_GaussianEdge object with or:%s, tf:%s, ctr:%s and durs:%s)" % (self.orientations, self.drift_frequencies, self.contrasts, self.durations)
 
-    def _setup_phases(self, trial_record, station, subject, **kwargs):
-        """
-        Gratings:_setupPhases is a simple trialManager. It is for autopilot
-        It selects from PixPerCycs, Orientations, DriftFrequencies, Phases
-        Contrasts, Durations and shows them one at a time. There is only one
-        phase. There is no "correct" and no responses are required/recorded
-
-        TODO:
-        1. add rewards to this
-        """
-        super(Gratings_GaussianEdge,self)._setup_phases(trial_record, station, **kwargs)
-
-        # replace for the first phase
-        self._Phases[0].stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',mask='gauss',autoLog=False)
-        self._compiler = Gratings_GaussianEdge.trial_compiler
-
-    @staticmethod
-    def trial_compiler(compiled_record, trial_record):
-        try:
-            compiled_details = compiled_record['compiled_details']['Gratings']
-        except KeyError:
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['radius'] = []
-            compiled_details['radius_type'] = []
-            compiled_details['location'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['Gratings'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append('Gaussian')
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
-
 
 class Gratings_HardEdge(Gratings):
     """
@@ -389,69 +467,19 @@ class Gratings_HardEdge(Gratings):
         VERSION HISTORY:
         0.0.1 : first commit
         0.0.2 : lean into Gratings subclass. Cleaned out method calls
+        0.0.3 : mask set by grating_mask. Gratings._setup_phases makes the stimulus
     """
+    radius_type = 'Circular'
+    grating_mask = 'circle'
 
     def __init__(self, name, **kwargs):
-        self.ver = Ver('0.0.2')
+        self.ver = Ver('0.0.3')
         super(Gratings_HardEdge, self).__init__(name, **kwargs)
 
     def __repr__(self):
         return "Gratings_HardEdge object with or:%s, tf:%s, ctr:%s and durs:%s)" % (self.orientations, self.drift_frequencies, self.contrasts, self.durations)
 
-    def _setup_phases(self, trial_record, station, subject, **kwargs):
-        """
-        Gratings:_setupPhases is a simple trialManager. It is for autopilot
-        It selects from PixPerCycs, Orientations, DriftFrequencies, Phases
-        Contrasts, Durations and shows them one at a time. There is only one
-
-
-        TODO:
-        1. add rewards to this
-        """
-        super(Gratings_GaussianEdge,self)._setup_phases(trial_record, station, **kwargs)
-
-        self._Phases[0].stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',mask='circle',autoLog=False)
-        self._compiler = Gratings_HardEdge.trial_compiler
 
-    @staticmethod
-    def trial_compiler(compiled_record, trial_record):
-        try:
-            compiled_details = compiled_record['compiled_details']['Gratings']
-        except KeyError:
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['radius'] = []
-            compiled_details['radius_type'] = []
-            compiled_details['location'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['Gratings'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append('Circular')
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
 ##########################################################################################
 ##########################################################################################
 ####################### AFC GRATINGS TRIAL MANAGERS - SHOWS ##############################
@@ -470,13 +498,20 @@ class Gratings2AFC(btm.BaseTrialManager):
             durations
             radii # in units of "Scale"
             positions
+            bank_stimuli : reuse gratings from the station's StimulusBank.
+                           see make_grating
 
             VERSION HISTORY:
             0.0.1 : Initial design
             0.0.2 : (1) itl and iti sent to BTM and (2) _setup_phases() are zero-indexed
                     (3) renamed ports to appropriate names (4) forced to 2-AFC
+            0.0.3 : runs on BaseTrialManager.do_trial. (sound, seconds) sounds
+                    are timed by its SoundScheduler
+            0.0.4 : bank_stimuli reuses gratings from the StimulusBank
     """
     _current_is_catch = False
+    compiled_details_schema = GRATINGS_DETAILS_SCHEMA + (('request_time', 'float64', request_time),
+                                                         ('response_time', 'float64', response_time),)
 
     def __init__(self,
                  name = 'DemoGratings2AFCTrialManager',
@@ -494,14 +529,23 @@ class Gratings2AFC(btm.BaseTrialManager):
                  iti = 1,
                  itl = 0.,
                  do_combos = True,
+                 block_randomize = False,
+                 block_repeats = 1,
+                 schedule_seed = None,
+                 draw_stim_onset_rect = True,
+                 bank_stimuli = False,
                  reinforcement_manager = reinfmgr.NoReinforcement(),
                  **kwargs):
-        super(Gratings2AFC,self).__init__(iti=iti,itl=itl)
-        self.ver = Ver('0.0.2')
+        super(Gratings2AFC,self).__init__(iti=iti,itl=itl,draw_stim_onset_rect=draw_stim_onset_rect)
+        self.ver = Ver('0.0.4')
         self.name = name
         self.reinforcement_manager = reinforcement_manager
 
         self.do_combos = do_combos
+        self.bank_stimuli = bank_stimuli
+        self.block_randomize = block_randomize
+        self.block_repeats = block_repeats
+        self.schedule_seed = schedule_seed
         self.deg_per_cycs = deg_per_cycs
         self.orientations = orientations
         self.drift_frequencies = drift_frequencies
@@ -528,7 +572,7 @@ class Gratings2AFC(btm.BaseTrialManager):
         assert len(self.locations)==n_afc,'GRATINGS2AFC::INIT::locations not same length as %r' % n_afc
         assert len(self.radii)==n_afc,'GRATINGS2AFC::INIT::radii not same length as %r' % n_afc
 
-        if do_combos:
+        if self.do_combos:
             # if do_combos, don't have to worry about the lengths of each values
             pass
         else:
@@ -557,8 +601,8 @@ class Gratings2AFC(btm.BaseTrialManager):
 
     @staticmethod
     def update_stimulus(stimulus,details):
-        if details['drift_frequency'] !=0:
-            stimulus.phase += float(details['drift_frequency'])/float(details['Hz'])
+        if details['drift_phases'] is not None:
+            stimulus.phase = details['drift_phases'].next_phase()
 
     def choose_ports(self, trial_record, compiled_record, station,):
         if not compiled_record['trial_manager_class'][-1] == 'BCore.Classes.TrialManagers.GratingsTrialManagers.Gratings2AFC':
@@ -571,143 +615,17 @@ class Gratings2AFC(btm.BaseTrialManager):
 
         # check if okay to run the trial manager with the station
         if not self.station_ok_for_tm(station):
+            print('GRATINGS2AFC:DO_TRIAL: station not ok for tm')
             quit = True
             trial_record['correct'] = None
             trial_record['errored_out'] = True
             return trial_record,quit
 
-
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
         station._key_pressed = []
 
-        current_phase_num = 0
-
-        # was on will be used to check for new responses
-        was_on = {'L':False, 'C': False, 'R':False}
-
-        # Zero out the trial clock
-        trial_clock = station._clocks['trial_clock']
-        trial_clock.reset()
-
-        trial_done = False
-        error_out = False
-
-        trial_record['errored_out'] = False
-        trial_record['manual_quit'] = False
-
-
-        trial_record['reinforcement_manager_name'] = self.reinforcement_manager.name
-        trial_record['reinforcement_manager_class'] = self.reinforcement_manager.__class__.__name__
-        trial_record['reinforcement_manager_version_number'] = self.reinforcement_manager.ver.__str__()
-
-        trial_record['phase_data'] = []
-
-        station.set_trial_pin_on()
-        ### loop into trial phases
-        while not trial_done and not error_out and not quit:
-            # current_phase_num determines the phase
-            phase = self._Phases[current_phase_num]
-
-            # collect details about the phase
-            frames_until_transition = phase.frames_until_transition
-            stim = phase.stimulus
-            stim_details = phase.stimulus_details
-            transition = phase.transitions
-            if not transition:
-                is_last_phase = True
-            else:
-                is_last_phase = False
-            auto_trigger = phase.auto_trigger
-            if phase.sounds_played:
-                sound = phase.sounds_played[0]
-                sound_duration = phase.sounds_played[1]
-                sound.seek(0.)
-                sound_started = False
-                sound_done = False
-                sound_timer = psychopy.core.CountdownTimer(sound_duration)
-            else:
-                sound = None
-
-            # save relevant data into phase_data
-            phase_data = {}
-            phase_data['phase_name'] = phase.phase_name
-            phase_data['phase_number'] = phase.phase_number
-            phase_data['enter_time'] = trial_clock.getTime()
-            phase_data['response'] = []
-            phase_data['response_time'] = []
-
-            # loop into phase
-            phase_done = False
-            trial_record = phase.on_enter(trial_record=trial_record, station=station)
-            while not phase_done and not error_out and not quit:
-                # deal with sounds
-                if sound:
-                    if not sound_started:
-                        sound.play()
-                        sound_timer.reset()
-                        sound_started = True
-
-                    if sound_timer.getTime() <0 and not sound_done:
-                        sound.stop()
-                        sound_done = True
-
-                # deal with stim
-                if stim:
-                    stim.draw()
-                    if phase.phase_name=='stim':
-                        psychopy.visual.Rect(station._window,pos=(-300,-300),width=100,height=100,units='pix',fillColor=(1,1,1)).draw()
-                    phase.stimulus_update_fn(stim,stim_details)
-                phase.on_frame(station=station,trial_record=trial_record)
-
-                # look for responses
-                response_led_to_transition = False
-                response = station.read_ports()
-                if len(response)>1:
-                    error_out = True
-                    trial_record['errored_out'] = True
-                elif len(response)==1:
-                    response = response[0]
-                    try:
-                        current_phase_num = transition[response] - 1
-                        response_led_to_transition = True
-                    except KeyError:
-                        response_led_to_transition = False # that phase did not have a transition for that response
-                    except TypeError:
-                        assert is_last_phase, 'No reason why it should come here otherwise'
-                    finally:
-                        # logit but only if was_on wasnt already on
-                        if not was_on[response]:
-                            phase_data['response'].append(response)
-                            phase_data['response_time'].append(trial_clock.getTime())
-                    was_on[response] = True # flip was on to true after we used it to check for new events
-                else:
-                    pass
-
-                # update the frames_until_transition and check if the phase is done
-                # phase is done when there are no more frames in the phase or is we flipped due to transition
-                # however we can stop playing the phase because we manual_quit or because we errored out
-                frames_until_transition = frames_until_transition-1
-                frames_led_to_transition = False
-                if frames_until_transition==0:
-                    frames_led_to_transition = True
-                    if transition: current_phase_num = transition[None] - 1
-                    else: current_phase_num = None # the last phase has no
-
-                if frames_led_to_transition or response_led_to_transition:
-                    phase_done = True
-                manual_quit = station.check_manual_quit()
-                if manual_quit:
-                    trial_record['manual_quit'] = True
-                    trial_record['correct'] = None
-                quit = quit or manual_quit
-            trial_record = phase.on_exit(trial_record=trial_record, station=station)
-            trial_record['phase_data'].append(phase_data)
-
-            # when do we quit the trial? trial_done only when last phjase
-            # but we can exit if manual_quit or errored out
-            if is_last_phase: trial_done = True
-        station.set_trial_pin_off()
+        trial_record,quit = super(Gratings2AFC,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
         return trial_record,quit
 
     def calc_stim(self, trial_record, station, **kwargs):
@@ -716,20 +634,28 @@ class Gratings2AFC(btm.BaseTrialManager):
         all_ports = ('left_port','center_port','right_port')
         request_port = 'center_port'
         response_ports = tuple(np.setdiff1d(all_ports,request_port))
-        target_port = np.random.choice(response_ports)
+        stimulus = dict()
+        if getattr(self, 'block_randomize', False):
+            condition = self.scheduled_condition(trial_record, kwargs.get('subject', None), afc_schedule_levels(self, response_ports), repeats=self.block_repeats, seed=self.schedule_seed)
+            target_port = response_ports[condition['target_port']]
+        else:
+            target_port = np.random.choice(response_ports)
         distractor_port = tuple(np.setdiff1d(response_ports,target_port))
 
         distractor_port = distractor_port[0]
         # select from values
-        stimulus = dict()
-        stimulus['deg_per_cyc'] = random.choice(self.deg_per_cycs[target_port])
-        stimulus['orientation'] = random.choice(self.orientations[target_port])
-        stimulus['drift_frequency'] = random.choice(self.drift_frequencies[target_port])
-        stimulus['phase'] = random.choice(self.phases[target_port])
-        stimulus['contrast'] = random.choice(self.contrasts[target_port])
-        stimulus['duration'] = random.choice(self.durations[target_port])
-        stimulus['location'] = random.choice(self.locations[target_port])
-        stimulus['radius'] = random.choice(self.radii[target_port])
+        if getattr(self, 'block_randomize', False):
+            for field, param in AFC_GRATINGS_LEVELS:
+                stimulus[field] = getattr(self, param)[target_port][condition[field]]
+        else:
+            stimulus['deg_per_cyc'] = random.choice(self.deg_per_cycs[target_port])
+            stimulus['orientation'] = random.choice(self.orientations[target_port])
+            stimulus['drift_frequency'] = random.choice(self.drift_frequencies[target_port])
+            stimulus['phase'] = random.choice(self.phases[target_port])
+            stimulus['contrast'] = random.choice(self.contrasts[target_port])
+            stimulus['duration'] = random.choice(self.durations[target_port])
+            stimulus['location'] = random.choice(self.locations[target_port])
+            stimulus['radius'] = random.choice(self.radii[target_port])
         stimulus['radius_type'] = self.radius_type
         stimulus['H'] = H
         stimulus['W'] = W
@@ -737,7 +663,11 @@ class Gratings2AFC(btm.BaseTrialManager):
 
         trial_record['chosen_stim'] = stimulus
 
-        frames_total = round(Hz*stimulus['duration'])
+        # an infinite duration shows the stimulus until there is a response
+        frames_total = round(Hz*stimulus['duration']) if np.isfinite(stimulus['duration']) else float('inf')
+
+        # the drift trajectory is for the phase loop. it is not logged
+        stimulus = dict(stimulus, drift_phases=drift_trajectory(stimulus, station))
 
         port_details = {}
         port_details['request_port'] = request_port
@@ -761,7 +691,7 @@ class Gratings2AFC(btm.BaseTrialManager):
         4. Punish: Timeout
         5. ITI: Gray screen of duration iti,
         """
-        (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station)
+        (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station, subject=subject)
         hz = resolution[2]
         do_nothing = ()
         if port_details['target_port'] == 'left_port':
@@ -785,10 +715,11 @@ class Gratings2AFC(btm.BaseTrialManager):
         if do_post_discrim_stim:
             self._Phases.append(ps.PhaseSpec(
                 phase_number=0,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['request_port']: 2},
+                transitions={port_details['request_port']: 1},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='pre-request',
@@ -798,35 +729,38 @@ class Gratings2AFC(btm.BaseTrialManager):
             if self.radius_type=='Gaussian':
                 self._Phases.append(ps.PhaseSpec(
                     phase_number=1,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=GratingsAFC.update_stimulus,
+                    stimulus=make_grating(self, station, stimulus_details, mask='gauss'),
+                    stimulus_update_fn=Gratings2AFC.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={do_nothing: 3, port_details['target_port']: 4, port_details['distractor_port']: 5},
+                    transitions={do_nothing: 2, port_details['target_port']: 3, port_details['distractor_port']: 4},
                     frames_until_transition=frames_total,
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             else:
                 self._Phases.append(ps.PhaseSpec(
                     phase_number=1,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='circle',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=GratingsAFC.update_stimulus,
+                    stimulus=make_grating(self, station, stimulus_details, mask='circle'),
+                    stimulus_update_fn=Gratings2AFC.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={do_nothing: 3, port_details['target_port']: 4, port_details['distractor_port']: 5},
+                    transitions={do_nothing: 2, port_details['target_port']: 3, port_details['distractor_port']: 4},
                     frames_until_transition=frames_total,
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=2,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['target_port']: 4, port_details['distractor_port']: 5},
+                transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='post-stimulus',
@@ -835,10 +769,11 @@ class Gratings2AFC(btm.BaseTrialManager):
                 sounds_played=None))
             self._Phases.append(ps.RewardPhaseSpec(
                 phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={do_nothing: 6},
+                transitions={do_nothing: 5},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -848,10 +783,11 @@ class Gratings2AFC(btm.BaseTrialManager):
                 reward_valve=reward_valve))
             self._Phases.append(ps.PunishmentPhaseSpec(
                 phase_number=4,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(0.,0.,0.,),autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station, fill_color=(0.,0.,0.)),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={do_nothing: 6},
+                transitions={do_nothing: 5},
                 frames_until_transition=penalty_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -860,9 +796,10 @@ class Gratings2AFC(btm.BaseTrialManager):
                 sounds_played=(station._sounds['punishment_sound'],ms_penalty_sound/1000)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=5,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -873,10 +810,11 @@ class Gratings2AFC(btm.BaseTrialManager):
         else:
             self._Phases.append(ps.PhaseSpec(
                 phase_number=0,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['request_port']: 2},
+                transitions={port_details['request_port']: 1},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='pre-request',
@@ -886,35 +824,38 @@ class Gratings2AFC(btm.BaseTrialManager):
             if self.radius_type=='Gaussian':
                 self._Phases.append(ps.PhaseSpec(
                     phase_number=1,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=GratingsAFC.update_stimulus,
+                    stimulus=make_grating(self, station, stimulus_details, mask='gauss'),
+                    stimulus_update_fn=Gratings2AFC.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
+                    transitions={port_details['target_port']: 2, port_details['distractor_port']: 3},
                     frames_until_transition=float('inf'),
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             else:
                 self._Phases.append(ps.PhaseSpec(
                     phase_number=1,
-                    stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='circle',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                    stimulus_update_fn=GratingsAFC.update_stimulus,
+                    stimulus=make_grating(self, station, stimulus_details, mask='circle'),
+                    stimulus_update_fn=Gratings2AFC.update_stimulus,
                     stimulus_details=stimulus_details,
-                    transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
+                    transitions={port_details['target_port']: 2, port_details['distractor_port']: 3},
                     frames_until_transition=float('inf'),
                     auto_trigger=False,
                     phase_type='stimulus',
                     phase_name='stim',
+                    marks_stim_onset=True,
                     hz=hz,
                     sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             self._Phases.append(ps.RewardPhaseSpec(
                 phase_number=2,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={do_nothing: 5},
+                transitions={do_nothing: 4},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -924,10 +865,11 @@ class Gratings2AFC(btm.BaseTrialManager):
                 reward_valve=reward_valve))
             self._Phases.append(ps.PunishmentPhaseSpec(
                 phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(0,0,0,),autoLog=False),
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station, fill_color=(0.,0.,0.)),
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={do_nothing: 5},
+                transitions={do_nothing: 4},
                 frames_until_transition=penalty_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -936,9 +878,10 @@ class Gratings2AFC(btm.BaseTrialManager):
                 sounds_played=(station._sounds['punishment_sound'],ms_penalty_sound/1000)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=4,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
-                stimulus_update_fn=GratingsAFC.do_nothing_to_stim,
+                stimulus_update_fn=Gratings2AFC.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -949,79 +892,11 @@ class Gratings2AFC(btm.BaseTrialManager):
 
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardKeyboardStation']:
+        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardKeyboardStation','SimulatedStation']:
             return True
         else:
             return False
 
-    def trial_compiler(self, compiled_record, trial_record):
-        try:
-            compiled_details = compiled_record['compiled_details']['GratingsAFC']
-        except KeyError:
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['location'] = []
-            compiled_details['radius'] = []
-            compiled_details['radius_type'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # specific to animal responses
-            compiled_details['request_time'] = [] # time from trial start to center request
-            compiled_details['response_time'] = [] # time from request to response
-            compiled_details['request_lick_timings'] = []
-            compiled_details['response_lick_timings_prev_trial'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['Gratings'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append(self.radius_type)
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        # animal response data compilation
-        phase_data = trial_record['phase_data']
-        phase_types = np.asarray([p['phase_type'] for p in phase_data])
-        pre_req_phase_num = np.argwhere(phase_types=='pre-request')
-        stim_phase_num = np.argwhere(phase_types=='stimulus')
-        reinf_phase_num = np.argwhere(phase_types=='reinforcement')
-        # request_time is time from TRIAL_START to 'stim' phase enter_time
-        compiled_details['request_time'].append(phase_data[stim_phase_num]['enter_time'])
-        # resonse_time is time from 'stim' phase enter_time to 'reinforcement' phase enter time
-        compiled_details['response_time'].append(phase_data[reinf_phase_num]['enter_time']-phase_data[stim_phase_num]['enter_time'])
-        # request_lick_timings are center_port' licks in the stim_phase
-        lick_loc = np.asarray(phase_data[stim_phase_num]['response'])
-        lick_times = np.asarray(phase_data[stim_phase_num]['response_time'])
-        which_licks = np.argwhere(lick_loc=='center_port')
-        compiled_details['request_lick_timings'].append(lick_times[which_licks])
-        # response_lick_timings_prev_trial are non 'center_port' licks in the pre_req_phase_num
-        lick_loc = np.asarray(phase_data[pre_req_phase_num]['response'])
-        lick_times = np.asarray(phase_data[pre_req_phase_num]['response_time'])
-        which_licks = np.argwhere(lick_loc!='center_port')
-        compiled_details['response_lick_timings_prev_trial'].append(lick_times[which_licks])
-
-
-
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
-
 
 ##########################################################################################
 ##########################################################################################
@@ -1043,13 +918,18 @@ class GratingsGoNoGo(btm.BaseTrialManager):
             locations
 
             do_combos
+            bank_stimuli : reuse gratings from the station's StimulusBank.
+                           see make_grating
             reinforcement_manager
 
             VERSION HISTORY:
             0.0.1 : Initial design
             0.0.2 : (1) itl and iti sent to BTM and (2) _setup_phases()
                     are zero-indexed
+            0.0.3 : transitions are zero-indexed with do_nothing for timeouts
+            0.0.4 : bank_stimuli reuses gratings from the StimulusBank
     """
+    compiled_details_schema = GRATINGS_DETAILS_SCHEMA
 
     def __init__(self,
                  name = 'DemoGratingsAFCTrialManager',
@@ -1064,14 +944,22 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                  iti = 1.,
                  itl = 0.,
                  do_combos = True,
+                 block_randomize = False,
+                 block_repeats = 1,
+                 schedule_seed = None,
+                 bank_stimuli = False,
                  reinforcement_manager = reinfmgr.ConstantReinforcement(),
                  **kwargs):
         super(GratingsGoNoGo,self).__init__(iti=iti, itl=itl)
-        self.ver = Ver('0.0.2')
+        self.ver = Ver('0.0.4')
         self.name = name
         self.reinforcement_manager = reinforcement_manager
 
         self.do_combos = do_combos
+        self.bank_stimuli = bank_stimuli
+        self.block_randomize = block_randomize
+        self.block_repeats = block_repeats
+        self.schedule_seed = schedule_seed
         self.deg_per_cycs = deg_per_cycs
         self.orientations = orientations
         self.drift_frequencies = drift_frequencies
@@ -1081,6 +969,8 @@ class GratingsGoNoGo(btm.BaseTrialManager):
         self.locations = locations
         self.radii = radii
 
+        self._verify_params_ok()
+
     def _verify_params_ok(self):
         assert isinstance(self.do_combos,bool)
         if self.do_combos:
@@ -1113,8 +1003,8 @@ class GratingsGoNoGo(btm.BaseTrialManager):
 
     @staticmethod
     def update_stimulus(stimulus,details):
-        if details['drift_frequency'] !=0:
-            stimulus.phase += float(details['drift_frequency'])/float(details['Hz'])
+        if details['drift_phases'] is not None:
+            stimulus.phase = details['drift_phases'].next_phase()
 
     def do_trial(self, station, subject, trial_record, compiled_record,quit):
         # returns quit and trial_record
@@ -1130,7 +1020,7 @@ class GratingsGoNoGo(btm.BaseTrialManager):
 
 
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
         station._key_pressed = []
 
         trial_record,quit = super(GratingsGoNoGo,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
@@ -1142,20 +1032,28 @@ class GratingsGoNoGo(btm.BaseTrialManager):
         all_ports = ('left_port','center_port','right_port')
         request_port = 'center_port'
         response_ports = tuple(np.setdiff1d(all_ports,request_port))
-        target_port = np.random.choice(response_ports)
+        stimulus = dict()
+        if getattr(self, 'block_randomize', False):
+            condition = self.scheduled_condition(trial_record, kwargs.get('subject', None), afc_schedule_levels(self, response_ports), repeats=self.block_repeats, seed=self.schedule_seed)
+            target_port = response_ports[condition['target_port']]
+        else:
+            target_port = np.random.choice(response_ports)
         distractor_port = tuple(np.setdiff1d(response_ports,target_port))
 
         distractor_port = distractor_port[0]
         # select from values
-        stimulus = dict()
-        stimulus['deg_per_cyc'] = random.choice(self.deg_per_cycs[target_port])
-        stimulus['orientation'] = random.choice(self.orientations[target_port])
-        stimulus['drift_frequency'] = random.choice(self.drift_frequencies[target_port])
-        stimulus['phase'] = random.choice(self.phases[target_port])
-        stimulus['contrast'] = random.choice(self.contrasts[target_port])
-        stimulus['duration'] = random.choice(self.durations[target_port])
-        stimulus['location'] = random.choice(self.locations[target_port])
-        stimulus['radius'] = random.choice(self.radii[target_port])
+        if getattr(self, 'block_randomize', False):
+            for field, param in AFC_GRATINGS_LEVELS:
+                stimulus[field] = getattr(self, param)[target_port][condition[field]]
+        else:
+            stimulus['deg_per_cyc'] = random.choice(self.deg_per_cycs[target_port])
+            stimulus['orientation'] = random.choice(self.orientations[target_port])
+            stimulus['drift_frequency'] = random.choice(self.drift_frequencies[target_port])
+            stimulus['phase'] = random.choice(self.phases[target_port])
+            stimulus['contrast'] = random.choice(self.contrasts[target_port])
+            stimulus['duration'] = random.choice(self.durations[target_port])
+            stimulus['location'] = random.choice(self.locations[target_port])
+            stimulus['radius'] = random.choice(self.radii[target_port])
         stimulus['H'] = H
         stimulus['W'] = W
         stimulus['Hz'] = Hz
@@ -1164,6 +1062,9 @@ class GratingsGoNoGo(btm.BaseTrialManager):
 
         frames_total = round(Hz*stimulus['duration'])
 
+        # the drift trajectory is for the phase loop. it is not logged
+        stimulus = dict(stimulus, drift_phases=drift_trajectory(stimulus, station))
+
         port_details = {}
         port_details['request_port'] = request_port
         port_details['target_port'] = target_port
@@ -1186,8 +1087,9 @@ class GratingsGoNoGo(btm.BaseTrialManager):
         4. Punish: Timeout
         5. ITI: Gray screen of duration iti,
         """
-        (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station)
+        (stimulus_details,resolution,frames_total,port_details) = self.calc_stim(trial_record=trial_record, station=station, subject=subject)
         hz = resolution[2]
+        do_nothing = ()
         if port_details['target_port'] == 'left_port':
             reward_valve = 'left_valve'
         elif port_details['target_port'] == 'right_port':
@@ -1209,10 +1111,11 @@ class GratingsGoNoGo(btm.BaseTrialManager):
         if do_post_discrim_stim:
             self._Phases.append(ps.PhaseSpec(
                 phase_number=0,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['request_port']: 2},
+                transitions={port_details['request_port']: 1},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='pre-request',
@@ -1221,22 +1124,24 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 sounds_played=(station._sounds['trial_start_sound'], 0.050)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=1,
-                stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                stimulus_update_fn=AFCGratings.update_stimulus,
+                stimulus=make_grating(self, station, stimulus_details, mask='gauss'),
+                stimulus_update_fn=GratingsGoNoGo.update_stimulus,
                 stimulus_details=stimulus_details,
-                transitions={None: 3, port_details['target_port']: 4, port_details['distractor_port']: 5},
+                transitions={do_nothing: 2, port_details['target_port']: 3, port_details['distractor_port']: 4},
                 frames_until_transition=frames_total,
                 auto_trigger=False,
                 phase_type='stimulus',
                 phase_name='stim',
+                marks_stim_onset=True,
                 hz=hz,
                 sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=2,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['target_port']: 4, port_details['distractor_port']: 5},
+                transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='post-stimulus',
@@ -1245,10 +1150,11 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 sounds_played=None))
             self._Phases.append(ps.RewardPhaseSpec(
                 phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 6},
+                transitions={do_nothing: 5},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -1258,10 +1164,11 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 reward_valve=reward_valve))
             self._Phases.append(ps.PunishmentPhaseSpec(
                 phase_number=4,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(0.,0.,0.,),autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station, fill_color=(0.,0.,0.)),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 6},
+                transitions={do_nothing: 5},
                 frames_until_transition=penalty_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -1270,9 +1177,10 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 sounds_played=(station._sounds['punishment_sound'],ms_penalty_sound/1000)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=5,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -1283,10 +1191,11 @@ class GratingsGoNoGo(btm.BaseTrialManager):
         else:
             self._Phases.append(ps.PhaseSpec(
                 phase_number=1,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={port_details['request_port']: 2},
+                transitions={port_details['request_port']: 1},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='pre-request',
@@ -1295,22 +1204,24 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 sounds_played=(station._sounds['trial_start_sound'], 0.050)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=2,
-                stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],mask='gauss',ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',autoLog=False),
-                stimulus_update_fn=AFCGratings.update_stimulus,
+                stimulus=make_grating(self, station, stimulus_details, mask='gauss'),
+                stimulus_update_fn=GratingsGoNoGo.update_stimulus,
                 stimulus_details=stimulus_details,
-                transitions={port_details['target_port']: 3, port_details['distractor_port']: 4},
+                transitions={port_details['target_port']: 2, port_details['distractor_port']: 3},
                 frames_until_transition=float('inf'),
                 auto_trigger=False,
                 phase_type='stimulus',
                 phase_name='stim',
+                marks_stim_onset=True,
                 hz=hz,
                 sounds_played=(station._sounds['stim_start_sound'], 0.050)))
             self._Phases.append(ps.RewardPhaseSpec(
                 phase_number=3,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 5},
+                transitions={do_nothing: 4},
                 frames_until_transition=reward_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -1320,10 +1231,11 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 reward_valve=reward_valve))
             self._Phases.append(ps.PunishmentPhaseSpec(
                 phase_number=4,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=(0,0,0,),autoLog=False),
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus=self.full_screen_rect(station, fill_color=(0.,0.,0.)),
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 stimulus_details=None,
-                transitions={None: 5},
+                transitions={do_nothing: 4},
                 frames_until_transition=penalty_size,
                 auto_trigger=False,
                 phase_type='reinforcement',
@@ -1332,9 +1244,10 @@ class GratingsGoNoGo(btm.BaseTrialManager):
                 sounds_played=(station._sounds['punishment_sound'],ms_penalty_sound/1000)))
             self._Phases.append(ps.PhaseSpec(
                 phase_number=5,
-                stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+                stimulus=self.full_screen_rect(station),
                 stimulus_details=None,
-                stimulus_update_fn=AFCGratings.do_nothing_to_stim,
+                stimulus_update_fn=GratingsGoNoGo.do_nothing_to_stim,
+                is_static=True,
                 transitions=None,
                 frames_until_transition=round(self.iti*hz),
                 auto_trigger=False,
@@ -1345,57 +1258,11 @@ class GratingsGoNoGo(btm.BaseTrialManager):
 
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardKeyboardStation']:
+        if station.__class__.__name__ in ['StandardVisionBehaviorStation','StandardKeyboardStation','SimulatedStation']:
             return True
         else:
             return False
 
-    @staticmethod
-    def trial_compiler(compiled_record, trial_record):
-        print('GRATINGSGOONLY:TRIAL_COMPILER::compiling trial')
-
-        try:
-            import pprint
-            ppr = pprint.PrettyPrinter(indent=4).pprint
-            ppr(compiled_record)
-            compiled_details = compiled_record['compiled_details']['GratingsGoOnly']
-        except KeyError as e:
-            traceback.print_stack()
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['radius'] = []
-            # compiled_details['radius_type'] = []
-            compiled_details['location'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['Gratings'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append('None')
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
-
 
 class GratingsGoOnly(btm.BaseTrialManager):
     """
@@ -1410,13 +1277,22 @@ class GratingsGoOnly(btm.BaseTrialManager):
             locations
 
             do_combos
+            bank_stimuli        : reuse gratings from the station's
+                                  StimulusBank. see make_grating
+            delay_distribution  : see Distributions.from_spec
+            delay_seed          : seed of the delays. derived per subject
+                                  and session. None draws new delays every
+                                  session
             reinforcement_manager
 
             VERSION HISTORY:
             0.0.1 : Initial design
             0.0.2 : (1) itl and iti sent to BTM and (2) _setup_phases()
                     are zero-indexed
+            0.0.3 : delays are presampled from a seeded Generator
+            0.0.4 : bank_stimuli reuses gratings from the StimulusBank
     """
+    compiled_details_schema = GRATINGS_DETAILS_SCHEMA + (('delay_frame_num', 'float64', 'chosen_stim.delay_frame_num'),)
 
     def __init__(self,
                  name = 'DemoGratingsGoOnlyTrialManager',
@@ -1432,14 +1308,17 @@ class GratingsGoOnly(btm.BaseTrialManager):
                  itl = 0.,
                  do_combos = True,
                  delay_distribution = ('Constant',2.),
+                 delay_seed = None,
+                 bank_stimuli = False,
                  reinforcement_manager = reinfmgr.ConstantReinforcement(),
                  **kwargs):
         super(GratingsGoOnly,self).__init__(iti=iti, itl=itl)
-        self.ver = Ver('0.0.2')
+        self.ver = Ver('0.0.4')
         self.name = name
         self.reinforcement_manager = reinforcement_manager
 
         self.do_combos = do_combos
+        self.bank_stimuli = bank_stimuli
         self.deg_per_cycs = deg_per_cycs
         self.orientations = orientations
         self.drift_frequencies = drift_frequencies
@@ -1450,6 +1329,7 @@ class GratingsGoOnly(btm.BaseTrialManager):
         self.radii = radii
 
         self.delay_distribution = delay_distribution
+        self.delay_seed = delay_seed
 
         self._verify_params_ok()
 
@@ -1468,40 +1348,19 @@ class GratingsGoOnly(btm.BaseTrialManager):
             assert len(self.radii)==num_options,'radii not same length as deg_per_cycs'
 
         assert np.logical_and(np.all(np.asarray(self.durations)>0), np.all(np.asarray(self.durations)<float('inf'))), 'All durations should be positive and finite'
-        assert self.delay_distribution[0] in ['Constant', 'Uniform', 'Gaussian', 'FlatHazard'], 'what delay distributoin are you using?'
+        assert self.delay_distribution[0] in dist.DISTRIBUTIONS, 'what delay distribution are you using?'
 
     def __repr__(self):
         return "GRATINGSGOONLY object"
 
     @staticmethod
     def update_stimulus(stimulus,details):
-        if details['drift_frequency'] !=0:
-            stimulus.phase += float(details['drift_frequency'])/float(details['Hz'])
-
-    def sample_delay(self):
-        if self.delay_distribution[0]=='Constant':
-            return self.delay_distribution[1]
-        elif self.delay_distribution[0]=='Uniform':
-            lo = self.delay_distribution[1][0]
-            hi = self.delay_distribution[1][1]
-            return np.abs(np.random.uniform(low=lo,high=hi))
-        elif self.delay_distribution[0]=='Gaussian':
-            mu = self.delay_distribution[1][0]
-            sd = self.delay_distribution[1][1]
-            return np.abs(np.random.normal(loc=mu,scale=sd)) # returning absolute values
-        elif self.delay_distribution[0]=='FlatHazard':
-            pctile = self.delay_distribution[1][0]
-            val = self.delay_distribution[1][1]
-            fixed = self.delay_distribution[1][2]
-            max = self.delay_distribution[1][3]
-            p = -val/np.log(1-pctile)
-            delay = fixed+np.random.exponential(p)
-            if delay>max: delay=max
-            return delay
+        if details['drift_phases'] is not None:
+            stimulus.phase = details['drift_phases'].next_phase()
 
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardKeyboardStation','StandardVisionHeadfixStation']:
+        if station.__class__.__name__ in ['StandardKeyboardStation','StandardVisionHeadfixStation','SimulatedStation']:
             return True
         else:
             return False
@@ -1520,7 +1379,7 @@ class GratingsGoOnly(btm.BaseTrialManager):
 
 
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
         station._key_pressed = []
 
         trial_record,quit = super(GratingsGoOnly,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
@@ -1553,11 +1412,14 @@ class GratingsGoOnly(btm.BaseTrialManager):
         stimulus_details['W'] = W
         stimulus_details['Hz'] = Hz
 
-        delay_frame_num = np.round(self.sample_delay()*Hz)
+        delay_frame_num = np.round(self.sample_delay(trial_record=trial_record, subject=kwargs.get('subject'))*Hz)
         stimulus_details['delay_frame_num'] = delay_frame_num
 
         trial_record['chosen_stim'] = stimulus_details
 
+        # the drift trajectory is for the phase loop. it is not logged
+        stimulus_details = dict(stimulus_details, drift_phases=drift_trajectory(stimulus_details, station))
+
         port_details = {}
         port_details['target_ports'] = 'response_port'
         port_details['distractor_ports'] = None
@@ -1574,7 +1436,7 @@ class GratingsGoOnly(btm.BaseTrialManager):
                  b. No response during response duration -> error sound
             4. ITL
         """
-        (stimulus_details,resolution,port_details,delay_frame_num) = self.calc_stim(trial_record=trial_record, station=station)
+        (stimulus_details,resolution,port_details,delay_frame_num) = self.calc_stim(trial_record=trial_record, station=station, subject=subject)
         hz = resolution[2]
         reward_size, request_reward_size, ms_penalty, ms_reward_sound, ms_penalty_sound = self.reinforcement_manager.calculate_reinforcement(subject=subject)
         reward_size = np.round(reward_size/1000.*hz)
@@ -1586,26 +1448,19 @@ class GratingsGoOnly(btm.BaseTrialManager):
         # Just display stim
         do_nothing = ()
 
-        # sounds
-        go_sound = station._sounds['go_sound']
-        go_sound.secs = 0.1
-        go_sound.seek(0.)
-        go_sound.status = NOT_STARTED
-        reward_sound = station._sounds['reward_sound']
-        reward_sound.secs = ms_reward_sound/1000.
-        reward_sound.seek(0.)
-        reward_sound.status = NOT_STARTED
-        punishment_sound = station._sounds['punishment_sound']
-        punishment_sound.seek(0.)
-        punishment_sound.status = NOT_STARTED
-
+        # sounds are rewound by the SoundScheduler when their phase starts. the
+        # punishment sound plays for the whole punishment phase
+        go_sound = (station._sounds['go_sound'], 0.1)
+        reward_sound = (station._sounds['reward_sound'], ms_reward_sound/1000.)
+        punishment_sound = (station._sounds['punishment_sound'], ms_penalty/1000.)
 
         # deal with the phases
         # delay phase
         self._Phases.append(ps.PhaseSpec(
             phase_number=0,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             stimulus_details=None,
             transitions={do_nothing: 1},
             frames_until_transition=delay_frame_num,
@@ -1618,7 +1473,7 @@ class GratingsGoOnly(btm.BaseTrialManager):
         # response phase
         self._Phases.append(ps.StimPhaseSpec(
             phase_number=1,
-            stimulus=psychopy.visual.GratingStim(win=station._window,tex='sin',sf=stimulus_details['deg_per_cyc'],size=stimulus_details['radius'],ori=stimulus_details['orientation'],phase=stimulus_details['phase'],contrast=stimulus_details['contrast'],units='deg',mask=None,autoLog=False),
+            stimulus=make_grating(self, station, stimulus_details),
             stimulus_update_fn=GratingsGoOnly.update_stimulus,
             stimulus_details=stimulus_details,
             transitions={port_details['target_ports']: 2, do_nothing: 3},
@@ -1627,43 +1482,46 @@ class GratingsGoOnly(btm.BaseTrialManager):
             phase_type='stimulus',
             phase_name='delay-stim',
             hz=hz,
-            sounds_played=[go_sound]))
+            sounds_played=go_sound))
 
         # reward phase spec
         self._Phases.append(ps.RewardPhaseSpec(
             phase_number=2,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             transitions={do_nothing: 4},
             frames_until_transition=reward_size,
             auto_trigger=False,
             phase_type='reinforcement',
             phase_name='reward_phase',
             hz=hz,
-            sounds_played=[reward_sound],
+            sounds_played=reward_sound,
             reward_valve='reward_valve'))
 
         # punishment phase spec
         self._Phases.append(ps.PunishmentPhaseSpec(
             phase_number=3,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             transitions={do_nothing: 4},
             frames_until_transition=penalty_size,
             auto_trigger=False,
             phase_type='reinforcement',
             phase_name='punishment_phase',
             hz=hz,
-            sounds_played=[punishment_sound]))
+            sounds_played=punishment_sound))
 
         # itl
         self._Phases.append(ps.PhaseSpec(
             phase_number=4,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             transitions=None,
             frames_until_transition=iti_size,
             auto_trigger=False,
@@ -1672,51 +1530,6 @@ class GratingsGoOnly(btm.BaseTrialManager):
             hz=hz,
             sounds_played=None))
 
-    @staticmethod
-    def trial_compiler(compiled_record, trial_record):
-        print('GRATINGSGOONLY:TRIAL_COMPILER::compiling trial')
-
-        try:
-            compiled_details = compiled_record['compiled_details']['GratingsGoOnly']
-        except KeyError as e:
-            traceback.print_stack()
-            compiled_details = {}
-            compiled_details['trial_number'] = []
-            compiled_details['deg_per_cyc'] = []
-            compiled_details['orientation'] = []
-            compiled_details['drift_frequency'] = []
-            compiled_details['phase'] = []
-            compiled_details['contrast'] = []
-            compiled_details['duration'] = []
-            compiled_details['location'] = []
-            compiled_details['radius'] = []
-            # compiled_details['radius_type'] = []
-            compiled_details['location'] = []
-            compiled_details['H'] = []
-            compiled_details['W'] = []
-            compiled_details['Hz'] = []
-            # put an empty compiled_details in the compiled_records
-            compiled_record['compiled_details']['GratingsGoOnly'] = compiled_details
-
-        compiled_details['trial_number'].append(trial_record['trial_number'])
-        compiled_details['deg_per_cyc'].append(trial_record['chosen_stim']['deg_per_cyc'])
-        compiled_details['orientation'].append(trial_record['chosen_stim']['orientation'])
-        compiled_details['drift_frequency'].append(trial_record['chosen_stim']['drift_frequency'])
-        compiled_details['phase'].append(trial_record['chosen_stim']['phase'])
-        compiled_details['contrast'].append(trial_record['chosen_stim']['contrast'])
-        compiled_details['duration'].append(trial_record['chosen_stim']['duration'])
-        compiled_details['radius'].append(trial_record['chosen_stim']['radius'])
-        compiled_details['radius_type'].append('None')
-        compiled_details['location'].append(trial_record['chosen_stim']['location'])
-        compiled_details['H'].append(trial_record['chosen_stim']['H'])
-        compiled_details['W'].append(trial_record['chosen_stim']['W'])
-        compiled_details['Hz'].append(trial_record['chosen_stim']['Hz'])
-
-        compiled_record['compiled_details'] = compiled_details
-
-        return compiled_details
-
-
 
 if __name__=='__main__':
     g = Gratings_GaussianEdge('SampleGratingsGaussianEdge',
@@ -0,0 +1,164 @@
+import math
+import time
+import numpy as np
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+# PhaseProfiler bins are log spaced from 1us to 10s, BINS_PER_DECADE per decade,
+# with an underflow bin first and an overflow bin last
+BINS_PER_DECADE = 10
+NUM_DECADES = 7
+PROFILE_BIN_EDGES_NS = np.concatenate(([0], 1000*np.logspace(0, NUM_DECADES, NUM_DECADES*BINS_PER_DECADE+1)))
+
+
+class FrameTimer(object):
+    """
+        FRAMETIMER records the time of every flip in a phase into a
+        preallocated ring buffer and summarizes the intervals between them.
+        Interval statistics are kept as running totals so that they stay
+        correct when a phase outlasts the buffer.
+            frame_period        : expected seconds between flips
+            capacity            : number of flip times kept
+            dropped_factor      : intervals longer than dropped_factor*
+                                  frame_period are counted as dropped frames
+            keep_frame_times    : add the flip times of the phase to its summary
+    """
+
+    def __init__(self, frame_period=1./60., capacity=4096, dropped_factor=1.5, keep_frame_times=False):
+        self.frame_period = frame_period
+        self.capacity = capacity
+        self.dropped_factor = dropped_factor
+        self.keep_frame_times = keep_frame_times
+        self._times = np.zeros(capacity, dtype='float64')
+        self.reset()
+
+    def __repr__(self):
+        return "FrameTimer object with %d frames" % self._num_frames
+
+    def reset(self):
+        """
+            start timing a new phase
+        """
+        self._num_frames = 0
+        self._last = None
+        self._interval_sum = 0.
+        self._interval_max = 0.
+        self._num_dropped = 0
+
+    def record(self, t):
+        """
+            log a flip at time t (seconds)
+        """
+        self._times[self._num_frames % self.capacity] = t
+        self._num_frames += 1
+        if self._last is not None:
+            interval = t-self._last
+            self._interval_sum += interval
+            if interval > self._interval_max:
+                self._interval_max = interval
+            if interval > self.dropped_factor*self.frame_period:
+                self._num_dropped += 1
+        self._last = t
+
+    def frame_times(self):
+        """
+            flip times still in the buffer, oldest first
+        """
+        if self._num_frames <= self.capacity:
+            return self._times[:self._num_frames].copy()
+        start = self._num_frames % self.capacity
+        return np.concatenate((self._times[start:], self._times[:start]))
+
+    def summary(self):
+        """
+            dict of frame statistics for phase_data
+        """
+        num_intervals = max(self._num_frames-1, 0)
+        summary = {}
+        summary['num_frames'] = self._num_frames
+        summary['frame_interval_mean'] = self._interval_sum/num_intervals if num_intervals else np.nan
+        summary['frame_interval_max'] = self._interval_max if num_intervals else np.nan
+        summary['num_dropped_frames'] = self._num_dropped
+        if self.keep_frame_times:
+            summary['frame_times'] = self.frame_times()
+        return summary
+
+
+def null_clock():
+    # stands in for PhaseProfiler.clock when profiling is off
+    return 0
+
+
+class PhaseProfiler(object):
+    """
+        PHASEPROFILER times the parts of the phase loop with perf_counter_ns
+        and counts the durations in fixed log spaced bins (PROFILE_BIN_EDGES_NS)
+        per phase_type and section. It is kept by the station for a session
+        and saved when the session closes.
+            path                : where save() writes the histograms (.npz)
+        sections timed by BaseTrialManager.do_trial are listed in SECTIONS.
+        FRAME_SECTIONS are timed on every frame (see record_frame)
+    """
+    SECTIONS = ('on_enter', 'sounds', 'draw', 'stimulus_update', 'flip', 'read_ports', 'prefetch', 'check_manual_quit')
+    FRAME_SECTIONS = ('sounds', 'draw', 'stimulus_update', 'flip', 'read_ports')
+
+    def __init__(self, path=None):
+        self.path = path
+        self.clock = time.perf_counter_ns
+        self._counts = {}
+        self._totals = {}
+        self._maxima = {}
+
+    def __repr__(self):
+        return "PhaseProfiler object with %d histograms" % len(self._counts)
+
+    def record(self, phase_type, section, duration_ns):
+        key = (phase_type, section)
+        counts = self._counts.get(key)
+        if counts is None:
+            counts = self._counts[key] = np.zeros(len(PROFILE_BIN_EDGES_NS), dtype='int64')
+            self._totals[key] = 0
+            self._maxima[key] = 0
+        if duration_ns < 1000:
+            counts[0] += 1
+        else:
+            counts[min(int(math.log10(duration_ns/1000.)*BINS_PER_DECADE)+1, len(counts)-1)] += 1
+        self._totals[key] += duration_ns
+        if duration_ns > self._maxima[key]:
+            self._maxima[key] = duration_ns
+
+    def record_frame(self, phase_type, stamps):
+        """
+            stamps are clock() readings taken at the start and at the end of
+            each of FRAME_SECTIONS, (start, stop, start, stop, ...). Work
+            between sections is not counted
+        """
+        for i, section in enumerate(self.FRAME_SECTIONS):
+            self.record(phase_type, section, stamps[2*i+1]-stamps[2*i])
+
+    def summary(self):
+        """
+            dict of (phase_type, section) -> (count, mean ns, max ns)
+        """
+        summary = {}
+        for key, counts in self._counts.items():
+            n = int(counts.sum())
+            summary[key] = (n, self._totals[key]/n if n else np.nan, self._maxima[key])
+        return summary
+
+    def save(self, path=None):
+        """
+            write bin_edges_ns and a counts array per '<phase_type>:<section>'
+        """
+        path = path or self.path
+        arrays = {'bin_edges_ns': PROFILE_BIN_EDGES_NS}
+        for (phase_type, section), counts in self._counts.items():
+            arrays['%s:%s' % (phase_type, section)] = counts
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
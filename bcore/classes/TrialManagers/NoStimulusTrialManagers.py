@@ -3,6 +3,7 @@ from verlib import NormalizedVersion as Ver
 import bcore.classes.TrialManagers.PhaseSpec as ps
 import bcore.classes.TrialManagers.BaseTrialManagers as btm
 import bcore.classes.ReinforcementManager as reinfmgr
+import bcore.classes.Distributions as dist
 
 import psychopy
 import random
@@ -41,12 +42,16 @@ class ClassicalConditioning(btm.BaseTrialManager):
                                 ('Uniform',[lo,hi])
                                 ('Gaussian',[mu,sd])
                                 ('FlatHazard',[pctile,val,fixed,max])
+                                ('Exponential',[scale,fixed])
+            delay_seed: seed of the delays. derived per subject and session.
+                        None draws new delays every session
             go_signal: can be psychopy.visual object or psychopy.sound object or None
             response_duration: float (seconds)
             
             VERSION HISTORY:
             0.0.1: Basic Functionality circa 12/01/2018
             0.0.2: Reformulated Sound functionality.
+            0.0.3: delays are presampled from a seeded Generator (delay_seed)
 
             TODO: 
             1. include go_signal. currently only psychopy.visual and psuchopy.sound object
@@ -56,16 +61,18 @@ class ClassicalConditioning(btm.BaseTrialManager):
     def __init__(self,
                  name = 'DefaultCC_ConstantDelay_1s',
                  delay_distribution = ('Constant',1.),
+                 delay_seed = None,
                  go_signal = None,
                  response_duration = 2.,
                  iti=1.,
                  itl=(0.,0.,0.,),**kwargs):
 
         super(ClassicalConditioning,self).__init__(iti=iti, itl=itl)
-        self.ver = Ver('0.0.2')
+        self.ver = Ver('0.0.3')
         self.reinforcement_manager = reinforcement_manager
         self.name = name
         self.delay_distribution = delay_distribution
+        self.delay_seed = delay_seed
         self.go_signal = go_signal
         self.response_duration = response_duration
 
@@ -76,28 +83,7 @@ class ClassicalConditioning(btm.BaseTrialManager):
         return "ClassicalConditioning trial manager object"
 
     def _verify_params_ok(self):
-        assert self.delay_distribution[0] in ['Constant', 'Uniform', 'Gaussian', 'FlatHazard'], 'what delay distributoin are you using?'
-
-    def sample_delay(self):
-        if self.delay_distribution[0]=='Constant':
-            return self.delay_distribution[1]
-        elif self.delay_distribution[0]=='Uniform':
-            lo = self.delay_distribution[1][0]
-            hi = self.delay_distribution[1][1]
-            return np.abs(np.random.uniform(low=lo,high=hi))
-        elif self.delay_distribution[0]=='Gaussian':
-            mu = self.delay_distribution[1][0]
-            sd = self.delay_distribution[1][1]
-            return np.abs(np.random.normal(loc=mu,scale=sd)) # returning absolute values
-        elif self.delay_distribution[0]=='FlatHazard':
-            pctile = self.delay_distribution[1][0]
-            val = self.delay_distribution[1][1]
-            fixed = self.delay_distribution[1][2]
-            max = self.delay_distribution[1][3]
-            p = -val/np.log(1-pctile)
-            delay = fixed+np.random.exponential(p)
-            if delay>max: delay=max
-            return delay
+        assert self.delay_distribution[0] in dist.DISTRIBUTIONS, 'what delay distribution are you using?'
 
     def choose_resolution(self, station, **kwargs):
         H = 1080
@@ -112,7 +98,7 @@ class ClassicalConditioning(btm.BaseTrialManager):
         port_details['target_ports'] = 'center_port'
         port_details['distractor_ports'] = None
 
-        delay_frame_num = np.round(self.sample_delay()*Hz)
+        delay_frame_num = np.round(self.sample_delay(trial_record=trial_record, subject=kwargs.get('subject'))*Hz)
         response_frame_num = np.round(self.response_duration*Hz)
 
         stimulus = {}
@@ -129,7 +115,7 @@ class ClassicalConditioning(btm.BaseTrialManager):
             2. ResponsePhase with a GO sound with duration set by response_duration
             3. Reward phase is standard
         """
-        (stimulus_details,resolution,port_details,delay_frame_num,response_frame_num) = self.calc_stim(trial_record=trial_record, station=station)
+        (stimulus_details,resolution,port_details,delay_frame_num,response_frame_num) = self.calc_stim(trial_record=trial_record, station=station, subject=subject)
         hz = resolution[2]
         reward_size, request_reward_size, ms_penalty, ms_reward_sound, ms_penalty_sound = self.reinforcement_manager.calculate_reinforcement(subject=subject)
         reward_size = np.round(reward_size/1000*hz)
@@ -153,8 +139,9 @@ class ClassicalConditioning(btm.BaseTrialManager):
         # delay phase
         self._Phases.append(ps.PhaseSpec(
             phase_number=0,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_update_fn=ClassicalConditioning.do_nothing_to_stim,
+            is_static=True,
             stimulus_details=None,
             transitions={do_nothing: 1},
             frames_until_transition=delay_frame_num,
@@ -167,8 +154,9 @@ class ClassicalConditioning(btm.BaseTrialManager):
         # response phase
         self._Phases.append(ps.StimPhaseSpec(
             phase_number=1,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_update_fn=ClassicalConditioning.do_nothing_to_stim,
+            is_static=True,
             stimulus_details=None,
             transitions={do_nothing: 2},
             frames_until_transition=response_frame_num,
@@ -181,9 +169,10 @@ class ClassicalConditioning(btm.BaseTrialManager):
         # reward phase spec
         self._Phases.append(ps.RewardPhaseSpec(
             phase_number=2,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=ClassicalConditioning.do_nothing_to_stim,
+            is_static=True,
             transitions=None,
             frames_until_transition=reward_size,
             auto_trigger=False,
@@ -216,7 +205,7 @@ class ClassicalConditioning(btm.BaseTrialManager):
 
         
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
         station._key_pressed = []
 
         trial_record,quit = super(ClassicalConditioning,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
@@ -224,7 +213,7 @@ class ClassicalConditioning(btm.BaseTrialManager):
 
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardKeyboardStation','StandardVisionHeadfixStation']:
+        if station.__class__.__name__ in ['StandardKeyboardStation','StandardVisionHeadfixStation','SimulatedStation']:
             return True
         else:
             return False
@@ -241,11 +230,15 @@ class AuditoryGoOnly(btm.BaseTrialManager):
                                 ('Uniform',[lo,hi])
                                 ('Gaussian',[mu,sd])
                                 ('FlatHazard',[pctile,val,fixed,max])
+                                ('Exponential',[scale,fixed])
+            delay_seed: seed of the delays. derived per subject and session.
+                        None draws new delays every session
             go_signal: can be psychopy.visual object or psychopy.sound object or None
             response_duration: float (seconds)
             
             VERSION HISTORY:
             0.0.1: Basic Functionality circa 12/13/2018
+            0.0.2: delays are presampled from a seeded Generator (delay_seed)
 
             TODO: 
             1. include go_signal. currently only psychopy.visual and psuchopy.sound object
@@ -256,15 +249,17 @@ class AuditoryGoOnly(btm.BaseTrialManager):
                  name = 'DefaultAuditory_Go_ConstantDelay_2s',
                  reinforcement_manager=reinfmgr.ConstantReinforcement(),
                  delay_distribution = ('Constant',2.),
+                 delay_seed = None,
                  go_signal = None,
                  response_duration = 2.,
                  iti=1.,
                  itl=(0.,0.,0.,),**kwargs):
         super(AuditoryGoOnly,self).__init__(iti=iti, itl=itl)
-        self.ver = Ver('0.0.1')
+        self.ver = Ver('0.0.2')
         self.reinforcement_manager = reinforcement_manager
         self.name = name
         self.delay_distribution = delay_distribution
+        self.delay_seed = delay_seed
         self.go_signal = go_signal
         self.response_duration = response_duration
 
@@ -275,28 +270,7 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         return "AuditoryGoOnly trial manager object"
 
     def _verify_params_ok(self):
-        assert self.delay_distribution[0] in ['Constant', 'Uniform', 'Gaussian', 'FlatHazard'], 'what delay distributoin are you using?'
-
-    def sample_delay(self):
-        if self.delay_distribution[0]=='Constant':
-            return self.delay_distribution[1]
-        elif self.delay_distribution[0]=='Uniform':
-            lo = self.delay_distribution[1][0]
-            hi = self.delay_distribution[1][1]
-            return np.abs(np.random.uniform(low=lo,high=hi))
-        elif self.delay_distribution[0]=='Gaussian':
-            mu = self.delay_distribution[1][0]
-            sd = self.delay_distribution[1][1]
-            return np.abs(np.random.normal(loc=mu,scale=sd)) # returning absolute values
-        elif self.delay_distribution[0]=='FlatHazard':
-            pctile = self.delay_distribution[1][0]
-            val = self.delay_distribution[1][1]
-            fixed = self.delay_distribution[1][2]
-            max = self.delay_distribution[1][3]
-            p = -val/np.log(1-pctile)
-            delay = fixed+np.random.exponential(p)
-            if delay>max: delay=max
-            return delay
+        assert self.delay_distribution[0] in dist.DISTRIBUTIONS, 'what delay distribution are you using?'
 
     def choose_resolution(self, station, **kwargs):
         H = 1080
@@ -311,7 +285,7 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         port_details['target_ports'] = 'response_port'
         port_details['distractor_ports'] = None
 
-        delay_frame_num = np.round(self.sample_delay()*Hz)
+        delay_frame_num = np.round(self.sample_delay(trial_record=trial_record, subject=kwargs.get('subject'))*Hz)
         response_frame_num = np.round(self.response_duration*Hz)
 
         stimulus = {}
@@ -329,7 +303,7 @@ class AuditoryGoOnly(btm.BaseTrialManager):
                  b. No response during response duration -> error sound
             4. ITL   
         """
-        (stimulus_details,resolution,port_details,delay_frame_num,response_frame_num) = self.calc_stim(trial_record=trial_record, station=station)
+        (stimulus_details,resolution,port_details,delay_frame_num,response_frame_num) = self.calc_stim(trial_record=trial_record, station=station, subject=subject)
         hz = resolution[2]
         reward_size, request_reward_size, ms_penalty, ms_reward_sound, ms_penalty_sound = self.reinforcement_manager.calculate_reinforcement(subject=subject)
         reward_size = np.round(reward_size/1000.*hz)
@@ -358,8 +332,9 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         # delay phase
         self._Phases.append(ps.PhaseSpec(
             phase_number=0,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_update_fn=AuditoryGoOnly.do_nothing_to_stim,
+            is_static=True,
             stimulus_details=None,
             transitions={do_nothing: 1},
             frames_until_transition=delay_frame_num,
@@ -372,8 +347,9 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         # response phase
         self._Phases.append(ps.StimPhaseSpec(
             phase_number=1,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             stimulus_details=None,
             transitions={port_details['target_ports']: 2, do_nothing: 3},
             frames_until_transition=response_frame_num,
@@ -386,9 +362,10 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         # reward phase spec
         self._Phases.append(ps.RewardPhaseSpec(
             phase_number=2,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             transitions={do_nothing: 4},
             frames_until_transition=reward_size,
             auto_trigger=False,
@@ -401,9 +378,10 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         # punishment phase spec
         self._Phases.append(ps.PunishmentPhaseSpec(
             phase_number=3,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=AuditoryGoOnly.do_nothing_to_stim,
+            is_static=True,
             transitions={do_nothing: 4},
             frames_until_transition=penalty_size,
             auto_trigger=False,
@@ -415,9 +393,10 @@ class AuditoryGoOnly(btm.BaseTrialManager):
         # itl
         self._Phases.append(ps.PhaseSpec(
             phase_number=4,
-            stimulus=psychopy.visual.Rect(win=station._window,width=station._window.size[0],height=station._window.size[1],fillColor=self.itl,autoLog=False),
+            stimulus=self.full_screen_rect(station),
             stimulus_details=None,
             stimulus_update_fn=btm.BaseTrialManager.do_nothing_to_stim,
+            is_static=True,
             transitions=None,
             frames_until_transition=iti_size,
             auto_trigger=False,
@@ -442,7 +421,7 @@ class AuditoryGoOnly(btm.BaseTrialManager):
             return trial_record,quit
 
         ## _setup_phases
-        self._setup_phases(trial_record=trial_record, station=station,compiled_record=compiled_record, subject=subject)
+        self.setup_trial(trial_record=trial_record, station=station,compiled_record=compiled_record,subject=subject)
         station._key_pressed = []
 
         trial_record,quit = super(AuditoryGoOnly,self).do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=compiled_record, quit=quit)
@@ -450,7 +429,7 @@ class AuditoryGoOnly(btm.BaseTrialManager):
 
     @staticmethod
     def station_ok_for_tm(station):
-        if station.__class__.__name__ in ['StandardKeyboardStation','StandardVisionHeadfixStation']:
+        if station.__class__.__name__ in ['StandardKeyboardStation','StandardVisionHeadfixStation','SimulatedStation']:
             return True
         else:
             return False
@@ -493,7 +472,7 @@ class RunForReward(btm.BaseTrialManager):
         return "RunForReward trial manager"
 
     def _verify_params_ok(self):
-        assert self.delay_distribution[0] in ['Constant', 'Uniform', 'Gaussian', 'FlatHazard'], 'what delay distribution are you using?'
+        assert self.delay_distribution[0] in dist.DISTRIBUTIONS, 'what delay distribution are you using?'
 
     def load_ino(self):
         if not self._ino_loaded:
@@ -501,27 +480,6 @@ class RunForReward(btm.BaseTrialManager):
             val = system(ino)
         if val:self._ino_loaded = True
 
-    def sample_delay(self):
-        if self.delay_distribution[0]=='Constant':
-            return self.delay_distribution[1]
-        elif self.delay_distribution[0]=='Uniform':
-            lo = self.delay_distribution[1][0]
-            hi = self.delay_distribution[1][1]
-            return np.abs(np.random.uniform(low=lo,high=hi))
-        elif self.delay_distribution[0]=='Gaussian':
-            mu = self.delay_distribution[1][0]
-            sd = self.delay_distribution[1][1]
-            return np.abs(np.random.normal(loc=mu,scale=sd)) # returning absolute values
-        elif self.delay_distribution[0]=='FlatHazard':
-            pctile = self.delay_distribution[1][0]
-            val = self.delay_distribution[1][1]
-            fixed = self.delay_distribution[1][2]
-            max = self.delay_distribution[1][3]
-            p = -val/np.log(1-pctile)
-            delay = fixed+np.random.exponential(p)
-            if delay>max: delay=max
-            return delay
-
 
 if __name__=='__main__':
     LFR = LickForReward('DefaultLFR')
@@ -7,7 +7,12 @@ __maintainer__ = "Balaji Sriram"
 __email__ = "balajisriram@gmail.com"
 __status__ = "Production"
 
+import numpy as np
+
 do_nothing = ()
+# entries of TransitionTable.table that are not phase indices
+NO_TRANSITION = -1
+END_OF_TRIAL = -2
 class PhaseSpec(object):
     """
         PHASESPEC acts as a kind of state machine. You start at the first phase
@@ -31,6 +36,12 @@ class PhaseSpec(object):
             beyond the end of the phase is cut off.
         phase_name: a text label for the given phase (stored in phaseRecords)
         sounds_played: (sound_name,sound_durnation_in_ms)
+        is_static: the stimulus is opaque, covers the window and does not
+            change during the phase. stations with render_static_phases_once
+            draw it on the first frames only and flip without clearing
+        marks_stim_onset: the stim onset rect is drawn with the stimulus
+            when the trial manager has draw_stim_onset_rect. True for
+            StimPhaseSpec
     """
 
     def __init__(self,
@@ -46,6 +57,8 @@ class PhaseSpec(object):
                  pins_to_trigger = [],
                  hz = None,
                  sounds_played = {},
+                 is_static = False,
+                 marks_stim_onset = False,
                  **kwargs):
         self.phase_number = phase_number
         self.stimulus = stimulus
@@ -59,6 +72,8 @@ class PhaseSpec(object):
         self.phase_name = phase_name
         self.pins_to_trigger = pins_to_trigger
         self.sounds_played = sounds_played
+        self.is_static = is_static
+        self.marks_stim_onset = marks_stim_onset
 
         do_nothing = ()
         if frames_until_transition != float('inf'):
@@ -73,8 +88,8 @@ class PhaseSpec(object):
     def on_exit(self,trial_record, **kwargs):
         return trial_record
 
-    def on_frame(self,station, trial_record, **kwargs):
-        station._window.flip()
+    def on_frame(self,station, trial_record, clear_buffer=True, **kwargs):
+        station._window.flip(clearBuffer=clear_buffer)
 
 
 class StimPhaseSpec(PhaseSpec):
@@ -95,6 +110,7 @@ class StimPhaseSpec(PhaseSpec):
                  pins_to_trigger = [],
                  hz = None,
                  sounds_played = {},
+                 marks_stim_onset = True,
                  **kwargs):
         super(StimPhaseSpec,self).__init__(phase_number = phase_number,
                                              stimulus = stimulus,
@@ -108,6 +124,7 @@ class StimPhaseSpec(PhaseSpec):
                                              pins_to_trigger = pins_to_trigger,
                                              hz = hz,
                                              sounds_played = sounds_played,
+                                             marks_stim_onset = marks_stim_onset,
                                              **kwargs)
 
     def __repr__(self):
@@ -124,9 +141,9 @@ class StimPhaseSpec(PhaseSpec):
         station.set_frame_pin_off()
         return trial_record
 
-    def on_frame(self,station,trial_record,**kwargs):
+    def on_frame(self,station,trial_record,clear_buffer=True,**kwargs):
         station.set_frame_pin_off()
-        station._window.flip()
+        station._window.flip(clearBuffer=clear_buffer)
         station.set_frame_pin_on() # on right after flip gets done
 
 
@@ -218,3 +235,61 @@ class PunishmentPhaseSpec(PhaseSpec):
         trial_record['punishment_duration'] = station._clocks['trial_clock'].getTime() - trial_record['punishment_duration']
         trial_record['reward_duration'] = 0.
         return trial_record
+
+
+class TransitionTable(object):
+    """
+        TRANSITIONTABLE is the integer form of the transitions of a list of
+        phases so that the frame loop only indexes arrays.
+            port_codes          : dict of port -> event code. event 0 is
+                                  do_nothing, i.e. frames_until_transition ran out
+            table               : int array (num_phases x num_events) of the
+                                  next phase index, NO_TRANSITION or END_OF_TRIAL
+            frames              : frames_until_transition for every phase
+            is_last             : phases without transitions end the trial
+        Use compile_transitions to make one.
+    """
+
+    def __init__(self, port_codes, table, frames, is_last):
+        self.port_codes = port_codes
+        self.table = table
+        self.frames = frames
+        self.is_last = is_last
+
+    def __repr__(self):
+        return "TransitionTable object with %d phases and %d events" % self.table.shape
+
+    def row(self, phase_num):
+        """
+            list of next phases for phase_num indexed by event code
+        """
+        return self.table[phase_num].tolist()
+
+
+def compile_transitions(phases, ports):
+    """
+        TransitionTable for phases. ports are the ports of the station.
+        Transition keys that are not in ports get event codes of their own
+    """
+    port_codes = {}
+    for port in ports:
+        port_codes.setdefault(port, len(port_codes)+1)
+    for phase in phases:
+        for key in (phase.transitions or {}):
+            if key != do_nothing:
+                port_codes.setdefault(key, len(port_codes)+1)
+
+    table = np.full((len(phases), len(port_codes)+1), NO_TRANSITION, dtype='int64')
+    frames = np.zeros(len(phases), dtype='float64')
+    is_last = np.zeros(len(phases), dtype='bool')
+    for i, phase in enumerate(phases):
+        frames[i] = phase.frames_until_transition
+        if phase.transitions is None:
+            # running out of frames with no transitions at all ends the trial
+            table[i, 0] = END_OF_TRIAL
+        if not phase.transitions:
+            is_last[i] = True
+            continue
+        for key, target in phase.transitions.items():
+            table[i, 0 if key == do_nothing else port_codes[key]] = target
+    return TransitionTable(port_codes, table, frames, is_last)
@@ -0,0 +1,72 @@
+from psychopy.constants import NOT_STARTED
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+
+def is_timed(sounds_played):
+    # (sound, seconds) as opposed to a list of sounds
+    return isinstance(sounds_played, tuple) and len(sounds_played)==2 and isinstance(sounds_played[1], (int, float))
+
+
+class SoundScheduler(object):
+    """
+        SOUNDSCHEDULER plays the sounds_played of a phase from the frame loop
+        of BaseTrialManager.do_trial. sounds_played is either
+            [sound, ...]        : every sound that has not been started is
+                                  played. it runs to its end or to the end
+                                  of the phase
+            (sound, seconds)    : sound is rewound and played for seconds
+                                  from the start of the phase
+        Stop times are checked against the trial clock so nothing is made
+        per phase. Subclass it and give it to the trial manager
+        (sound_scheduler=...) to change when sounds start and stop.
+    """
+
+    def __init__(self):
+        self._sounds = []
+        self._stop_time = None
+        self._clock = None
+
+    def __repr__(self):
+        return "SoundScheduler object with %d sounds" % len(self._sounds)
+
+    def start_phase(self, sounds_played, clock):
+        """
+            schedule sounds_played for a phase starting now on clock
+        """
+        self._clock = clock
+        self._stop_time = None
+        if not sounds_played:
+            self._sounds = []
+        elif is_timed(sounds_played):
+            sound, duration = sounds_played
+            sound.seek(0.)
+            sound.status = NOT_STARTED
+            self._sounds = [sound]
+            self._stop_time = clock.getTime()+duration
+        else:
+            self._sounds = list(sounds_played)
+
+    def update(self):
+        """
+            called once per frame
+        """
+        for snd in self._sounds:
+            if snd.status==NOT_STARTED: snd.play()
+        if self._stop_time is not None and self._clock.getTime() >= self._stop_time:
+            for snd in self._sounds: snd.stop()
+            self._stop_time = None
+
+    def stop(self):
+        """
+            stop the sounds of the phase. called when the phase ends
+        """
+        for snd in self._sounds: snd.stop()
+        self._sounds = []
+        self._stop_time = None
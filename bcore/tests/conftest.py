@@ -0,0 +1,7 @@
+# psychopy.visual makes a pyglet shadow window on import, which needs a
+# display. the tests only use NullWindow stations
+import pyglet
+pyglet.options['shadow_window'] = False
+
+# test_sounds.py is a manual script that opens a window
+collect_ignore = ['test_sounds.py']
@@ -0,0 +1,129 @@
+import pytest
+import numpy as np
+from bcore.classes.CompiledRecord import ColumnStore, CompiledRecord, LookupTable, compile_records, register_details_schema
+
+# compiled_details columns of trials run by 'TestTrialManager'
+register_details_schema('TestTrialManager', (('contrast', 'float64', 'chosen_stim.contrast'),))
+
+
+def make_trial_record(trial_number, session_number=1, **kwargs):
+    trial_record = {'trial_number': trial_number, 'session_number': session_number, 'subject_id': 'test_subject',
+                    'correct': trial_number % 2 == 0, 'trial_manager_name': 'tm_%d' % session_number}
+    trial_record.update(kwargs)
+    return trial_record
+
+
+def make_compiled_record(num_sessions=3, trials_per_session=4):
+    compiled_record = CompiledRecord()
+    for i in range(num_sessions*trials_per_session):
+        # station_id is only known in the first session
+        compile_records(compiled_record, make_trial_record(i+1, session_number=i//trials_per_session+1, trial_manager_class='TestTrialManager',
+                                                           chosen_stim={'contrast': (i+1)/10.}, station_id=1 if i < trials_per_session else None))
+    return compiled_record
+
+
+def test_save_and_load(tmp_path):
+    compiled_record = make_compiled_record()
+    compiled_record.save_to_path(str(tmp_path))
+    loaded = CompiledRecord().load_from_path(str(tmp_path))
+    assert len(loaded) == 12
+    for field in ('trial_number', 'session_number', 'correct', 'subject_id'):
+        assert np.array_equal(loaded[field], compiled_record[field])
+    assert list(loaded.decode('trial_manager_name')) == list(compiled_record.decode('trial_manager_name'))
+    assert list(loaded.is_valid('station_id')) == [True]*4+[False]*8
+    # no trial had a current_step
+    assert list(loaded['current_step']) == [-1]*12 and not loaded.is_valid('current_step').any()
+    assert np.allclose(loaded['compiled_details']['TestTrialManager']['contrast'], np.arange(1, 13)/10.)
+
+    # only the new rows are appended
+    compile_records(loaded, make_trial_record(13, session_number=4))
+    loaded.save_to_path(str(tmp_path))
+    reloaded = CompiledRecord().load_from_path(str(tmp_path))
+    assert list(reloaded['trial_number']) == list(range(1, 14))
+    assert reloaded.decode('trial_manager_name')[-1] == 'tm_4'
+
+
+def test_save_and_load_dict():
+    compiled_record = make_compiled_record()
+    loaded = CompiledRecord(data=compiled_record.save_to_dict())
+    assert np.array_equal(loaded['trial_number'], compiled_record['trial_number'])
+    assert list(loaded.decode('trial_manager_name')) == list(compiled_record.decode('trial_manager_name'))
+
+
+def test_windowed_loads(tmp_path):
+    make_compiled_record().save_to_path(str(tmp_path))
+    last = CompiledRecord().load_from_path(str(tmp_path), last_n=5)
+    assert list(last['trial_number']) == list(range(8, 13))
+    assert np.allclose(last['compiled_details']['TestTrialManager']['contrast'], np.arange(8, 13)/10.)
+
+    since = CompiledRecord().load_from_path(str(tmp_path), since_session=2)
+    assert list(since['session_number']) == [2]*4+[3]*4
+    assert list(since['compiled_details']['TestTrialManager']['trial_number']) == list(range(5, 13))
+
+    columns = CompiledRecord().load_from_path(str(tmp_path), columns=['correct'])
+    assert set(columns.keys()) == {'correct', 'session_number', 'trial_number'}
+
+    # rows outside the window are kept when a window is saved
+    compile_records(last, make_trial_record(13, session_number=4))
+    last.save_to_path(str(tmp_path))
+    assert list(CompiledRecord().load_from_path(str(tmp_path))['trial_number']) == list(range(1, 14))
+
+
+def test_long_strings_are_not_truncated(tmp_path):
+    long_id = 'subject_'+'x'*100
+    compiled_record = CompiledRecord()
+    compile_records(compiled_record, make_trial_record(1))
+    compile_records(compiled_record, make_trial_record(2, subject_id=long_id))
+    assert list(compiled_record['subject_id']) == ['test_subject', long_id]
+
+    # widened columns are rewritten on save
+    compiled_record.save_to_path(str(tmp_path))
+    compile_records(compiled_record, make_trial_record(3, subject_id=long_id+'y'))
+    compiled_record.save_to_path(str(tmp_path))
+    loaded = CompiledRecord().load_from_path(str(tmp_path))
+    assert list(loaded['subject_id']) == ['test_subject', long_id, long_id+'y']
+
+
+def test_long_strings_in_legacy_records():
+    long_id = 'y'*80
+    compiled_record = CompiledRecord(data={'trial_number': [1, 2], 'session_number': [1, 1], 'subject_id': ['a', long_id], 'LUT': []})
+    assert compiled_record['subject_id'][1] == long_id
+    assert compiled_record['subject_id'].dtype == np.dtype('U80')
+
+
+def test_lut_rejects_values_that_cannot_be_saved():
+    lut = LookupTable()
+    assert lut.intern('a') == 0
+    assert lut.intern(1.5) == 1
+    assert lut.intern('a') == 0
+    with pytest.raises(TypeError, match='not hashable'):
+        lut.intern(['a'])
+    with pytest.raises(TypeError, match='cannot be saved'):
+        lut.intern(('a', 1))
+    assert list(lut) == ['a', 1.5]
+    # values that compare equal keep their own codes
+    assert [lut.intern(True), lut.intern(1), lut.intern(1.), lut.intern(True)] == [2, 3, 4, 2]
+    assert list(lut)[2:] == [True, 1, 1.]
+
+
+def test_columns_are_promoted_for_wider_values(tmp_path):
+    store = ColumnStore()
+    store.append({'trial_number': 1, 'value': 1, 'flag': True})
+    store.append({'trial_number': 2, 'value': 1.5, 'flag': 2})
+    store.append({'trial_number': 3})
+    assert store['value'].dtype == np.dtype('float64') and list(store['value'][:2]) == [1., 1.5]
+    assert np.isnan(store['value'][2])
+    assert list(store['flag'][:2]) == [1, 2]
+    with pytest.raises(ValueError):
+        store.append({'trial_number': 4, 'value': 'x'})
+    # nothing of the row that did not fit is left behind
+    store.append({'flag': 3})
+    assert not store.is_valid('trial_number')[3]
+    # a promoted column is rewritten when saved
+    compiled_record = make_compiled_record()
+    compiled_record.save_to_path(str(tmp_path))
+    loaded = CompiledRecord().load_from_path(str(tmp_path))
+    compile_records(loaded, make_trial_record(13, session_number=4, station_id=1.5))
+    loaded.save_to_path(str(tmp_path))
+    reloaded = CompiledRecord().load_from_path(str(tmp_path))
+    assert reloaded['station_id'][-1] == 1.5 and list(reloaded['station_id'][:4]) == [1.]*4
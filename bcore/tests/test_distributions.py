@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from bcore.classes.Distributions import Constant, Uniform, Gaussian, FlatHazard, Presampler, from_spec
+
+
+def test_from_spec():
+    assert isinstance(from_spec(('Constant', 0.5)), Constant)
+    uniform = from_spec(('Uniform', [0.1, 0.5]))
+    assert isinstance(uniform, Uniform) and uniform.reflect
+    assert from_spec(uniform) is uniform
+    with pytest.raises(ValueError):
+        from_spec(('Poisson', 1.))
+
+
+def test_samples_are_within_bounds():
+    rng = np.random.default_rng(1)
+    values = Gaussian(0., 1., low=-0.5, high=0.5).sample(1000, rng)
+    assert values.shape == (1000,)
+    assert values.min() >= -0.5 and values.max() <= 0.5
+    assert (from_spec(('Gaussian', [0., 1.])).sample(1000, rng) >= 0).all()
+    assert np.array_equal(Constant(2.).sample(3), [2., 2., 2.])
+    values = FlatHazard(0.5, 1., 0.2, 3.).sample(1000, rng)
+    assert values.min() >= 0.2 and values.max() <= 3.
+    # half the delays after fixed are shorter than val
+    assert abs(np.mean(values-0.2 < 1.)-0.5) < 0.1
+
+
+def test_impossible_bounds():
+    with pytest.raises(ValueError):
+        Uniform(0., 1., low=2.).sample(10, np.random.default_rng(1))
+
+
+def test_presampler_only_depends_on_the_seed():
+    presampler = Presampler(('Uniform', [0.1, 0.5]), seed=1, batch_size=4)
+    values = [presampler.pop() for i in range(10)]
+    again = Presampler(('Uniform', [0.1, 0.5]), seed=1, batch_size=4)
+    assert [again.pop() for i in range(10)] == values
+    assert all(0.1 <= value <= 0.5 for value in values)
+    assert values != [Presampler(('Uniform', [0.1, 0.5]), seed=2, batch_size=4).pop() for i in range(10)]
+
+
+def test_presampler_state():
+    presampler = Presampler(('Exponential', [1., 0.]), seed=1, batch_size=3)
+    presampler.pop()
+    state = presampler.get_state()
+    values = [presampler.pop() for i in range(5)]
+    presampler.set_state(state)
+    assert [presampler.pop() for i in range(5)] == values
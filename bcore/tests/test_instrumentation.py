@@ -0,0 +1,77 @@
+import bcore.classes.Station as st
+import bcore.classes.TrialManagers.GratingsTrialManagers as gtm
+from bcore.classes.TrialManagers.Instrumentation import PhaseProfiler
+from bcore.classes.TrialManagers.SoundScheduler import SoundScheduler
+from test_trial_managers import make_subject, make_station, make_reinforcement_manager, run_trial
+
+# ns each kind of work takes on the fake clock. one decimal digit per
+# section, so a duration shows which kinds of work it contains
+UNITS = {'on_enter': 1, 'sounds': 10, 'draw': 100, 'stimulus_update': 1000, 'flip': 10000,
+         'read_ports': 100000, 'prefetch': 1000000, 'check_manual_quit': 10000000,
+         'record_frame': 100000000}
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def work(self, section, fn=None):
+        def timed(*args, **kwargs):
+            self.now += UNITS[section]
+            if fn is not None:
+                return fn(*args, **kwargs)
+        return timed
+
+
+class RawProfiler(PhaseProfiler):
+    # keeps every duration as well as the histograms
+
+    def __init__(self, **kwargs):
+        super(RawProfiler, self).__init__(**kwargs)
+        self.durations = {}
+
+    def record(self, phase_type, section, duration_ns):
+        self.durations.setdefault(section, []).append(duration_ns)
+        super(RawProfiler, self).record(phase_type, section, duration_ns)
+
+    def record_frame(self, phase_type, stamps):
+        # bookkeeping of the profiler must not be timed as a section
+        self.clock.now += UNITS['record_frame']
+        super(RawProfiler, self).record_frame(phase_type, stamps)
+
+
+def test_sections_only_time_their_own_work(monkeypatch):
+    clock = FakeClock()
+    profiler = RawProfiler()
+    profiler.clock = clock
+
+    monkeypatch.setattr(SoundScheduler, 'update', clock.work('sounds', SoundScheduler.update))
+    monkeypatch.setattr(st.NullStimulus, 'draw', clock.work('draw'))
+    monkeypatch.setattr(gtm.Gratings2AFC, 'update_stimulus', staticmethod(clock.work('stimulus_update')))
+    monkeypatch.setattr(gtm.Gratings2AFC, 'do_nothing_to_stim', staticmethod(clock.work('stimulus_update')))
+    monkeypatch.setattr(st.NullWindow, 'flip', clock.work('flip', st.NullWindow.flip))
+    monkeypatch.setattr(st.SimulatedStation, 'read_ports', clock.work('read_ports', st.SimulatedStation.read_ports))
+    monkeypatch.setattr(st.SimulatedStation, 'on_phase_enter', clock.work('on_enter', st.SimulatedStation.on_phase_enter))
+    monkeypatch.setattr(st.SimulatedStation, 'check_manual_quit', clock.work('check_manual_quit', st.SimulatedStation.check_manual_quit))
+
+    subject = make_subject()
+    station = make_station(subject)
+    station._phase_profiler = profiler
+    trial_manager = gtm.Gratings2AFC(reinforcement_manager=make_reinforcement_manager())
+    trial_manager.prefetch = True
+    # the trial is set up before the phase loop and is not timed. the prefetch is
+    trial_manager._setup_phases = clock.work('prefetch', trial_manager._setup_phases)
+    trial_record, quit = run_trial(trial_manager, station, subject)
+    assert not trial_record['errored_out']
+
+    assert set(profiler.durations) == set(PhaseProfiler.SECTIONS)
+    assert len(profiler.durations['prefetch']) == 1
+    for section, durations in profiler.durations.items():
+        for duration in durations:
+            # a section holds one to nine pieces of its own work and nothing else
+            assert duration % UNITS[section] == 0, section
+            assert UNITS[section] <= duration < 10*UNITS[section], section
@@ -0,0 +1,44 @@
+import itertools
+import bcore.classes.TrialManagers.PhaseSpec as ps
+from bcore.classes.TrialManagers.PhaseSpec import do_nothing, compile_transitions, NO_TRANSITION, END_OF_TRIAL
+
+PORTS = ('left_port', 'center_port', 'right_port')
+
+
+def make_phases():
+    return [
+        ps.PhaseSpec(phase_number=0, transitions={'center_port': 1}),
+        ps.PhaseSpec(phase_number=1, transitions={do_nothing: 2, 'left_port': 3, 'right_port': 4}, frames_until_transition=10),
+        # a key that is not a port of the station (as in GratingsGoOnly)
+        ps.PhaseSpec(phase_number=2, transitions={('left_port', 'right_port'): 3, do_nothing: 4}, frames_until_transition=5),
+        ps.PhaseSpec(phase_number=3, transitions={do_nothing: 5}, frames_until_transition=3),
+        ps.PhaseSpec(phase_number=4, transitions={}),
+        ps.PhaseSpec(phase_number=5, transitions=None, frames_until_transition=2),
+    ]
+
+
+def baseline_next_phase(phase, event):
+    # the transition rules of the dict based frame loop the table replaced
+    transition = phase.transitions
+    if event == do_nothing:
+        if transition and do_nothing in transition:
+            return transition[do_nothing]
+        if transition is None:
+            return END_OF_TRIAL
+        return NO_TRANSITION
+    if transition and event in transition:
+        return transition[event]
+    return NO_TRANSITION
+
+
+def test_transition_table_matches_baseline():
+    phases = make_phases()
+    table = compile_transitions(phases, PORTS)
+    events = [do_nothing]+list(PORTS)+[('left_port', 'right_port')]
+    for (i, phase), event in itertools.product(enumerate(phases), events):
+        code = 0 if event == do_nothing else table.port_codes[event]
+        assert table.row(i)[code] == baseline_next_phase(phase, event)
+    assert list(table.frames) == [phase.frames_until_transition for phase in phases]
+    assert list(table.is_last) == [not phase.transitions for phase in phases]
+    # ports of the station come first, in order
+    assert [table.port_codes[port] for port in PORTS] == [1, 2, 3]
@@ -0,0 +1,63 @@
+import time
+from bcore.classes.PortSampler import PortSampler
+
+
+class Ports(object):
+    # ports pressed by the test and read by the sampler thread
+
+    def __init__(self):
+        self.pressed = []
+
+    def read_ports(self):
+        return list(self.pressed)
+
+
+def wait_for(sampler, active, timeout=2.):
+    # until the sampler thread has seen the ports in active
+    stop = time.perf_counter()+timeout
+    while sampler.active != frozenset(active):
+        assert time.perf_counter() < stop, 'sampler did not see %s' % (active,)
+        time.sleep(0.001)
+
+
+def test_lick_while_another_port_is_held():
+    ports = Ports()
+    sampler = PortSampler(ports.read_ports, time.perf_counter, rate=2000.)
+    sampler.start()
+    try:
+        ports.pressed = ['left_port']
+        wait_for(sampler, ['left_port'])
+        assert sampler.responses(sampler.drain()) == ['left_port']
+        # still held. no new events
+        assert sampler.responses(sampler.drain()) == ['left_port']
+
+        # a lick on center between two frames while left is held
+        ports.pressed = ['left_port', 'center_port']
+        wait_for(sampler, ['left_port', 'center_port'])
+        ports.pressed = ['left_port']
+        wait_for(sampler, ['left_port'])
+        events = sampler.drain()
+        assert [(port, is_rising) for t, port, is_rising in events] == [('center_port', True), ('center_port', False)]
+        assert sampler.responses(events) == ['center_port']
+        assert sampler.drained_active == frozenset(['left_port'])
+
+        ports.pressed = []
+        wait_for(sampler, [])
+        assert sampler.responses(sampler.drain()) == []
+    finally:
+        sampler.stop()
+
+
+def test_responses_use_state_as_of_the_drain():
+    ports = Ports()
+    sampler = PortSampler(ports.read_ports, time.perf_counter, rate=2000.)
+    sampler.start()
+    try:
+        events = sampler.drain()
+        # pressed after the drain. not a response to events drained before it
+        ports.pressed = ['right_port']
+        wait_for(sampler, ['right_port'])
+        assert sampler.responses(events) == []
+        assert sampler.responses(sampler.drain()) == ['right_port']
+    finally:
+        sampler.stop()
@@ -0,0 +1,43 @@
+import numpy as np
+from bcore.classes.Schedule import BlockSchedule, full_factorial, subject_seed
+
+LEVELS = [('orientation', 3), ('contrast', 2)]
+
+
+def test_full_factorial():
+    combos = full_factorial(LEVELS)
+    assert len(combos) == 6
+    assert list(combos['orientation']) == [0, 0, 1, 1, 2, 2]
+    assert list(combos['contrast']) == [0, 1, 0, 1, 0, 1]
+
+
+def test_blocks_are_balanced():
+    schedule = BlockSchedule(LEVELS, repeats=2, seed=1, num_blocks=3)
+    assert schedule.block_size == 12
+    # runs past the blocks made up front
+    rows = [schedule[i] for i in range(5*schedule.block_size)]
+    for block in range(5):
+        counts = {}
+        for row in rows[block*12:(block+1)*12]:
+            key = (int(row['orientation']), int(row['contrast']))
+            counts[key] = counts.get(key, 0)+1
+        assert counts == {key: 2 for key in counts} and len(counts) == 6
+
+
+def test_seeded_schedules_are_reproducible(tmp_path):
+    schedule = BlockSchedule(LEVELS, seed=1, num_blocks=2)
+    again = BlockSchedule(LEVELS, seed=1, num_blocks=2)
+    assert np.array_equal(schedule.schedule, again.schedule)
+    assert not np.array_equal(schedule.schedule, BlockSchedule(LEVELS, seed=2, num_blocks=2).schedule)
+
+    # a loaded schedule continues as the saved one would
+    schedule[20]
+    path = str(tmp_path / 'schedule.npz')
+    schedule.save(path)
+    loaded = BlockSchedule.load(path)
+    assert [tuple(loaded[i]) for i in range(40)] == [tuple(schedule[i]) for i in range(40)]
+
+
+def test_subject_seed():
+    assert subject_seed(1, 'a', 1) == subject_seed(1, 'a', 1)
+    assert len({subject_seed(1, 'a', 1), subject_seed(1, 'b', 1), subject_seed(1, 'a', 2), subject_seed(2, 'a', 1)}) == 4
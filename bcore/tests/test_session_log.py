@@ -0,0 +1,89 @@
+import os
+import copy
+import pytest
+from bcore.classes.SessionLog import SessionLogWriter, TrialIndex, read_session_log, read_session_log_at, recover_session_log, FRAME_HEADER, MAGIC
+
+
+def make_index(tmp_path):
+    return TrialIndex(str(tmp_path / 'trials.index'), lambda session_number: str(tmp_path / 'session_{0}.session_log'.format(session_number)))
+
+
+def write_session(index, session_number, trial_numbers):
+    with SessionLogWriter(index.session_log_path(session_number), trial_index=index, session_number=session_number) as log:
+        return [log.append({'session_number': session_number, 'trial_number': trial_number, 'data': 'x'*trial_number})
+                for trial_number in trial_numbers]
+
+
+def test_frames_round_trip(tmp_path):
+    index = make_index(tmp_path)
+    offsets = write_session(index, 1, [1, 2, 3])
+    path = index.session_log_path(1)
+    assert [record['trial_number'] for record in read_session_log(path)] == [1, 2, 3]
+    assert read_session_log_at(path, offsets[1])['trial_number'] == 2
+    assert index.read_trial(session_number=1, trial=3)['data'] == 'xxx'
+    assert index.read_trial(trial_number=2)['trial_number'] == 2
+    assert index.sessions() == {1: (1, 3, path)}
+    with pytest.raises(KeyError):
+        index.locate(session_number=1, trial=4)
+
+
+def test_corrupt_frame_ends_the_log(tmp_path):
+    index = make_index(tmp_path)
+    offsets = write_session(index, 1, [1, 2, 3])
+    path = index.session_log_path(1)
+    with open(path, 'r+b') as f:
+        f.seek(offsets[1]+FRAME_HEADER.size)
+        f.write(b'!')
+    assert [record['trial_number'] for record in read_session_log(path)] == [1]
+    with pytest.raises(ValueError):
+        read_session_log_at(path, offsets[1])
+
+
+def test_partial_frame_is_dropped_before_appending(tmp_path):
+    index = make_index(tmp_path)
+    offsets = write_session(index, 1, [1, 2])
+    path = index.session_log_path(1)
+    end = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(FRAME_HEADER.pack(100, 0)+b'partial')
+    assert recover_session_log(path) == (2, end)
+    assert os.path.getsize(path) == end
+    write_session(index, 1, [3])
+    assert [record['trial_number'] for record in read_session_log(path)] == [1, 2, 3]
+    assert list(index.entries()['offset'][:2]) == offsets
+
+
+def test_rerun_session_replaces_its_entries(tmp_path):
+    index = make_index(tmp_path)
+    write_session(index, 1, [1, 2])
+    write_session(index, 2, [3, 4])
+    os.remove(index.session_log_path(1))
+    write_session(index, 1, [1])
+    assert sorted(index.entries()['session_number']) == [1, 2, 2]
+    assert index.sessions() == {1: (1, 1, index.session_log_path(1)), 2: (3, 4, index.session_log_path(2))}
+    assert index.read_trial(session_number=1, trial=1)['trial_number'] == 1
+    assert index.read_trial(session_number=2, trial=2)['trial_number'] == 4
+
+
+def test_index_past_the_log_is_rebuilt(tmp_path):
+    # the index was synced but the last frame of the log was lost in a crash
+    index = make_index(tmp_path)
+    offsets = write_session(index, 1, [1, 2, 3])
+    path = index.session_log_path(1)
+    with open(path, 'r+b') as f:
+        f.truncate(offsets[2]+FRAME_HEADER.size)
+    assert not index.check_session(1, *recover_session_log(path))
+    assert list(index.entries()['trial_number']) == [1, 2]
+    assert index.check_session(1, *recover_session_log(path))
+
+
+def test_index_is_read_once(tmp_path):
+    index = make_index(tmp_path)
+    write_session(index, 1, [1, 2])
+    # entries appended after the index was read are located from memory
+    os.remove(index.path)
+    write_session(index, 2, [3])
+    assert index.locate(session_number=2, trial=1) == (index.session_log_path(2), len(MAGIC))
+    assert index.read_trial(trial_number=2)['trial_number'] == 2
+    assert list(make_index(tmp_path).entries()['trial_number']) == [3]
+    assert list(copy.deepcopy(index).entries()['trial_number']) == [3]
@@ -0,0 +1,99 @@
+import copy
+import pytest
+import bcore.classes.Station as st
+import bcore.classes.Protocol as pr
+import bcore.classes.Criterion as crit
+import bcore.classes.SessionManager as sessmgr
+import bcore.classes.TrialManagers.GratingsTrialManagers as gtm
+from bcore.classes.CompiledRecord import CompiledRecord
+from test_trial_managers import make_subject, make_reinforcement_manager
+
+
+def make_session_subject(path, criteria):
+    # subject whose records go to path, seeded with the base compiled record
+    # BServerLocal.create_base_compiled_record_file makes for a new subject
+    subject = make_subject(path)
+    subject.get_compiled_records_path = lambda: str(path / 'test_subject.compiled')
+    subject.get_legacy_compiled_records_files = lambda: []
+    subject.get_session_log_path = lambda session_number: str(path / 'session_{0}.session_log'.format(session_number))
+    CompiledRecord(data={'session_number': [0], 'trial_number': [0], 'LUT': [], 'compiled_details': {}}).save_to_path(subject.get_compiled_records_path())
+    # one step per criterion
+    steps = [pr.TrainingStep('step_%d' % i, gtm.Gratings2AFC(reinforcement_manager=make_reinforcement_manager()), sessmgr.NoTimeOff(), criterion)
+             for i, criterion in enumerate(criteria)]
+    subject.add_protocol(pr.SequentialProtocol(training_steps=steps, name='test_protocol'))
+    return subject
+
+
+def run_session(subject, max_trials, session_number=1, **kwargs):
+    station = st.SimulatedStation(max_trials=max_trials)
+    for key, value in kwargs.items():
+        setattr(station, key, value)
+    station.subject = subject
+    station.do_trials()
+    return list(subject.load_session_records(session_number))
+
+
+def test_do_trials_on_simulated_station(tmp_path):
+    subject = make_session_subject(tmp_path, [crit.RepeatIndefinitely()])
+    trial_records = run_session(subject, max_trials=3)
+    assert [trial_record['trial_number'] for trial_record in trial_records] == [1, 2, 3]
+    assert not any(trial_record['errored_out'] for trial_record in trial_records)
+    assert trial_records[0]['subject_version_number'] == str(subject.ver)
+    compiled_record = subject.load_compiled_records()
+    assert list(compiled_record['trial_number']) == [0, 1, 2, 3]
+    assert list(compiled_record['session_number']) == [0, 1, 1, 1]
+
+
+def test_num_trials_done_criterion_graduates(tmp_path):
+    subject = make_session_subject(tmp_path, [crit.NumTrialsDoneCriterion(num_trials=3), crit.RepeatIndefinitely()])
+    trial_records = run_session(subject, max_trials=6)
+    # the criterion only sees trials already in the compiled record. it is
+    # met on the trial after the third one
+    assert [trial_record['current_step'] for trial_record in trial_records] == [0, 0, 0, 0, 1, 1]
+    assert [trial_record['criterion_met'] for trial_record in trial_records] == [False, False, False, True, False, False]
+    assert [trial_record['current_step_name'] for trial_record in trial_records][-1] == 'step_1'
+    assert subject.protocol.current_step == 1
+
+
+def test_criteria_see_the_current_step_past_the_window(tmp_path):
+    subject = make_session_subject(tmp_path, [crit.NumTrialsDoneCriterion(num_trials=3), crit.RepeatIndefinitely()])
+    run_session(subject, max_trials=2)
+    # only the last trial of the first session is in the window
+    trial_records = run_session(subject, max_trials=3, session_number=2, compiled_record_window=1)
+    assert [trial_record['criterion_met'] for trial_record in trial_records] == [False, True, False]
+
+
+def test_on_session_end_runs_after_the_compiled_records_are_saved(tmp_path):
+    subject = make_session_subject(tmp_path, [crit.RepeatIndefinitely()])
+    station = st.SimulatedStation(max_trials=2)
+    station.subject = subject
+    saved = []
+
+    def save_server():
+        # BServerLocal.save deep copies the server with its stations
+        saved.append((copy.deepcopy(station), list(subject.load_compiled_records()['trial_number'])))
+    station.do_trials(on_session_end=save_server)
+    copied, trial_numbers = saved[0]
+    assert trial_numbers == [0, 1, 2]
+    assert copied._record_writer is None and copied._window is None
+
+
+def test_writer_errors_do_not_hide_the_session_error(tmp_path, capsys):
+    subject = make_session_subject(tmp_path, [crit.RepeatIndefinitely()])
+    open_session_log = subject.open_session_log
+    do_trial = subject.do_trial
+
+    def open_failing_log(session_number):
+        session_log = open_session_log(session_number)
+        session_log.append_payload = lambda payload, key=None: 1/0
+        return session_log
+
+    def do_failing_trial(**kwargs):
+        if kwargs['trial_record']['trial_number'] == 2:
+            raise ValueError('trial failed')
+        return do_trial(**kwargs)
+    subject.open_session_log = open_failing_log
+    subject.do_trial = do_failing_trial
+    with pytest.raises(ValueError, match='trial failed'):
+        run_session(subject, max_trials=3)
+    assert 'ZeroDivisionError' in capsys.readouterr().out
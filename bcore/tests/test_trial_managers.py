@@ -0,0 +1,127 @@
+import pytest
+import bcore.classes.Station as st
+import bcore.classes.Subject as sj
+import bcore.classes.ResponsePolicies as rp
+import bcore.classes.ReinforcementManager as reinfmgr
+import bcore.classes.TrialManagers.GratingsTrialManagers as gtm
+import bcore.classes.TrialManagers.ExampleTrialManager as etm
+
+
+def make_subject(path=None):
+    subject = sj.VirtualSubject(subject_id='test_subject', response_policy=rp.LatencyResponder(latency=('Constant', 0.1), seed=1))
+    subject.reward = 50
+    subject.timeout = 100
+    if path is not None:
+        # session files go to path instead of the BCoreData directory
+        subject.get_session_schedule_path = lambda session_number, name: str(path / 'session_{0}.{1}.schedule.npz'.format(session_number, name))
+    return subject
+
+
+def make_reinforcement_manager():
+    reinforcement_manager = reinfmgr.ConstantReinforcement()
+    reinforcement_manager.reward_scalar = 1.
+    reinforcement_manager.request_reward_scalar = 0.
+    reinforcement_manager.penalty_scalar = 1.
+    reinforcement_manager.fraction_reward_sound_is_on = 1.
+    reinforcement_manager.fraction_penalty_sound_is_on = 1.
+    return reinforcement_manager
+
+
+def make_station(subject, **kwargs):
+    station = st.SimulatedStation(**kwargs)
+    station.subject = subject
+    station.initialize()
+    station.initialize_clocks()
+    station.num_session_trials = 0
+    return station
+
+
+def run_trial(trial_manager, station, subject, trial_number=1, session_number=1):
+    trial_record = {'trial_number': trial_number, 'session_number': session_number, 'trial_manager_name': trial_manager.name}
+    return trial_manager.do_trial(station=station, subject=subject, trial_record=trial_record, compiled_record=None, quit=False)
+
+
+@pytest.mark.parametrize('make_trial_manager', [
+    lambda reinforcement_manager: gtm.Gratings2AFC(reinforcement_manager=reinforcement_manager),
+    lambda reinforcement_manager: gtm.Gratings2AFC(durations={'left_port':[0.5],'right_port':[0.5]}, do_combos=False,
+                                                   phases={'left_port':[0.],'right_port':[0.]}, reinforcement_manager=reinforcement_manager),
+    lambda reinforcement_manager: etm.ExampleTrialManager(reinforcement_manager=reinforcement_manager),
+])
+def test_trial_runs_on_simulated_station(make_trial_manager):
+    subject = make_subject()
+    station = make_station(subject)
+    trial_manager = make_trial_manager(make_reinforcement_manager())
+    trial_record, quit = run_trial(trial_manager, station, subject)
+    assert not quit
+    assert not trial_record['errored_out']
+    phase_names = [phase_data['phase_name'] for phase_data in trial_record['phase_data']]
+    assert phase_names == ['pre-request', 'stim', 'reward', 'inter-trial']
+
+
+def test_gonogo_verifies_params():
+    gtm.GratingsGoNoGo(reinforcement_manager=make_reinforcement_manager())
+    with pytest.raises(AssertionError):
+        gtm.GratingsGoNoGo(durations={'G':[float('inf')],'N':[1.]})
+
+
+def run_go_only_session(cancel_after=None):
+    # chosen delays of a session of GratingsGoOnly with seeded delays. the
+    # prefetch made in trial cancel_after is cancelled as on a step change
+    subject = make_subject()
+    station = make_station(subject, ports=('response_port',))
+    trial_manager = gtm.GratingsGoOnly(delay_distribution=('Uniform', [0.1, 0.5]), delay_seed=1, durations=[0.5],
+                                       reinforcement_manager=make_reinforcement_manager())
+    trial_manager.prefetch = True
+    delays = []
+    for trial_number in range(1, 6):
+        trial_record, quit = run_trial(trial_manager, station, subject, trial_number=trial_number)
+        assert not trial_record['errored_out']
+        delays.append(trial_record['chosen_stim']['delay_frame_num'])
+        if trial_number == cancel_after:
+            trial_manager.cancel_prefetch()
+    return delays
+
+
+def test_cancelled_prefetch_keeps_seeded_session():
+    delays = run_go_only_session()
+    assert len(set(delays)) > 1
+    assert run_go_only_session(cancel_after=2) == delays
+
+
+def test_onset_rect_is_drawn_in_stimulus_phases_only():
+    # GoOnly's delay phase is a 'stimulus' phase that shows a blank screen
+    subject = make_subject()
+    station = make_station(subject, ports=('response_port',))
+    trial_manager = gtm.GratingsGoOnly(reinforcement_manager=make_reinforcement_manager())
+    trial_manager.draw_stim_onset_rect = True
+    trial_record, quit = run_trial(trial_manager, station, subject)
+    assert not trial_record['errored_out']
+    assert [phase.phase_name for phase in trial_manager._Phases if phase.marks_stim_onset] == ['delay-stim']
+
+
+@pytest.mark.parametrize('trial_manager_class, mask', [(gtm.Gratings_GaussianEdge, 'gauss'), (gtm.Gratings_HardEdge, 'circle')])
+def test_grating_edges_set_the_mask(trial_manager_class, mask):
+    subject = make_subject()
+    station = make_station(subject)
+    trial_manager = trial_manager_class('test_gratings', reinforcement_manager=make_reinforcement_manager())
+    trial_record, quit = run_trial(trial_manager, station, subject)
+    assert not trial_record['errored_out']
+    assert trial_manager._Phases[0].stimulus.mask == mask
+
+
+@pytest.mark.parametrize('make_trial_manager, ports', [
+    (lambda reinforcement_manager: gtm.Gratings2AFC(bank_stimuli=True, phases={'left_port':[0.],'right_port':[0.]}, reinforcement_manager=reinforcement_manager), None),
+    (lambda reinforcement_manager: gtm.GratingsGoOnly(bank_stimuli=True, durations=[0.5], reinforcement_manager=reinforcement_manager), ('response_port',)),
+])
+def test_banked_gratings_are_made_once(make_trial_manager, ports):
+    subject = make_subject()
+    station = make_station(subject, **({'ports': ports} if ports else {}))
+    trial_manager = make_trial_manager(make_reinforcement_manager())
+    gratings = []
+    for trial_number in range(1, 4):
+        trial_record, quit = run_trial(trial_manager, station, subject, trial_number=trial_number)
+        assert not trial_record['errored_out']
+        gratings.append(next(phase.stimulus for phase in trial_manager._Phases if phase.stimulus_details is not None))
+    # the whole grid is made on the first trial. later trials only look it up
+    assert len(station._stimulus_bank) == len(set(gtm.grating_grid(trial_manager)))
+    assert set(map(id, gratings)) <= set(map(id, station._stimulus_bank._stimuli.values()))
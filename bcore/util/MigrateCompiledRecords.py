@@ -0,0 +1,176 @@
+#! /usr/bin/python
+"""
+MIGRATECOMPILEDRECORDS converts the legacy compiled record pickles in
+BCoreData/SubjectData/CompiledTrialRecords into the columnar
+<subject_id>.compiled format. Both naming schemes are handled:
+    <subject_id>.1-0.compiled_records   written by BServerLocal
+    <subject_id>.1-N.compiled_record    written by Subject.save_compiled_records
+Subjects are converted in parallel. Every converted record is reloaded and
+checked against the pickle for row counts and LUT decoding.
+
+MigrateCompiledRecords
+     --path           CompiledTrialRecords folder. defaults to the one under get_base_path()
+     -n, --workers    number of worker processes. defaults to the number of CPUs
+     -f, --force      reconvert subjects that already have a .compiled record. it is
+                      replaced only by a record that was verified
+     --remove-legacy  remove the pickles of subjects that were verified
+"""
+import sys
+import os
+import pickle
+import shutil
+import concurrent.futures
+import numpy as np
+
+from bcore import get_base_path
+from bcore.classes.CompiledRecord import CompiledRecord, REGULAR_FIELDS, LUT_FIELDS
+
+__author__ = "Balaji Sriram"
+__version__ = "0.0.1"
+__copyright__ = "Copyright 2018"
+__license__ = "GPL"
+__maintainer__ = "Balaji Sriram"
+__email__ = "balajisriram@gmail.com"
+__status__ = "Production"
+
+LEGACY_EXTENSIONS = ('.compiled_record', '.compiled_records')
+
+
+def find_legacy_records(path):
+    """
+        dict of subject_id -> list of legacy pickles, latest trial first
+    """
+    legacy = {}
+    for f in os.listdir(path):
+        if not os.path.isfile(os.path.join(path, f)) or not f.endswith(LEGACY_EXTENSIONS):
+            continue
+        subject_id, _, trials = f.rpartition('.1-')
+        if not subject_id:
+            continue
+        try:
+            last_trial = int(trials.split('.')[0])
+        except ValueError:
+            continue
+        legacy.setdefault(subject_id, []).append((last_trial, os.path.join(path, f)))
+    return {sid: [f for t, f in sorted(files, reverse=True)] for sid, files in legacy.items()}
+
+
+def verify_compiled_record(legacy, compiled_path):
+    """
+        reloads the record at compiled_path and compares it with the legacy
+        dict. returns a list of problems
+    """
+    problems = []
+    cR = CompiledRecord().load_from_path(compiled_path)
+    num_trials = len(legacy['trial_number'])
+    if len(cR) != num_trials:
+        problems.append('%d rows instead of %d' % (len(cR), num_trials))
+        return problems
+
+    for field, dtype in REGULAR_FIELDS:
+        if field not in legacy:
+            continue
+        valid = cR.is_valid(field)
+        expected = np.asarray([v is not None for v in legacy[field]])
+        if not np.array_equal(valid, expected):
+            problems.append('validity of %s differs' % field)
+        elif not all(v == legacy[field][i] for i, v in zip(np.flatnonzero(valid), cR[field][valid])):
+            problems.append('values of %s differ' % field)
+
+    LUT = legacy.get('LUT', [])
+    for field in LUT_FIELDS:
+        if field not in legacy:
+            continue
+        expected = [LUT[code] if code is not None else None for code in legacy[field]]
+        if list(cR.decode(field)) != expected:
+            problems.append('LUT decoding of %s differs' % field)
+    return problems
+
+
+def replace_directory(src, dst):
+    """
+        moves the directory src to dst. An existing dst is moved aside first
+        and put back if src cannot be moved
+    """
+    if not os.path.exists(dst):
+        os.replace(src, dst)
+        return
+    old_path = dst+'.%d.old' % os.getpid()
+    os.replace(dst, old_path)
+    try:
+        os.replace(src, dst)
+    except Exception:
+        os.replace(old_path, dst)
+        raise
+    shutil.rmtree(old_path)
+
+
+def migrate_subject(subject_id, legacy_files, path, force=False, remove_legacy=False):
+    """
+        converts the latest legacy pickle for subject_id. runs in a worker
+        process. returns (subject_id, status, message)
+    """
+    compiled_path = os.path.join(path, '{0}.compiled'.format(subject_id))
+    if os.path.exists(compiled_path) and not force:
+        return subject_id, 'skipped', '%s exists' % compiled_path
+    # converted and verified in a temporary directory. an existing record is
+    # only replaced by one that was verified
+    temp_path = compiled_path+'.%d.tmp' % os.getpid()
+    if os.path.exists(temp_path):
+        shutil.rmtree(temp_path)
+    try:
+        with open(legacy_files[0], 'rb') as f:
+            legacy = pickle.load(f)
+        CompiledRecord(data=legacy).save_to_path(temp_path)
+        problems = verify_compiled_record(legacy, temp_path)
+    except Exception as e:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        return subject_id, 'failed', '%s: %r' % (os.path.basename(legacy_files[0]), e)
+    if problems:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        return subject_id, 'failed', '; '.join(problems)
+    replace_directory(temp_path, compiled_path)
+    if remove_legacy:
+        for f in legacy_files:
+            os.remove(f)
+    return subject_id, 'migrated', '%d trials from %s' % (len(legacy['trial_number']), os.path.basename(legacy_files[0]))
+
+
+def migrate_compiled_records(path=None, workers=None, force=False, remove_legacy=False):
+    if path is None:
+        path = os.path.join(get_base_path(), "BCoreData", "SubjectData", "CompiledTrialRecords")
+    legacy = find_legacy_records(path)
+    print('MIGRATECOMPILEDRECORDS:MIGRATE_COMPILED_RECORDS::Found %d subjects in %s' % (len(legacy), path))
+
+    results = {'migrated': [], 'skipped': [], 'failed': []}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(migrate_subject, sid, files, path, force, remove_legacy) for sid, files in legacy.items()]
+        for future in concurrent.futures.as_completed(futures):
+            subject_id, status, message = future.result()
+            results[status].append(subject_id)
+            print('%s :: %s :: %s' % (subject_id, status, message))
+
+    print('MIGRATECOMPILEDRECORDS:MIGRATE_COMPILED_RECORDS::migrated:%d, skipped:%d, failed:%d' %
+          (len(results['migrated']), len(results['skipped']), len(results['failed'])))
+    return results
+
+
+if __name__ == '__main__':
+    path = None
+    workers = None
+    force = False
+    remove_legacy = False
+
+    args = iter(sys.argv)
+    for arg in args:
+        if arg in ['--path']:
+            path = next(args)
+        elif arg in ['--workers','-n']:
+            workers = int(next(args))
+        elif arg in ['--force','-f']:
+            force = True
+        elif arg in ['--remove-legacy']:
+            remove_legacy = True
+
+    results = migrate_compiled_records(path=path, workers=workers, force=force, remove_legacy=remove_legacy)
+    sys.exit(1 if results['failed'] else 0)